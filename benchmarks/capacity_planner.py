@@ -0,0 +1,308 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Plan the gunicorn workers and their concurrency limit from a synthetic streaming load, and write the tuning file
+read by gunicorn.conf.py.
+
+The app waits on the upstream streams most of the time, so a few async workers serve as many streams as many
+workers, for less memory. For every worker count and per-worker concurrency limit (APP_MAX_CONCURRENT_REQUESTS,
+0 for none) of the sweep, the planner:
+  starts gunicorn with the uvicorn workers and a load app shaped like POST /chat, which streams the tokens of a
+  stub upstream (the first token after --ttfb-ms, then one every --token-interval-ms) as server-sent events;
+  runs --users closed-loop clients for --duration seconds after a warmup, the concurrent streams to serve;
+  reports the completed requests per second, the p50 and p99 latency and time to first byte, the rejected (503)
+  rate and the peak total proportional memory (PSS) of the master and the workers.
+The recommendation is, among the configurations meeting --p99-slo-ms and --max-error-rate, the one using the least
+memory within 5% of the best throughput. With --write-config it is written to the tuning file (see worker_tuning.py).
+The load runs in the planner process: run it on the machine, or the container size, of the deployment. Runs
+offline, on Linux.
+
+    python benchmarks/capacity_planner.py --workers 1 2 4 --concurrency 0 64 256 --users 128 --output capacity.json --write-config
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCH_DIR, "..", "src")))
+
+MIB = 2**20
+THROUGHPUT_TOLERANCE = 0.95
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def serve_upstream(port: int, ttfb_ms: float, tokens: int, token_interval_ms: float) -> None:
+    """Serve a chunked event stream of tokens to every request, like the model streaming a response."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            await asyncio.sleep(ttfb_ms / 1000)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+            for index in range(tokens):
+                if index:
+                    await asyncio.sleep(token_interval_ms / 1000)
+                chunk = f"token {index}\n".encode()
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+
+def create_load_app():
+    """The app run by gunicorn: POST /chat proxies the stream of the stub upstream like the chat route."""
+    import fastapi
+    import httpx
+    from fastapi.responses import StreamingResponse
+
+    from api.concurrency import add_concurrency_limit
+    from api.routes import serialize_sse_event
+
+    upstream_url = os.environ["CAPACITY_PLANNER_UPSTREAM_URL"]
+    app = fastapi.FastAPI()
+    add_concurrency_limit(app)
+    state = {}
+
+    def get_client() -> "httpx.AsyncClient":
+        # Created in the worker, on its event loop; the pool does not limit the concurrent streams.
+        if "client" not in state:
+            state["client"] = httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=None))
+        return state["client"]
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": "ok"}
+
+    @app.post("/chat")
+    async def chat(request: fastapi.Request):
+        message = (await request.json()).get("message", "")
+
+        async def stream():
+            async with get_client().stream("POST", upstream_url, json={"message": message}) as response:
+                async for line in response.aiter_lines():
+                    if line:
+                        yield serialize_sse_event({"content": line, "type": "message"})
+            yield serialize_sse_event({"type": "stream_end"})
+
+        return StreamingResponse(stream(), headers={"Content-Type": "text/event-stream"})
+
+    return app
+
+
+def get_process_tree_pss(pid: int) -> float:
+    """Get the total PSS, in MiB, of the gunicorn master and its workers."""
+    from worker_memory import read_memory_usage
+
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids = [pid] + [int(child) for child in f.read().split()]
+    except OSError:
+        pids = [pid]
+    return sum(usage["pss"] for usage in (read_memory_usage(str(p)) for p in pids) if usage) / MIB
+
+
+async def run_user(client, url: str, deadline: float, samples: list, counts: dict) -> None:
+    """A closed-loop client: sends the next request once the stream of the previous one ended."""
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with client.stream("POST", url, json={"message": "What is the capacity of a worker?"}) as response:
+                if response.status_code == 503:
+                    counts["rejected"] += 1
+                    await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+                    continue
+                ttfb = None
+                async for _ in response.aiter_raw():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                if response.status_code != 200:
+                    counts["errors"] += 1
+                    continue
+            samples.append((time.perf_counter() - start, ttfb or 0.0))
+        except Exception:
+            counts["errors"] += 1
+
+
+async def run_load(url: str, users: int, seconds: float, master_pid: int) -> dict:
+    import httpx
+
+    samples = []
+    counts = {"rejected": 0, "errors": 0}
+    peak_pss = [0.0]
+
+    async def sample_memory(deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            peak_pss[0] = max(peak_pss[0], get_process_tree_pss(master_pid))
+            await asyncio.sleep(1)
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = start + seconds
+        await asyncio.gather(sample_memory(deadline), *(run_user(client, url, deadline, samples, counts) for _ in range(users)))
+        elapsed = time.perf_counter() - start
+    return {"samples": samples, "counts": counts, "elapsed": elapsed, "peak_pss_mb": peak_pss[0]}
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def start_gunicorn(workers: int, concurrency: int, port: int, upstream_url: str) -> subprocess.Popen:
+    env = dict(os.environ, CAPACITY_PLANNER_UPSTREAM_URL=upstream_url, APP_MAX_CONCURRENT_REQUESTS=str(concurrency))
+    # Run in the benchmarks directory, so that gunicorn does not load the gunicorn.conf.py of the app.
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--chdir", BENCH_DIR, "-k", "uvicorn.workers.UvicornWorker",
+         "-w", str(workers), "-b", f"127.0.0.1:{port}", "--backlog", "4096", "--timeout", "120",
+         "--log-level", "warning", "capacity_planner:create_load_app()"],
+        cwd=BENCH_DIR, env=env)
+
+
+def wait_until_ready(url: str, timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"The load app did not start within {timeout} seconds.")
+
+
+def measure(workers: int, concurrency: int, upstream_url: str, args) -> dict:
+    port = get_free_port()
+    server = start_gunicorn(workers, concurrency, port, upstream_url)
+    try:
+        wait_until_ready(f"http://127.0.0.1:{port}/ping")
+        url = f"http://127.0.0.1:{port}/chat"
+        asyncio.run(run_load(url, args.users, args.warmup, server.pid))
+        load = asyncio.run(run_load(url, args.users, args.duration, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = [sample[0] * 1000 for sample in load["samples"]]
+    ttfbs = [sample[1] * 1000 for sample in load["samples"]]
+    attempts = len(latencies) + load["counts"]["rejected"] + load["counts"]["errors"]
+    return {
+        "workers": workers,
+        "max_concurrent_requests": concurrency,
+        "completed": len(latencies),
+        "throughput_rps": round(len(latencies) / load["elapsed"], 1),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else 0.0,
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "p99_ttfb_ms": round(percentile(ttfbs, 0.99), 1),
+        "error_rate": round((attempts - len(latencies)) / attempts, 4) if attempts else 1.0,
+        "total_pss_mb": round(load["peak_pss_mb"], 1),
+    }
+
+
+def recommend(results: list, p99_slo_ms: float, max_error_rate: float) -> dict:
+    """Among the configurations meeting the SLO, the one using the least memory within 5% of the best throughput."""
+    passing = [r for r in results if r["p99_ms"] <= p99_slo_ms and r["error_rate"] <= max_error_rate and r["completed"]]
+    if not passing:
+        return {}
+    best_throughput = max(r["throughput_rps"] for r in passing)
+    candidates = [r for r in passing if r["throughput_rps"] >= THROUGHPUT_TOLERANCE * best_throughput]
+    return min(candidates, key=lambda r: (r["total_pss_mb"], r["p99_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[0, 64, 256],
+                        help="The per-worker concurrency limits, 0 for none.")
+    parser.add_argument("--users", type=int, default=128, help="The concurrent streams of the load.")
+    parser.add_argument("--duration", type=float, default=20, help="The measured seconds of every configuration.")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--ttfb-ms", type=float, default=500, help="The time to the first token of the stub upstream.")
+    parser.add_argument("--tokens", type=int, default=50, help="The tokens streamed by the stub upstream.")
+    parser.add_argument("--token-interval-ms", type=float, default=20)
+    parser.add_argument("--p99-slo-ms", type=float, default=3000)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--write-config", nargs="?", const="", metavar="PATH",
+                        help="Write the recommendation to the tuning file, by default the one read by gunicorn.conf.py.")
+    parser.add_argument("--serve-upstream", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_upstream:
+        asyncio.run(serve_upstream(args.serve_upstream, args.ttfb_ms, args.tokens, args.token_interval_ms))
+        return
+
+    upstream_port = get_free_port()
+    upstream = subprocess.Popen([sys.executable, __file__, "--serve-upstream", str(upstream_port),
+                                 "--ttfb-ms", str(args.ttfb_ms), "--tokens", str(args.tokens),
+                                 "--token-interval-ms", str(args.token_interval_ms)])
+    upstream_url = f"http://127.0.0.1:{upstream_port}/"
+    results = []
+    try:
+        time.sleep(1)
+        for workers in args.workers:
+            for concurrency in args.concurrency:
+                result = measure(workers, concurrency, upstream_url, args)
+                results.append(result)
+                print(f"{workers} workers, {concurrency or 'unlimited'} concurrent: {result['throughput_rps']} req/s, "
+                      f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, p99 TTFB {result['p99_ttfb_ms']} ms, "
+                      f"errors {result['error_rate']:.2%}, total PSS {result['total_pss_mb']} MiB", flush=True)
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+    best = recommend(results, args.p99_slo_ms, args.max_error_rate)
+    if best:
+        print(f"Recommended: {best['workers']} workers, {best['max_concurrent_requests'] or 'unlimited'} concurrent "
+              f"requests per worker ({best['throughput_rps']} req/s, p99 {best['p99_ms']} ms, {best['total_pss_mb']} MiB)")
+    else:
+        print(f"No configuration met the p99 of {args.p99_slo_ms} ms and the error rate of {args.max_error_rate:.2%}.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "recommended": best}, f, indent=2)
+    if args.write_config is not None and best:
+        from worker_tuning import write_tuning
+
+        tuning = {
+            "workers": best["workers"],
+            "max_concurrent_requests": best["max_concurrent_requests"],
+            "cpu_count": multiprocessing.cpu_count(),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "load": {"users": args.users, "ttfb_ms": args.ttfb_ms, "tokens": args.tokens,
+                     "token_interval_ms": args.token_interval_ms},
+            "slo": {"p99_ms": args.p99_slo_ms, "max_error_rate": args.max_error_rate},
+            "measured": {key: best[key] for key in ("throughput_rps", "p50_ms", "p99_ms", "error_rate", "total_pss_mb")},
+        }
+        print(f"Wrote the tuning to {write_tuning(tuning, args.write_config or None)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Compare the load time and the memory of the embeddings CSV file and of the binary embedding store.
+
+The sample corpus of src/api/data/embeddings.csv is replicated --replicate times into a temporary CSV file,
+which is converted to float32 and float16 stores. Every format is loaded in a fresh process, which reports
+the time until the vectors are usable as a matrix and its resident memory, split into the anonymous pages,
+private to the process, and the file-backed pages of the page cache, shared by all the processes mapping
+the store. Runs offline.
+
+    python benchmarks/embedding_store_load.py --replicate 100 --output load.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import numpy as np
+
+from api.embedding_store import DEFAULT_EMBEDDINGS_FILE, EmbeddingStore, convert_embeddings_csv, iter_embeddings_csv
+
+
+def read_memory() -> dict:
+    """Read the resident memory of this process in MB from /proc (Linux)."""
+    memory = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    memory[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        memory["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return memory
+
+
+def measure(kind: str, path: str) -> dict:
+    """Load the corpus, compute the norms of all vectors, and report the time and the memory growth."""
+    before = read_memory()
+    start = time.perf_counter()
+    if kind == "csv":
+        rows = list(iter_embeddings_csv(path))
+        vectors = np.asarray([row.embedding for row in rows], dtype=np.float32)
+        chunks = len(rows)
+    else:
+        store = EmbeddingStore(path)
+        vectors = store.vectors
+        chunks = len(store)
+    loaded = time.perf_counter() - start
+    # Touch every vector, so the pages of the store are actually read.
+    norms = np.linalg.norm(vectors, axis=1)
+    touched = time.perf_counter() - start
+    after = read_memory()
+    return {
+        "format": kind,
+        "chunks": chunks,
+        "checksum": float(norms.sum()),
+        "load_seconds": round(loaded, 4),
+        "load_and_touch_seconds": round(touched, 4),
+        **{f"{key}_mb": round(after[key] - before.get(key, 0), 1) for key in after},
+    }
+
+
+def replicate_csv(source: str, target: str, times: int) -> None:
+    csv.field_size_limit(sys.maxsize)
+    with open(source, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    with open(target, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["token", "embedding", "title"])
+        writer.writeheader()
+        for i in range(times):
+            for row in rows:
+                writer.writerow({**row, "title": f"{i}-{row['title']}" if i else row["title"]})
+
+
+def run_isolated(kind: str, path: str) -> dict:
+    output = subprocess.check_output([sys.executable, __file__, "--measure", kind, path], text=True)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", default=DEFAULT_EMBEDDINGS_FILE)
+    parser.add_argument("--replicate", type=int, default=20, help="How many times the sample corpus is repeated.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--measure", nargs=2, metavar=("FORMAT", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "embeddings.csv")
+        replicate_csv(args.embeddings, csv_path, max(1, args.replicate))
+        results.append({**run_isolated("csv", csv_path), "size_mb": round(os.path.getsize(csv_path) / 2**20, 1)})
+        for dtype in ("float32", "float16"):
+            store_path = os.path.join(tmp, f"store-{dtype}")
+            start = time.perf_counter()
+            convert_embeddings_csv(csv_path, store_path, dtype).close()
+            conversion = time.perf_counter() - start
+            size = sum(os.path.getsize(os.path.join(store_path, name)) for name in os.listdir(store_path))
+            result = run_isolated("store", store_path)
+            result.update(format=f"store-{dtype}", size_mb=round(size / 2**20, 1), convert_seconds=round(conversion, 3))
+            results.append(result)
+
+    for result in results:
+        memory = ", ".join(f"{key[:-3]} {value} MB" for key, value in result.items() if key.startswith(("VmRSS", "Rss")))
+        print(f"{result['format']:>15}: {result['chunks']} chunks, {result['size_mb']} MB on disk, "
+              f"load {result['load_seconds'] * 1000:.1f} ms, load+touch {result['load_and_touch_seconds'] * 1000:.1f} ms, "
+              f"{memory}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
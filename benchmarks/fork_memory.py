@@ -0,0 +1,130 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure the memory of forked workers with and without the fork preparation of worker_memory.prepare_for_fork.
+
+Like gunicorn with preload_app, a master process creates the app with api.main.create_app and forks the workers.
+Modes:
+  none    the workers import the lazily imported modules themselves, like on their first request;
+  warm    the master imports them and compiles the templates before the fork;
+  freeze  the master also freezes its objects (gc.freeze), like the when_ready hook of gunicorn.conf.py.
+Every worker then runs garbage collections over a burst of allocations, like the requests do, which write to the
+objects they traverse. When all the workers are done, their memory is read from /proc/<pid>/smaps_rollup.
+Reported per mode and worker count: the total proportional memory (PSS) of the master and the workers, which is
+the memory they use together, and the mean private and shared memory of a worker. Runs offline, on Linux.
+
+    python benchmarks/fork_memory.py --workers 1 2 4 8 --output fork_memory.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+MODES = ("none", "warm", "freeze")
+MIB = 2**20
+
+
+def run_requests(allocations: int) -> None:
+    """Allocate and drop objects with reference cycles, so that the collector runs, then collect fully."""
+    for _ in range(allocations // 1000):
+        batch = []
+        for index in range(1000):
+            node = {"index": index, "payload": [index] * 4}
+            node["self"] = node
+            batch.append(node)
+        del batch
+    gc.collect()
+
+
+def fork_worker(mode: str, allocations: int, exit_pipe: tuple) -> tuple:
+    """Fork a worker, which runs the requests, signals that it is ready and waits for the exit pipe to close."""
+    ready_read, ready_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_read)
+        os.close(exit_pipe[1])
+        from worker_memory import get_preload_modules, import_modules, warm_templates
+        if mode == "none":
+            import_modules(get_preload_modules())
+            warm_templates()
+        run_requests(allocations)
+        os.write(ready_write, b"1")
+        os.read(exit_pipe[0], 1)
+        os._exit(0)
+    os.close(ready_write)
+    return pid, ready_read
+
+
+def measure(mode: str, workers: int, allocations: int) -> dict:
+    from api.main import create_app
+    from worker_memory import get_preload_modules, import_modules, prepare_for_fork, read_memory_usage, warm_templates
+
+    create_app()
+    if mode == "freeze":
+        prepare_for_fork()
+    elif mode == "warm":
+        import_modules(get_preload_modules())
+        warm_templates()
+        gc.collect()
+
+    # The workers exit when the master closes the write end of the shared pipe, once their memory is read.
+    exit_pipe = os.pipe()
+    children = [fork_worker(mode, allocations, exit_pipe) for _ in range(workers)]
+    for _, ready_read in children:
+        os.read(ready_read, 1)
+        os.close(ready_read)
+    master = read_memory_usage()
+    usages = [read_memory_usage(str(pid)) for pid, _ in children]
+    os.close(exit_pipe[1])
+    for pid, _ in children:
+        os.waitpid(pid, 0)
+    return {
+        "mode": mode,
+        "workers": workers,
+        "master_rss_mb": round(master["rss"] / MIB, 1),
+        "total_pss_mb": round((master["pss"] + sum(usage["pss"] for usage in usages)) / MIB, 1),
+        "worker_private_mb": round(sum(usage["private"] for usage in usages) / workers / MIB, 1),
+        "worker_shared_mb": round(sum(usage["shared"] for usage in usages) / workers / MIB, 1),
+    }
+
+
+def run_isolated(mode: str, workers: int, allocations: int) -> dict:
+    output = subprocess.check_output([sys.executable, __file__, "--allocations", str(allocations),
+                                      "--measure", mode, str(workers)], text=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--allocations", type=int, default=200000, help="The objects allocated by every worker.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure[0], int(args.measure[1]), args.allocations)))
+        return
+
+    results = []
+    for workers in args.workers:
+        for mode in args.modes:
+            result = run_isolated(mode, workers, args.allocations)
+            results.append(result)
+            print(f"{mode:>6}, {workers} workers: total PSS {result['total_pss_mb']} MiB, per worker private "
+                  f"{result['worker_private_mb']} MiB and shared {result['worker_shared_mb']} MiB, master RSS {result['master_rss_mb']} MiB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Compare the index size and the vector query latency of the vector compression options.
+
+For every option an index is created, filled with the sample chunks from src/api/data/embeddings.csv
+and queried with the embeddings of the chunks. Requires AZURE_AI_SEARCH_ENDPOINT and the
+AZURE_AI_EMBED_* variables of the deployment; the indexes are deleted afterwards unless --keep is set.
+
+    python benchmarks/index_compression.py --queries 200 --output compression.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from dataclasses import asdict, replace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from azure.identity.aio import DefaultAzureCredential
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from azure.search.documents.models import VectorizedQuery
+
+from api.embedding_store import iter_embeddings
+from api.indexer_monitor import get_statistic
+from api.search_index_manager import SearchIndexManager, VectorIndexOptions
+
+EMBEDDINGS_FILE = os.path.join(os.path.dirname(__file__), "..", "src", "api", "data", "embeddings.csv")
+
+OPTIONS = {
+    "baseline": VectorIndexOptions(),
+    "half": VectorIndexOptions(vector_type="half"),
+    "not-stored": VectorIndexOptions(stored=False),
+    "scalar": VectorIndexOptions(compression="scalar"),
+    "scalar-no-rescore": VectorIndexOptions(compression="scalar", rescoring=False),
+    "binary": VectorIndexOptions(compression="binary", oversampling=10.0),
+    "binary-half-not-stored": VectorIndexOptions(compression="binary", oversampling=10.0, vector_type="half", stored=False),
+}
+
+
+def read_chunks(path: str):
+    for i, embedded in enumerate(iter_embeddings(path)):
+        yield {
+            "chunk_id": f"chunk-{i}",
+            "parent_id": embedded.title,
+            "chunk": embedded.chunk,
+            "title": embedded.title,
+            "text_vector": embedded.embedding,
+        }
+
+
+async def bench_option(name, options, chunks, args, credential):
+    index_name = f"{args.prefix}-{name}"
+    mgr = SearchIndexManager(
+        endpoint=args.endpoint, credential=credential, index_name=index_name,
+        dimensions=len(chunks[0]["text_vector"]), model=args.model, deployment_name=args.deployment,
+        embedding_endpoint=args.embedding_endpoint, embed_api_key=None, vector_options=options)
+    await mgr.create_index_maybe()
+    try:
+        async with SearchClient(endpoint=args.endpoint, index_name=index_name, credential=credential) as client:
+            for start in range(0, len(chunks), 100):
+                await client.upload_documents(documents=chunks[start:start + 100])
+            # Wait until the documents are visible in the statistics.
+            async with SearchIndexClient(endpoint=args.endpoint, credential=credential) as ix_client:
+                for _ in range(60):
+                    stats = await ix_client.get_index_statistics(index_name)
+                    if get_statistic(stats, "document_count") >= len(chunks):
+                        break
+                    await asyncio.sleep(5)
+
+            latencies = []
+            for chunk in chunks[:args.queries]:
+                query = VectorizedQuery(vector=chunk["text_vector"], k_nearest_neighbors=args.top, fields="text_vector")
+                start = time.perf_counter()
+                results = await client.search(search_text=None, vector_queries=[query], select=["chunk_id"], top=args.top)
+                _ = [doc async for doc in results]
+                latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return {
+            "option": name,
+            "settings": asdict(options),
+            "documents": get_statistic(stats, "document_count"),
+            "storage_size_bytes": get_statistic(stats, "storage_size"),
+            "vector_index_size_bytes": get_statistic(stats, "vector_index_size"),
+            "query_p50_ms": statistics.median(latencies),
+            "query_p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        }
+    finally:
+        if not args.keep:
+            async with SearchIndexClient(endpoint=args.endpoint, credential=credential) as ix_client:
+                await ix_client.delete_index(index_name)
+
+
+async def main(args):
+    chunks = list(read_chunks(args.embeddings))
+    results = []
+    async with DefaultAzureCredential() as credential:
+        for name in args.options:
+            options = replace(OPTIONS[name], hnsw_ef_search=args.ef_search) if args.ef_search else OPTIONS[name]
+            result = await bench_option(name, options, chunks, args, credential)
+            results.append(result)
+            print(f"{name:24} vector index {result['vector_index_size_bytes'] / 1024:10.1f} KiB  "
+                  f"storage {result['storage_size_bytes'] / 1024:10.1f} KiB  "
+                  f"p50 {result['query_p50_ms']:7.1f} ms  p99 {result['query_p99_ms']:7.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", default=os.getenv("AZURE_AI_SEARCH_ENDPOINT"))
+    parser.add_argument("--embedding-endpoint", default=os.getenv("AZURE_OPENAI_ENDPOINT", ""))
+    parser.add_argument("--deployment", default=os.getenv("AZURE_AI_EMBED_DEPLOYMENT_NAME", "text-embedding-3-small"))
+    parser.add_argument("--model", default=os.getenv("AZURE_AI_EMBED_MODEL_NAME", "text-embedding-3-small"))
+    parser.add_argument("--embeddings", default=EMBEDDINGS_FILE)
+    parser.add_argument("--prefix", default="bench-compression")
+    parser.add_argument("--options", nargs="+", choices=sorted(OPTIONS), default=list(OPTIONS))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--keep", action="store_true", help="Do not delete the benchmark indexes.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    asyncio.run(main(parser.parse_args()))
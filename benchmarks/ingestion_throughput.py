@@ -0,0 +1,88 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure the throughput and the memory of the process-pool document ingestion.
+
+The documents of src/files are linked --copies times into a temporary corpus, which is parsed and chunked
+with api.ingestion for every number of worker processes (0 parses in the consuming process). Every run is
+done in a fresh process, which reports the pages/sec and chunks/sec and the peak resident memory of the
+consumer and of the largest worker; the memory stays flat when the corpus grows. The PDF documents need pypdf.
+Runs offline.
+
+    python benchmarks/ingestion_throughput.py --copies 10 40 --workers 0 1 2 4 --output ingestion.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from api.chunking import iter_document_paths
+from api.ingestion import IngestionReport, ingest_directory
+
+DEFAULT_DOCUMENTS = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "files"))
+
+
+def measure(directory: str, workers: int) -> dict:
+    report = IngestionReport()
+    for _ in ingest_directory(directory, max_workers=workers, report=report):
+        pass
+    result = report.to_dict()
+    del result["failures"]
+    result["seconds"] = round(report.seconds, 3)
+    result["consumer_peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    result["worker_peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    return result
+
+
+def build_corpus(source: str, target: str, copies: int) -> None:
+    for copy in range(copies):
+        directory = os.path.join(target, f"copy-{copy}")
+        os.makedirs(directory)
+        for path in iter_document_paths(source):
+            os.symlink(path, os.path.join(directory, os.path.basename(path)))
+
+
+def run_isolated(directory: str, workers: int) -> dict:
+    output = subprocess.check_output([sys.executable, __file__, "--measure", directory, str(workers)], text=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default=DEFAULT_DOCUMENTS)
+    parser.add_argument("--copies", type=int, nargs="+", default=[10, 40], help="The sizes of the corpus in copies of the documents.")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({0, 1, os.cpu_count() or 1}))
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--measure", nargs=2, metavar=("DIRECTORY", "WORKERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure[0], int(args.measure[1]))))
+        return
+
+    results = []
+    for copies in args.copies:
+        with tempfile.TemporaryDirectory() as tmp:
+            build_corpus(os.path.abspath(args.documents), tmp, copies)
+            for workers in args.workers:
+                result = {"copies": copies, **run_isolated(tmp, workers)}
+                results.append(result)
+                print(f"{result['documents']:>6} documents, {result['workers']} worker(s): {result['pages']} pages, "
+                      f"{result['chunks']} chunks in {result['seconds']}s = {result['pages_per_second']} pages/s, "
+                      f"{result['chunks_per_second']} chunks/s; peak RSS consumer {result['consumer_peak_rss_mb']} MB, "
+                      f"worker {result['worker_peak_rss_mb']} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure the latency and the memory of the local BM25 index and of the hybrid (vector + BM25) search.
+
+A synthetic corpus is generated from the vocabulary of src/api/data/embeddings.csv: the chunks have the
+lengths of the sample chunks and their words are drawn with the frequencies of the sample, the vectors are
+random unit vectors. For every size the build time, the memory of the index (its arrays, and all the memory
+it retains including the vocabulary, traced with tracemalloc) and the p50/p99 latency of the keyword, vector
+and hybrid queries are reported, with the memory also per 100k chunks. Runs offline.
+
+    python benchmarks/local_hybrid_search.py --sizes 100000 300000 --output hybrid.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import numpy as np
+
+from api.embedding_store import DEFAULT_EMBEDDINGS_FILE, iter_embeddings_csv
+from api.local_bm25 import tokenize
+from api.local_retriever import LocalRetriever
+
+
+def synthetic_corpus(rng: np.random.Generator, size: int, path: str):
+    """Generate the chunks with the lengths and the word frequencies of the sample corpus."""
+    sample = [tokenize(chunk.chunk) for chunk in iter_embeddings_csv(path)]
+    counts = Counter(token for tokens in sample for token in tokens)
+    words = np.array(list(counts))
+    probabilities = np.array(list(counts.values()), dtype=np.float64)
+    probabilities /= probabilities.sum()
+    lengths = rng.choice([len(tokens) for tokens in sample], size=size)
+    tokens = rng.choice(words, size=int(lengths.sum()), p=probabilities)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    return [" ".join(tokens[offsets[i]:offsets[i + 1]]) for i in range(size)], words, probabilities
+
+
+def latencies_ms(function, queries) -> list:
+    result = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query)
+        result.append((time.perf_counter() - start) * 1000)
+    return result
+
+
+def summary(values: list) -> dict:
+    return {"p50_ms": round(statistics.median(values), 3), "p99_ms": round(float(np.percentile(values, 99)), 3)}
+
+
+def measure(size: int, args, rng: np.random.Generator) -> dict:
+    chunks, words, probabilities = synthetic_corpus(rng, size, args.embeddings)
+    vectors = rng.standard_normal((size, args.dimensions), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    retriever = LocalRetriever(vectors, chunks.__getitem__, str)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = retriever.build_keyword_index()
+    build_seconds = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained_mb = retained / 2**20
+
+    texts = [" ".join(rng.choice(words, size=args.query_terms, p=probabilities)) for _ in range(args.queries)]
+    query_vectors = rng.standard_normal((args.queries, args.dimensions), dtype=np.float32)
+    keyword = latencies_ms(lambda text: index.search(text, args.top), texts)
+    vector = latencies_ms(lambda query: retriever.search_indices(query, args.top), query_vectors)
+    hybrid = latencies_ms(lambda i: retriever.search_hybrid(texts[i], query_vectors[i], args.top), range(args.queries))
+
+    per_100k = 100_000 / size
+    return {
+        "chunks": size,
+        "vocabulary": index.vocabulary_size,
+        "postings": index.postings_count,
+        "build_seconds": round(build_seconds, 2),
+        "index_array_mb": round(index.array_bytes / 2**20, 1),
+        "index_retained_mb": round(retained_mb, 1),
+        "build_peak_mb": round(peak / 2**20, 1),
+        "index_array_mb_per_100k": round(index.array_bytes / 2**20 * per_100k, 1),
+        "index_retained_mb_per_100k": round(retained_mb * per_100k, 1),
+        "keyword": summary(keyword),
+        "vector": summary(vector),
+        "hybrid": summary(hybrid),
+    }
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for size in args.sizes:
+        result = measure(size, args, rng)
+        results.append(result)
+        print(f"{result['chunks']:>8} chunks: build {result['build_seconds']}s, "
+              f"{result['index_array_mb_per_100k']} MB arrays / {result['index_retained_mb_per_100k']} MB with vocabulary per 100k; "
+              f"keyword p50 {result['keyword']['p50_ms']} ms p99 {result['keyword']['p99_ms']} ms, "
+              f"vector p50 {result['vector']['p50_ms']} ms, "
+              f"hybrid p50 {result['hybrid']['p50_ms']} ms p99 {result['hybrid']['p99_ms']} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", default=DEFAULT_EMBEDDINGS_FILE)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--dimensions", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-terms", type=int, default=4)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure the query latency of the local NumPy retriever on synthetic corpora.
+
+For every corpus size, random unit vectors are generated and queried one by one and in batches;
+the p50 and p99 latency of a single query and the throughput of the batches are reported.
+The matrix takes sizes x dimensions x 4 bytes, so 1M vectors of 1536 dimensions need about 6 GB. Runs offline.
+
+    python benchmarks/local_retriever_latency.py --sizes 1000 100000 1000000 --dimensions 100 --output latency.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import numpy as np
+
+from api.local_retriever import LocalRetriever
+
+
+def random_unit_vectors(rng: np.random.Generator, count: int, dimensions: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, dimensions), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def percentile(values, q: float) -> float:
+    return float(np.percentile(values, q))
+
+
+def measure(size: int, args, rng: np.random.Generator) -> dict:
+    vectors = random_unit_vectors(rng, size, args.dimensions)
+    start = time.perf_counter()
+    retriever = LocalRetriever(vectors, str, str)
+    load = time.perf_counter() - start
+    queries = random_unit_vectors(rng, args.queries, args.dimensions)
+
+    retriever.search_indices(queries[:1], args.top)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.search_indices(query, args.top)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), args.batch):
+        retriever.search_indices(queries[offset:offset + args.batch], args.top)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "vectors": size,
+        "dimensions": args.dimensions,
+        "matrix_mb": round(vectors.nbytes / 2**20, 1),
+        "load_seconds": round(load, 3),
+        "query_p50_ms": round(statistics.median(latencies), 3),
+        "query_p99_ms": round(percentile(latencies, 99), 3),
+        "batch_size": args.batch,
+        "batch_queries_per_second": round(len(queries) / batch_seconds, 1),
+    }
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for size in args.sizes:
+        result = measure(size, args, rng)
+        results.append(result)
+        print(f"{result['vectors']:>9} x {result['dimensions']} ({result['matrix_mb']} MB): "
+              f"p50 {result['query_p50_ms']:.2f} ms  p99 {result['query_p99_ms']:.2f} ms  "
+              f"batch of {result['batch_size']}: {result['batch_queries_per_second']:.0f} queries/s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dimensions", type=int, default=100, help="The dimensions of the vectors (100 in the sample corpus).")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    main(parser.parse_args())
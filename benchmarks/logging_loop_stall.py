@@ -0,0 +1,146 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure how long a logging flood stalls the event loop with blocking handlers and with the queued logging.
+
+Concurrent coroutines log a line per simulated stream delta, like the chat route, while a heartbeat task
+measures how late the event loop wakes it up. The "direct" mode attaches a StreamHandler and a FileHandler
+to the logger, as configure_logging did before; the "queued" mode uses logging_config.configure_logging,
+which writes the records on a listener thread. The stream writes to a sink, which can simulate a slow stdout
+pipe with --sink-latency-ms. Reported per mode and sink latency: the time spent in the logging calls on the
+loop, the p50/p99/max heartbeat lag and the duration of the flood. Runs offline.
+
+    python benchmarks/logging_loop_stall.py --streams 20 --deltas 500 --sink-latency-ms 0 0.05 --output logging.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import numpy as np
+
+from logging_config import LOG_FORMAT, configure_logging, stop_logging
+
+LOGGER_NAME = "azureaiapp.benchmark"
+
+
+class Sink:
+    """A stdout replacement, which discards the lines after waiting the latency of a slow pipe."""
+
+    def __init__(self, latency_seconds: float) -> None:
+        self._latency = latency_seconds
+
+    def write(self, text: str) -> int:
+        if self._latency:
+            time.sleep(self._latency)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def configure(mode: str, log_file: str, sink: Sink) -> logging.Logger:
+    logger = logging.getLogger(LOGGER_NAME)
+    if mode == "direct":
+        for handler in (logging.StreamHandler(sink), logging.FileHandler(log_file)):
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        return logger
+    stdout = sys.stdout
+    sys.stdout = sink
+    try:
+        return configure_logging(log_file, logger_name=LOGGER_NAME)
+    finally:
+        sys.stdout = stdout
+
+
+def unconfigure(mode: str, logger: logging.Logger) -> None:
+    if mode == "direct":
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+    else:
+        stop_logging()
+
+
+async def heartbeat(interval: float, lags: list, done: asyncio.Event) -> None:
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def stream(logger: logging.Logger, deltas: int, logging_seconds: list) -> None:
+    for index in range(deltas):
+        start = time.perf_counter()
+        logger.info(f"Delta: token {index} of the streamed response")
+        logging_seconds.append(time.perf_counter() - start)
+        await asyncio.sleep(0)
+
+
+async def flood(logger: logging.Logger, args) -> dict:
+    lags, logging_seconds = [], []
+    done = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(args.interval_ms / 1000, lags, done))
+    await asyncio.sleep(args.interval_ms / 1000 * 2)
+    start = time.perf_counter()
+    await asyncio.gather(*(stream(logger, args.deltas, logging_seconds) for _ in range(args.streams)))
+    duration = time.perf_counter() - start
+    done.set()
+    await beat
+    return {
+        "records": len(logging_seconds),
+        "flood_seconds": round(duration, 3),
+        "logging_on_loop_seconds": round(sum(logging_seconds), 3),
+        "logging_call_p99_us": round(float(np.percentile(logging_seconds, 99)) * 1e6, 1),
+        "lag_p50_ms": round(statistics.median(lags), 3),
+        "lag_p99_ms": round(float(np.percentile(lags, 99)), 3),
+        "lag_max_ms": round(max(lags), 3),
+    }
+
+
+def measure(mode: str, latency_ms: float, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = configure(mode, os.path.join(tmp, "app.log"), Sink(latency_ms / 1000))
+        try:
+            result = asyncio.run(flood(logger, args))
+        finally:
+            start = time.perf_counter()
+            unconfigure(mode, logger)
+            drain = time.perf_counter() - start
+    return {"mode": mode, "sink_latency_ms": latency_ms, **result, "drain_seconds": round(drain, 3)}
+
+
+def main(args):
+    results = []
+    for latency_ms in args.sink_latency_ms:
+        for mode in ("direct", "queued"):
+            result = measure(mode, latency_ms, args)
+            results.append(result)
+            print(f"{mode:>6}, sink {latency_ms} ms/line: {result['records']} records, flood {result['flood_seconds']}s, "
+                  f"logging on the loop {result['logging_on_loop_seconds']}s, heartbeat lag p50 {result['lag_p50_ms']} ms "
+                  f"p99 {result['lag_p99_ms']} ms max {result['lag_max_ms']} ms, drain {result['drain_seconds']}s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20, help="The number of concurrent streamed responses.")
+    parser.add_argument("--deltas", type=int, default=500, help="The number of logged deltas per stream.")
+    parser.add_argument("--sink-latency-ms", type=float, nargs="+", default=[0.0, 0.05])
+    parser.add_argument("--interval-ms", type=float, default=1.0, help="The interval of the heartbeat.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    main(parser.parse_args())
@@ -0,0 +1,226 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure the retrieval quality and the query latency of the chunking and embedding options on the sample documents.
+
+The documents of src/files are split like the split skill of create_skillset_maybe for every page length and
+overlap of the grid, the chunks are embedded for every dimension of the grid and the labeled questions of
+benchmarks/data/retrieval_eval.json (the sample prompts of docs/sample_questions.md and lookups of the single
+products) are run through the local retriever with every query type. For every configuration the recall@k
+(the share of the relevant documents with a chunk in the top k), the MRR of the first relevant chunk, the size
+of the index and the p50/p99 latency of the retriever (without embedding the question) are reported.
+
+The default "hashing" embedder is a deterministic bag of words stub, which runs offline and gives a baseline
+of the chunking; the "azure" embedder uses the AZURE_AI_EMBED_DEPLOYMENT_NAME deployment at AZURE_OPENAI_ENDPOINT
+and caches the embeddings in APP_CACHE_DIR, so a configuration is embedded only once. The PDF documents need pypdf.
+
+    python benchmarks/retrieval_quality.py --page-lengths 500 1000 2000 --overlaps 0 250 500 --output quality.json
+    python benchmarks/retrieval_quality.py --embedder azure --dimensions 256 1536 --output quality.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import zlib
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import numpy as np
+
+from api.chunking import SUPPORTED_EXTENSIONS, read_document, split_pages
+from api.local_bm25 import tokenize
+from api.local_retriever import LocalRetriever
+
+DEFAULT_DOCUMENTS = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "files"))
+DEFAULT_EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "retrieval_eval.json")
+# The query types of api.local_search, which is not imported to run without the web dependencies.
+QUERY_TYPES = ("simple", "vector", "vector_simple_hybrid")
+
+
+def load_documents(directory: str) -> dict:
+    documents = {}
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+            try:
+                documents[name] = read_document(os.path.join(directory, name))
+            except Exception as e:
+                print(f"Skipping {name}: {e}")
+    return documents
+
+
+def load_questions(path: str, titles) -> list:
+    """Load the labeled questions, keeping only the relevant documents, which were read."""
+    with open(path) as f:
+        questions = json.load(f)["questions"]
+    result = []
+    for question in questions:
+        relevant = [title for title in question["relevant"] if title in titles]
+        if relevant:
+            result.append({"question": question["question"], "relevant": set(relevant)})
+    if len(result) < len(questions):
+        print(f"Skipping {len(questions) - len(result)} question(s) without a relevant document.")
+    return result
+
+
+def hashing_embed(texts: list, dimensions: int) -> np.ndarray:
+    """Embed the texts as signed feature hashes of their words and word pairs with log-scaled counts."""
+    vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        features = Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+        for feature, count in features.items():
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vectors[row, digest % dimensions] += sign * (1 + np.log(count))
+    return vectors
+
+
+async def azure_embed(texts: list, dimensions: int, args) -> np.ndarray:
+    from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+    from openai import AsyncAzureOpenAI
+
+    from api.embedding_builder import EmbeddingBuilder, EmbeddingCache
+    from util import get_cache_dir
+
+    cache = EmbeddingCache(os.path.join(get_cache_dir(), "embedding_cache.sqlite"))
+    try:
+        async with DefaultAzureCredential() as credential:
+            client = AsyncAzureOpenAI(
+                api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+                azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+                azure_ad_token_provider=get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default"),
+            )
+            async with client:
+                builder = EmbeddingBuilder(client, args.deployment, dimensions, cache)
+                chunks, report = await builder.build(("", text) for text in texts)
+    finally:
+        cache.close()
+    print(f"Embedded {report.chunks} text(s), {report.cache_hit_ratio:.0%} from the cache.")
+    return np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
+
+
+def embed(texts: list, dimensions: int, args) -> np.ndarray:
+    if args.embedder == "azure":
+        return asyncio.run(azure_embed(texts, dimensions, args))
+    return hashing_embed(texts, dimensions)
+
+
+def percentiles(latencies: list) -> dict:
+    return {"p50_ms": round(statistics.median(latencies), 3), "p99_ms": round(float(np.percentile(latencies, 99)), 3)}
+
+
+def evaluate(retriever: LocalRetriever, titles: list, questions: list, vectors, query_type: str, args) -> dict:
+    depth = max(args.k)
+    if query_type == "simple":
+        search = lambda i: retriever.search_keyword(questions[i]["question"], depth)
+    elif query_type == "vector":
+        search = lambda i: retriever.search(vectors[i], depth)
+    else:
+        search = lambda i: retriever.search_hybrid(questions[i]["question"], vectors[i], depth)
+
+    recalls = {k: [] for k in args.k}
+    reciprocal_ranks = []
+    latencies = []
+    for i, question in enumerate(questions):
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            results = search(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+        ranked = [titles[result.index] for result in results]
+        for k in args.k:
+            recalls[k].append(len(question["relevant"].intersection(ranked[:k])) / len(question["relevant"]))
+        rank = next((rank for rank, title in enumerate(ranked, start=1) if title in question["relevant"]), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    return {
+        **{f"recall@{k}": round(statistics.mean(values), 4) for k, values in recalls.items()},
+        f"mrr@{depth}": round(statistics.mean(reciprocal_ranks), 4),
+        "query": percentiles(latencies),
+    }
+
+
+def measure_chunking(documents: dict, questions: list, page_length: int, overlap: int, args) -> list:
+    titles, chunks = [], []
+    for title, text in documents.items():
+        for page in split_pages(text, page_length, overlap):
+            titles.append(title)
+            chunks.append(page)
+    configuration = {
+        "max_page_length": page_length,
+        "page_overlap_length": overlap,
+        "chunks": len(chunks),
+        "chunk_text_mb": round(sum(len(chunk.encode("utf-8")) for chunk in chunks) / 2**20, 3),
+    }
+
+    results = []
+    # The keyword search does not depend on the dimensions, so it is measured once per chunking.
+    for position, dimensions in enumerate(args.dimensions):
+        vectors = embed(chunks, dimensions, args)
+        question_vectors = embed([question["question"] for question in questions], dimensions, args)
+        retriever = LocalRetriever(vectors, chunks.__getitem__, titles.__getitem__)
+        keyword_mb = round(retriever.build_keyword_index().array_bytes / 2**20, 3)
+        for query_type in args.query_types:
+            if query_type == "simple" and position > 0:
+                continue
+            result = {
+                **configuration,
+                "dimensions": None if query_type == "simple" else dimensions,
+                "query_type": query_type,
+                "vector_mb": 0.0 if query_type == "simple" else round(len(chunks) * dimensions * 4 / 2**20, 3),
+                "keyword_index_mb": 0.0 if query_type == "vector" else keyword_mb,
+            }
+            result.update(evaluate(retriever, titles, questions, question_vectors, query_type, args))
+            results.append(result)
+    return results
+
+
+def main(args):
+    documents = load_documents(args.documents)
+    questions = load_questions(args.eval, documents)
+    print(f"{len(documents)} document(s), {len(questions)} question(s), {args.embedder} embedder")
+
+    results = []
+    depth = max(args.k)
+    for page_length in args.page_lengths:
+        for overlap in args.overlaps:
+            if overlap >= page_length:
+                continue
+            for result in measure_chunking(documents, questions, page_length, overlap, args):
+                results.append(result)
+                recalls = "  ".join(f"R@{k} {result[f'recall@{k}']:.3f}" for k in args.k)
+                print(f"page {page_length:>5} overlap {overlap:>4} dims {str(result['dimensions']):>5} "
+                      f"{result['query_type']:<21} {result['chunks']:>5} chunks  {recalls}  "
+                      f"MRR {result[f'mrr@{depth}']:.3f}  p50 {result['query']['p50_ms']} ms  p99 {result['query']['p99_ms']} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "embedder": args.embedder,
+                "documents": len(documents),
+                "questions": len(questions),
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default=DEFAULT_DOCUMENTS)
+    parser.add_argument("--eval", default=DEFAULT_EVAL_SET, help="The JSON file of the labeled questions.")
+    parser.add_argument("--page-lengths", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 250, 500])
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[100, 256])
+    parser.add_argument("--query-types", nargs="+", choices=QUERY_TYPES, default=list(QUERY_TYPES))
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--repeats", type=int, default=20, help="The number of timed runs of every question.")
+    parser.add_argument("--embedder", choices=("hashing", "azure"), default="hashing")
+    parser.add_argument("--deployment", default=os.getenv("AZURE_AI_EMBED_DEPLOYMENT_NAME", "text-embedding-3-small"))
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    logging.basicConfig(level=logging.WARNING)
+    main(parser.parse_args())
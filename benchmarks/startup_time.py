@@ -0,0 +1,126 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure the boot of the gunicorn master until it forks the workers, per phase, and the imports of every phase.
+
+The phases run in a fresh process in the order of gunicorn with preload_app:
+  config   loading gunicorn.conf.py (the environment, the logging, the metrics directory);
+  app      api.main.create_app, loaded before the fork;
+  preload  worker_memory.prepare_for_fork, the when_ready hook importing the modules of the workers.
+The provisioning of on_starting and the lifespan of the workers call Azure, so they are not measured, but the SDKs
+they import are part of the preload phase. Every run is repeated with -X importtime, whose log is split per phase.
+Reported per phase: the median duration and the slowest top-level imports, with their cumulative import time.
+Runs offline.
+
+    python benchmarks/startup_time.py --repeat 5 --top 8 --output startup.json --importtime-log importtime.log
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+PHASES = ("config", "app", "preload")
+# Run in the src directory, like gunicorn; every phase prints its marker to stderr, which splits the importtime log.
+BOOT_SCRIPT = """
+import importlib.util, json, sys, time
+timings = {}
+
+def phase(name, run):
+    print(f"phase: {name}", file=sys.stderr, flush=True)
+    start = time.perf_counter()
+    run()
+    timings[name] = time.perf_counter() - start
+
+def load_config():
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+
+def create_app():
+    from api.main import create_app
+    create_app()
+
+def preload():
+    from worker_memory import prepare_for_fork
+    prepare_for_fork()
+
+phase("config", load_config)
+phase("app", create_app)
+phase("preload", preload)
+print(json.dumps(timings))
+"""
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def get_boot_environment() -> dict:
+    """The environment of the default configuration, which the .env files do not override."""
+    env = dict(os.environ)
+    for name in ("ENABLE_AZURE_MONITOR_TRACING", "ENABLE_LOCAL_RETRIEVER", "ENABLE_METRICS", "ENABLE_ADMIN_ENDPOINTS"):
+        env[name] = "false"
+    return env
+
+
+def boot(importtime: bool = False) -> tuple:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", BOOT_SCRIPT]
+    result = subprocess.run(command, cwd=SRC_DIR, env=get_boot_environment(), capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1]), result.stderr
+
+
+def parse_importtime(log: str) -> dict:
+    """Get the top-level imports of every phase with their cumulative time in ms, from the log of -X importtime."""
+    imports = {phase: [] for phase in PHASES}
+    current = None
+    for line in log.splitlines():
+        if line.startswith("phase: "):
+            current = line[len("phase: "):]
+            continue
+        match = IMPORTTIME_LINE.match(line)
+        # The imports without indentation are the ones made by the phase itself, the others are nested in them.
+        if current and match and not match.group(3):
+            imports[current].append((match.group(4), int(match.group(2)) / 1000))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="The number of slowest imports reported per phase.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--importtime-log", help="Write the -X importtime log of the last run to this file, e.g. for tuna.")
+    args = parser.parse_args()
+
+    runs = [boot()[0] for _ in range(args.repeat)]
+    _, log = boot(importtime=True)
+    imports = parse_importtime(log)
+
+    results = []
+    for phase in PHASES:
+        slowest = sorted(imports[phase], key=lambda item: item[1], reverse=True)[:args.top]
+        result = {
+            "phase": phase,
+            "median_ms": round(statistics.median(run[phase] for run in runs) * 1000, 1),
+            "imported_modules": len(imports[phase]),
+            "slowest_imports_ms": {name: round(ms, 1) for name, ms in slowest},
+        }
+        results.append(result)
+        print(f"{phase:>8}: {result['median_ms']} ms, slowest imports: "
+              + ", ".join(f"{name} {ms} ms" for name, ms in result["slowest_imports_ms"].items()))
+    total = round(sum(result["median_ms"] for result in results), 1)
+    print(f"   total: {total} ms until the workers are forked")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"phases": results, "total_ms": total}, f, indent=2)
+    if args.importtime_log:
+        with open(args.importtime_log, "w") as f:
+            f.write(log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+"""
+Measure the per-request overhead of the tracing with every sampler of api.tracing_config.
+
+A FastAPI app with the shape of the chat route (a chat_request span, the trace context passed in a carrier
+to a streamed get_result span with child spans for the calls of the agent, and a delta per streamed chunk)
+is called through the ASGI transport. Every mode runs in a fresh process, because the tracer provider can be
+set only once: "off" without a tracer provider, like with ENABLE_AZURE_MONITOR_TRACING=false, and the samplers
+with an in-memory exporter behind the batch span processor, so the network of the export is not measured.
+The app is not instrumented by the FastAPI instrumentation, which configure_azure_monitor applies only to the
+apps created after it; --instrument-fastapi adds its server span and its span per sent and received message.
+Reported per mode: the mean, p50 and p99 latency of a request, the overhead against "off" and the exported
+spans per request. Runs offline.
+
+    python benchmarks/tracing_overhead.py --requests 2000 --ratio 0.1 --output tracing.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import numpy as np
+
+MODES = ("off", "always_off", "parentbased_ratio", "tail", "always_on")
+
+
+def create_app(calls: int, deltas: int):
+    import fastapi
+    from fastapi.responses import StreamingResponse
+    from opentelemetry import trace
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+    tracer = trace.get_tracer(__name__)
+    app = fastapi.FastAPI()
+
+    async def get_result(carrier):
+        ctx = TraceContextTextMapPropagator().extract(carrier=carrier)
+        with tracer.start_as_current_span("get_result", context=ctx):
+            for call in range(calls):
+                with tracer.start_as_current_span(f"agent_call_{call}") as span:
+                    span.set_attribute("gen_ai.operation.name", "responses")
+                    await asyncio.sleep(0)
+            for index in range(deltas):
+                yield f"data: {index}\n\n"
+
+    @app.post("/chat")
+    async def chat():
+        carrier = {}
+        TraceContextTextMapPropagator().inject(carrier)
+        with tracer.start_as_current_span("chat_request"):
+            await asyncio.sleep(0)
+        return StreamingResponse(get_result(carrier), media_type="text/event-stream")
+
+    return app
+
+
+def measure(mode: str, args) -> dict:
+    exporter = None
+    if mode != "off":
+        from opentelemetry import trace
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+        from api.tracing_config import TracingSettings, create_tracer_provider
+
+        exporter = InMemorySpanExporter()
+        settings = TracingSettings(sampler=mode, ratio=args.ratio, tail_latency_ms=args.tail_latency_ms)
+        provider = create_tracer_provider(settings, exporter)
+        trace.set_tracer_provider(provider)
+    app = create_app(args.calls, args.deltas)
+    if mode != "off" and args.instrument_fastapi:
+        FastAPIInstrumentor.instrument_app(app)
+
+    async def run() -> list:
+        import httpx
+        latencies = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for index in range(args.warmup + args.requests):
+                start = time.perf_counter()
+                response = await client.post("/chat", json={"message": "hello"})
+                response.read()
+                if index >= args.warmup:
+                    latencies.append((time.perf_counter() - start) * 1e6)
+        return latencies
+
+    latencies = asyncio.run(run())
+    spans = 0
+    if exporter is not None:
+        provider.force_flush()
+        spans = len(exporter.get_finished_spans())
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "mean_us": round(statistics.mean(latencies), 1),
+        "p50_us": round(statistics.median(latencies), 1),
+        "p99_us": round(float(np.percentile(latencies, 99)), 1),
+        "exported_spans_per_request": round(spans / (args.warmup + args.requests), 2),
+    }
+
+
+def run_isolated(mode: str, argv: list) -> dict:
+    output = subprocess.check_output([sys.executable, __file__, *argv, "--measure", mode], text=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=3, help="The child spans of the agent calls per request.")
+    parser.add_argument("--deltas", type=int, default=20, help="The streamed chunks per request.")
+    parser.add_argument("--ratio", type=float, default=0.1, help="The sampling ratio of parentbased_ratio and tail.")
+    parser.add_argument("--tail-latency-ms", type=float, default=5000.0)
+    parser.add_argument("--instrument-fastapi", action="store_true")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--measure", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args)))
+        return
+
+    argv = ["--requests", str(args.requests), "--warmup", str(args.warmup), "--calls", str(args.calls),
+            "--deltas", str(args.deltas), "--ratio", str(args.ratio), "--tail-latency-ms", str(args.tail_latency_ms)]
+    if args.instrument_fastapi:
+        argv.append("--instrument-fastapi")
+    results = [run_isolated(mode, argv) for mode in args.modes]
+    baseline = next((result for result in results if result["mode"] == "off"), None)
+    for result in results:
+        if baseline:
+            result["overhead_mean_us"] = round(result["mean_us"] - baseline["mean_us"], 1)
+        print(f"{result['mode']:>17}: mean {result['mean_us']} us, p50 {result['p50_us']} us, p99 {result['p99_us']} us, "
+              f"overhead {result.get('overhead_mean_us', 0)} us/request, {result['exported_spans_per_request']} spans exported/request")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import os
+from typing import AsyncGenerator
+
+import fastapi
+from fastapi import Request, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .routes import authenticate, logger, serialize_sse_event
+
+# Admin endpoints are disabled by default and always require the basic authentication.
+router = fastapi.APIRouter(prefix="/admin", dependencies=[Depends(authenticate)])
+
+
+def admin_enabled() -> bool:
+    return os.getenv("ENABLE_ADMIN_ENDPOINTS", "false").lower() == "true"
+
+
+def get_indexer_monitor(request: Request):
+    from .indexer_monitor import IndexerMonitor
+    from .search_index_manager import get_indexer_names
+
+    endpoint = os.environ.get("AZURE_AI_SEARCH_ENDPOINT")
+    index_name = os.getenv("AZURE_AI_SEARCH_INDEX_NAME", "index-sample")
+    if not endpoint:
+        raise HTTPException(status_code=404, detail="AI Search is not configured.")
+    return IndexerMonitor(endpoint, request.app.state.credential, index_name, get_indexer_names(index_name))
+
+
+@router.get("/indexers/reindex-report")
+async def reindex_report(monitor = Depends(get_indexer_monitor)):
+    reports = await monitor.get_reindex_reports()
+    return JSONResponse(content=[report.to_dict() for report in reports])
+
+
+@router.get("/indexers/progress")
+async def indexer_progress(
+    request: Request,
+    min_interval: float = 2.0,
+    max_interval: float = 30.0,
+    until_idle: bool = True,
+    monitor = Depends(get_indexer_monitor),
+):
+
+    async def stream() -> AsyncGenerator[str, None]:
+        try:
+            async for progress in monitor.watch(min_interval, max_interval, until_idle):
+                if await request.is_disconnected():
+                    return
+                yield serialize_sse_event({"type": "indexer_progress", **progress.to_dict()})
+        except Exception as e:
+            logger.error(f"Error monitoring indexers: {e}")
+            yield serialize_sse_event({"type": "error", "content": str(e)})
+        yield serialize_sse_event({"type": "stream_end"})
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Content-Type": "text/event-stream"
+    }
+    return StreamingResponse(stream(), headers=headers)
@@ -1,14 +1,29 @@
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
+import asyncio
+import base64
+import json
 import logging
 import os
+import time
 
 from azure.core.credentials_async import AsyncTokenCredential
-from azure.storage.blob.aio import BlobServiceClient
+from azure.storage.blob import BlobBlock
+from azure.storage.blob.aio import BlobClient, BlobServiceClient, ContainerClient
 from azure.core.exceptions import HttpResponseError
 
+from util import hash_file
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_UPLOAD_CONCURRENCY = 16
+DEFAULT_UPLOAD_RETRIES = 3
+MANIFEST_VERSION = 1
+
+# Blob metadata written by the incremental sync.
+CONTENT_HASH_METADATA_KEY = "content_sha256"
+SOFT_DELETE_METADATA_KEY = "IsDeleted"
+
 
 class ResourceStatus(Enum):
     """Status of a resource operation."""
@@ -20,6 +35,12 @@ class ResourceStatus(Enum):
 class BlobStoreManager:
     """Manager for Azure Blob Storage operations."""
 
+    LARGE_FILE_THRESHOLD = 8 * 1024 * 1024
+    BLOCK_SIZE = 4 * 1024 * 1024
+    BLOCK_CONCURRENCY = 4
+    RETRY_BACKOFF_SECONDS = 1.0
+    PROGRESS_INTERVAL = 500
+
     def __init__(
         self,
         account_url: str,
@@ -63,16 +84,25 @@ class BlobStoreManager:
             logger.error(f"Unexpected error creating blob container '{container_name}': {e}")
             return ResourceStatus.FAILED
 
+
     async def upload_to_blob_store_maybe(
         self,
         container_name: str,
         files_directory: str,
+        max_concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+        max_retries: int = DEFAULT_UPLOAD_RETRIES,
     ) -> ResourceStatus:
         """
         Upload files from local directory to blob container if container is empty.
 
+        The directory is walked recursively and files are uploaded by a bounded pool of workers.
+        File reads are offloaded to threads, so the event loop is never blocked, files larger than
+        LARGE_FILE_THRESHOLD are uploaded as blocks in parallel and every file is retried on its own.
+
         :param container_name: Name of the blob container
         :param files_directory: Local directory containing files to upload
+        :param max_concurrency: Maximum number of files uploaded at the same time
+        :param max_retries: Number of retries for a file before it is reported as failed
         :return: ResourceStatus.CREATED (files uploaded), ResourceStatus.EXISTING (already has files), or ResourceStatus.FAILED
         """
         try:
@@ -88,31 +118,282 @@ class BlobStoreManager:
                     logger.info(f"Blob container '{container_name}' already contains {len(blobs)} file(s). Skipping upload.")
                     return ResourceStatus.EXISTING
                 
-                # Upload files
-                upload_count = 0
-                if os.path.exists(files_directory):
-                    for filename in os.listdir(files_directory):
-                        filepath = os.path.join(files_directory, filename)
-                        if os.path.isfile(filepath):
-                            try:
-                                blob_client = container_client.get_blob_client(filename)
-                                with open(filepath, 'rb') as data:
-                                    await blob_client.upload_blob(data, overwrite=True)
-                                    upload_count += 1
-                                    logger.info(f"Uploaded '{filename}' to blob container '{container_name}'")
-                            except Exception as e:
-                                logger.error(f"Failed to upload '{filename}': {e}")
-                                return ResourceStatus.FAILED
-                    
-                    if upload_count > 0:
-                        logger.info(f"Successfully uploaded {upload_count} file(s) to blob container '{container_name}'.")
-                        return ResourceStatus.CREATED
-                    else:
-                        logger.warning(f"No files found in directory '{files_directory}' to upload.")
-                        return ResourceStatus.EXISTING
-                else:
+                if not os.path.exists(files_directory):
                     logger.error(f"Files directory does not exist: {files_directory}")
                     return ResourceStatus.FAILED
+
+                local_files = await asyncio.to_thread(_list_local_files, files_directory)
+                if not local_files:
+                    logger.warning(f"No files found in directory '{files_directory}' to upload.")
+                    return ResourceStatus.EXISTING
+
+                failed = await self._upload_files(container_client, local_files, max_concurrency, max_retries)
+                if failed:
+                    logger.error(f"Failed to upload {len(failed)} of {len(local_files)} file(s) to blob container '{container_name}': {', '.join(failed[:10])}")
+                    return ResourceStatus.FAILED
+                logger.info(f"Successfully uploaded {len(local_files)} file(s) to blob container '{container_name}'.")
+                return ResourceStatus.CREATED
         except Exception as e:
             logger.error(f"Failed to upload files to blob container '{container_name}': {e}")
             return ResourceStatus.FAILED
+
+    async def sync_to_blob_store(
+        self,
+        container_name: str,
+        files_directory: str,
+        manifest_path: str,
+        max_concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+        max_retries: int = DEFAULT_UPLOAD_RETRIES,
+        verify_remote: bool = False,
+    ) -> ResourceStatus:
+        """
+        Incrementally sync files from local directory to blob container.
+
+        Local files are compared with the manifest of the last sync (path, size, mtime, content hash);
+        only new or changed files are uploaded and blobs whose source file was deleted are soft-deleted
+        by setting the SOFT_DELETE_METADATA_KEY metadata. Files with unchanged size and mtime are not read.
+        The container is listed only when there is no manifest or verify_remote is set, in which case
+        the content hash stored in the blob metadata is compared instead. Only the blobs written by the sync,
+        which carry the CONTENT_HASH_METADATA_KEY metadata or are in the manifest, are ever soft-deleted;
+        the other blobs, e.g. uploaded by the user, are left untouched.
+
+        :param container_name: Name of the blob container
+        :param files_directory: Local directory containing files to sync
+        :param manifest_path: Path of the manifest file cached on disk
+        :param max_concurrency: Maximum number of files hashed or uploaded at the same time
+        :param max_retries: Number of retries for a file before it is reported as failed
+        :param verify_remote: Compare with the blob properties even if the manifest exists
+        :return: ResourceStatus.CREATED (files synced), ResourceStatus.EXISTING (already in sync), or ResourceStatus.FAILED
+        """
+        if not os.path.exists(files_directory):
+            logger.error(f"Files directory does not exist: {files_directory}")
+            return ResourceStatus.FAILED
+        try:
+            manifest = await asyncio.to_thread(_load_manifest, manifest_path, self._account_url, container_name)
+            local_files = await asyncio.to_thread(_list_local_files, files_directory)
+            stats = await asyncio.to_thread(lambda: {path: os.stat(path) for _, path, _ in local_files})
+
+            async with BlobServiceClient(account_url=self._account_url, credential=self._credential) as blob_service_client:
+                container_client = blob_service_client.get_container_client(container_name)
+
+                # The content hashes known to be in the container, and the blobs written by the sync.
+                known: Dict[str, Optional[str]] = {}
+                synced = set(manifest or {})
+                if manifest is None or verify_remote:
+                    async for blob in container_client.list_blobs(include=["metadata"]):
+                        metadata = blob.metadata or {}
+                        if metadata.get(SOFT_DELETE_METADATA_KEY) != "true":
+                            known[blob.name] = metadata.get(CONTENT_HASH_METADATA_KEY)
+                            if CONTENT_HASH_METADATA_KEY in metadata:
+                                synced.add(blob.name)
+                else:
+                    known = {name: entry["sha256"] for name, entry in manifest.items()}
+
+                # Hash only the files which are not in the manifest with the same size and mtime.
+                semaphore = asyncio.Semaphore(max(1, max_concurrency))
+                new_manifest: Dict[str, Dict] = {}
+
+                async def describe(blob_name: str, filepath: str, size: int) -> None:
+                    stat = stats[filepath]
+                    entry = (manifest or {}).get(blob_name)
+                    if entry and entry["size"] == size and entry["mtime_ns"] == stat.st_mtime_ns:
+                        sha256 = entry["sha256"]
+                    else:
+                        async with semaphore:
+                            sha256 = await asyncio.to_thread(hash_file, filepath)
+                    new_manifest[blob_name] = {"size": size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+                await asyncio.gather(*(describe(*item) for item in local_files))
+
+                to_upload = [item for item in local_files if known.get(item[0]) != new_manifest[item[0]]["sha256"]]
+                to_delete = sorted((set(known) & synced) - set(new_manifest))
+                if not to_upload and not to_delete:
+                    await asyncio.to_thread(_save_manifest, manifest_path, self._account_url, container_name, new_manifest)
+                    logger.info(f"Blob container '{container_name}' is in sync with '{files_directory}' ({len(local_files)} file(s)).")
+                    return ResourceStatus.EXISTING
+
+                logger.info(f"Syncing blob container '{container_name}': {len(to_upload)} new or changed, {len(to_delete)} deleted file(s).")
+                failed = []
+                if to_upload:
+                    metadata = {name: {CONTENT_HASH_METADATA_KEY: new_manifest[name]["sha256"]} for name, _, _ in to_upload}
+                    failed = await self._upload_files(container_client, to_upload, max_concurrency, max_retries, metadata)
+                for blob_name in to_delete:
+                    try:
+                        await container_client.get_blob_client(blob_name).set_blob_metadata(
+                            {SOFT_DELETE_METADATA_KEY: "true"})
+                        logger.info(f"Soft-deleted blob '{blob_name}' in container '{container_name}'.")
+                    except Exception as e:
+                        logger.error(f"Failed to soft-delete blob '{blob_name}': {e}")
+                        failed.append(blob_name)
+
+                # Do not record the failed files, so that they are retried on the next sync.
+                for blob_name in failed:
+                    new_manifest.pop(blob_name, None)
+                    if blob_name in to_delete:
+                        new_manifest[blob_name] = {"size": -1, "mtime_ns": -1, "sha256": known[blob_name]}
+                await asyncio.to_thread(_save_manifest, manifest_path, self._account_url, container_name, new_manifest)
+                if failed:
+                    logger.error(f"Failed to sync {len(failed)} file(s) to blob container '{container_name}'.")
+                    return ResourceStatus.FAILED
+                return ResourceStatus.CREATED
+        except Exception as e:
+            logger.error(f"Failed to sync files to blob container '{container_name}': {e}")
+            return ResourceStatus.FAILED
+
+    async def _upload_files(
+        self,
+        container_client: ContainerClient,
+        local_files: List[Tuple[str, str, int]],
+        max_concurrency: int,
+        max_retries: int,
+        metadata: Optional[Dict[str, Dict[str, str]]] = None,
+    ) -> List[str]:
+        """
+        Upload the files with a bounded pool of workers and report the throughput.
+
+        :param container_client: The client of the target container
+        :param local_files: Tuples of blob name, local path and file size
+        :param max_concurrency: Maximum number of files uploaded at the same time
+        :param max_retries: Number of retries for a file before it is reported as failed
+        :param metadata: Optional blob metadata keyed by blob name
+        :return: The names of the blobs which could not be uploaded.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in local_files:
+            queue.put_nowait(item)
+        failed: List[str] = []
+        uploaded_bytes = 0
+        uploaded_files = 0
+        start = time.perf_counter()
+
+        async def worker() -> None:
+            nonlocal uploaded_bytes, uploaded_files
+            while True:
+                try:
+                    blob_name, filepath, size = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                blob_metadata = metadata.get(blob_name) if metadata else None
+                for attempt in range(max_retries + 1):
+                    try:
+                        blob_client = container_client.get_blob_client(blob_name)
+                        if size > BlobStoreManager.LARGE_FILE_THRESHOLD:
+                            await _upload_blocks(blob_client, filepath, size, blob_metadata)
+                        else:
+                            data = await asyncio.to_thread(_read_file, filepath)
+                            await blob_client.upload_blob(data, overwrite=True, metadata=blob_metadata)
+                        uploaded_bytes += size
+                        uploaded_files += 1
+                        logger.debug(f"Uploaded '{blob_name}' to blob container '{container_client.container_name}'")
+                        if uploaded_files % BlobStoreManager.PROGRESS_INTERVAL == 0:
+                            _log_throughput("Upload progress", uploaded_files, uploaded_bytes, time.perf_counter() - start)
+                        break
+                    except Exception as e:
+                        if attempt == max_retries:
+                            logger.error(f"Failed to upload '{blob_name}' after {attempt + 1} attempt(s): {e}")
+                            failed.append(blob_name)
+                        else:
+                            delay = BlobStoreManager.RETRY_BACKOFF_SECONDS * (2 ** attempt)
+                            logger.warning(f"Upload of '{blob_name}' failed, retrying in {delay:.1f}s: {e}")
+                            await asyncio.sleep(delay)
+
+        workers = min(max(1, max_concurrency), len(local_files))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        _log_throughput("Upload finished", uploaded_files, uploaded_bytes, time.perf_counter() - start)
+        return failed
+
+
+def _list_local_files(files_directory: str) -> List[Tuple[str, str, int]]:
+    """
+    Walk the directory recursively.
+
+    :param files_directory: The directory to walk.
+    :return: Tuples of blob name (relative path with forward slashes), local path and file size.
+    """
+    local_files = []
+    for root, _, filenames in os.walk(files_directory):
+        for filename in sorted(filenames):
+            filepath = os.path.join(root, filename)
+            blob_name = os.path.relpath(filepath, files_directory).replace(os.sep, "/")
+            local_files.append((blob_name, filepath, os.path.getsize(filepath)))
+    return local_files
+
+
+def _read_file(filepath: str, offset: int = 0, length: int = -1) -> bytes:
+    """Read the file or a range of it; called from a worker thread."""
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+async def _upload_blocks(
+    blob_client: BlobClient,
+    filepath: str,
+    size: int,
+    metadata: Optional[Dict[str, str]] = None,
+) -> None:
+    """
+    Upload a large file as blocks staged in parallel and commit the block list.
+
+    :param blob_client: The client of the target blob.
+    :param filepath: The local path of the file.
+    :param size: The size of the file.
+    :param metadata: Optional blob metadata.
+    """
+    block_size = BlobStoreManager.BLOCK_SIZE
+    semaphore = asyncio.Semaphore(BlobStoreManager.BLOCK_CONCURRENCY)
+    block_ids = [
+        base64.b64encode(f"{index:08d}".encode()).decode()
+        for index in range((size + block_size - 1) // block_size)
+    ]
+
+    async def stage(index: int, block_id: str) -> None:
+        async with semaphore:
+            data = await asyncio.to_thread(_read_file, filepath, index * block_size, block_size)
+            await blob_client.stage_block(block_id, data)
+
+    await asyncio.gather(*(stage(index, block_id) for index, block_id in enumerate(block_ids)))
+    await blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in block_ids], metadata=metadata)
+
+
+def _load_manifest(manifest_path: str, account_url: str, container_name: str) -> Optional[Dict[str, Dict]]:
+    """
+    Load the manifest of the last sync.
+
+    :return: The manifest entries keyed by blob name or None if there is no valid manifest for the container.
+    """
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable blob manifest '{manifest_path}': {e}")
+        return None
+    if (manifest.get("version") != MANIFEST_VERSION
+            or manifest.get("account_url") != account_url
+            or manifest.get("container") != container_name):
+        return None
+    return manifest.get("files", {})
+
+
+def _save_manifest(manifest_path: str, account_url: str, container_name: str, files: Dict[str, Dict]) -> None:
+    """Atomically write the manifest of the sync."""
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            "version": MANIFEST_VERSION,
+            "account_url": account_url,
+            "container": container_name,
+            "files": files,
+        }, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def _log_throughput(message: str, files: int, size: int, elapsed: float) -> None:
+    """Log the number of uploaded files together with MB/s and files/s."""
+    elapsed = max(elapsed, 1e-6)
+    logger.info(
+        f"{message}: {files} file(s), {size / 1_000_000:.1f} MB in {elapsed:.1f}s "
+        f"({size / 1_000_000 / elapsed:.2f} MB/s, {files / elapsed:.1f} files/s)")
@@ -0,0 +1,131 @@
+from typing import Iterator, List, Tuple
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# The page length and overlap of the split skill, so the pushed chunks match the ones of the indexers.
+DEFAULT_MAX_PAGE_LENGTH = 2000
+DEFAULT_PAGE_OVERLAP_LENGTH = 500
+SUPPORTED_EXTENSIONS = (".md", ".txt", ".pdf")
+
+# Preferred page boundaries, from the strongest to the weakest.
+_BOUNDARIES = ("\n\n", "\n", ". ", "! ", "? ", "; ", " ")
+
+
+def read_document(path: str) -> str:
+    """
+    Read the text of a document.
+
+    PDF files are read with pypdf, which is installed only to build the embeddings.
+
+    :param path: The path of a .md, .txt or .pdf file.
+    :return: The text of the document.
+    :raises ValueError: If the file type is not supported or pypdf is not installed.
+    """
+    return "\n".join(read_document_pages(path))
+
+
+def read_document_pages(path: str) -> List[str]:
+    """
+    Read the text of the pages of a document: of every page of a PDF file, or of the whole text file.
+
+    :param path: The path of a .md, .txt or .pdf file.
+    :return: The texts of the pages.
+    :raises ValueError: If the file type is not supported or pypdf is not installed.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ModuleNotFoundError:
+            raise ValueError("pypdf is required to read PDF files, please make sure it is installed.")
+        reader = PdfReader(path)
+        return [page.extract_text() or "" for page in reader.pages]
+    if extension in SUPPORTED_EXTENSIONS:
+        with open(path, encoding="utf-8") as f:
+            return [f.read()]
+    raise ValueError(f"Unsupported document type '{extension}' of '{path}'.")
+
+
+def split_pages(
+    text: str,
+    max_page_length: int = DEFAULT_MAX_PAGE_LENGTH,
+    page_overlap_length: int = DEFAULT_PAGE_OVERLAP_LENGTH,
+) -> List[str]:
+    """
+    Split the text to pages like the split skill in pages mode.
+
+    A page ends at the last paragraph, line, sentence or word boundary before max_page_length characters,
+    and the next page starts page_overlap_length characters before the end of the previous one.
+
+    :param text: The text to split.
+    :param max_page_length: The maximal number of characters in a page.
+    :param page_overlap_length: The number of characters repeated from the end of the previous page.
+    :return: The pages with the leading and trailing whitespace removed.
+    """
+    if page_overlap_length >= max_page_length:
+        raise ValueError("page_overlap_length must be smaller than max_page_length.")
+    pages = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + max_page_length, length)
+        if end < length:
+            end = _find_boundary(text, start + max_page_length // 2, end)
+        page = text[start:end].strip()
+        if page:
+            pages.append(page)
+        if end >= length:
+            break
+        # Start the overlap at a word, so the next page does not begin in the middle of one.
+        next_start = max(end - page_overlap_length, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 and page_overlap_length else next_start
+        while start < length and text[start].isspace():
+            start += 1
+    return pages
+
+
+def _find_boundary(text: str, low: int, high: int) -> int:
+    """Find the end of the page after the strongest boundary in text[low:high], or high if there is none."""
+    for boundary in _BOUNDARIES:
+        position = text.rfind(boundary, low, high)
+        if position != -1:
+            return position + len(boundary)
+    return high
+
+
+def iter_document_paths(directory: str) -> Iterator[str]:
+    """Get the paths of the supported documents of the directory and of its subdirectories, in sorted order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def iter_chunks(
+    directory: str,
+    max_page_length: int = DEFAULT_MAX_PAGE_LENGTH,
+    page_overlap_length: int = DEFAULT_PAGE_OVERLAP_LENGTH,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Split the documents of the directory and of its subdirectories to chunks.
+
+    The title of a chunk is the file name of its document, as set by the indexers.
+    The documents, which can not be read, are skipped with an error.
+
+    :param directory: The directory with the documents.
+    :param max_page_length: The maximal number of characters in a chunk.
+    :param page_overlap_length: The number of characters repeated from the end of the previous chunk.
+    :return: The generator of the titles and the chunks.
+    """
+    for path in iter_document_paths(directory):
+        try:
+            text = read_document(path)
+        except Exception as e:
+            logger.error(f"Failed to read '{path}': {e}")
+            continue
+        for page in split_pages(text, max_page_length, page_overlap_length):
+            yield os.path.basename(path), page
@@ -0,0 +1,60 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import json
+import os
+
+import fastapi
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .routes import logger
+
+# The requests, which are cheap and must be answered when the worker is busy, are not limited.
+EXEMPT_PATH_PREFIXES = ("/static", "/metrics", "/livez", "/readyz")
+RETRY_AFTER_SECONDS = 1
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    The ASGI middleware rejecting the HTTP requests with 503 and Retry-After when the worker already processes
+    max_concurrent requests, including the streamed responses until they end.
+
+    Rejecting the requests beyond the limit lets the load balancer or the client retry on another worker,
+    instead of the streams of a saturated worker all slowing down.
+
+    :param app: The ASGI app.
+    :param max_concurrent: The maximal number of concurrent requests of the worker.
+    """
+
+    def __init__(self, app: ASGIApp, max_concurrent: int) -> None:
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.rejected = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PATH_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        if self.active >= self.max_concurrent:
+            self.rejected += 1
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", str(RETRY_AFTER_SECONDS).encode())],
+            })
+            await send({"type": "http.response.body", "body": json.dumps({"detail": "The server is busy."}).encode()})
+            return
+        self.active += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active -= 1
+
+
+def add_concurrency_limit(app: fastapi.FastAPI) -> None:
+    """Limit the concurrent requests of every worker to APP_MAX_CONCURRENT_REQUESTS, if it is set and positive."""
+    max_concurrent = int(os.getenv("APP_MAX_CONCURRENT_REQUESTS", "0"))
+    if max_concurrent > 0:
+        app.add_middleware(ConcurrencyLimitMiddleware, max_concurrent=max_concurrent)
+        logger.info(f"The concurrent requests are limited to {max_concurrent} per worker.")
@@ -0,0 +1,300 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass, asdict
+import array
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import time
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from .chunking import DEFAULT_MAX_PAGE_LENGTH, DEFAULT_PAGE_OVERLAP_LENGTH
+from .embedding_store import EmbeddedChunk, write_embeddings_csv
+from .ingestion import ingest_directory
+
+logger = logging.getLogger(__name__)
+
+# A batch is limited by the number of its inputs and by their characters (about four per token).
+DEFAULT_EMBED_BATCH_INPUTS = 256
+DEFAULT_EMBED_BATCH_CHARACTERS = 200_000
+DEFAULT_EMBED_CONCURRENCY = 4
+DEFAULT_EMBED_RETRIES = 6
+MAX_RETRY_DELAY_SECONDS = 60.0
+
+
+@dataclass
+class EmbeddingBuildReport:
+    """The statistics of an embedding build."""
+    chunks: int = 0
+    cached: int = 0
+    embedded: int = 0
+    requests: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        return self.cached / self.chunks if self.chunks else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "chunks_per_second": self.chunks_per_second, "cache_hit_ratio": self.cache_hit_ratio}
+
+
+class EmbeddingCache:
+    """
+    The on-disk cache of the embeddings, keyed by the hash of the model, the dimensions and the chunk text.
+
+    The vectors are stored as float32 blobs in a SQLite database, so the cache can be appended to
+    after every batch and an interrupted build resumes from the last stored batch.
+
+    :param path: The path of the database file, created if needed.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._connection.commit()
+
+    @staticmethod
+    def get_key(model: str, dimensions: Optional[int], text: str) -> str:
+        return hashlib.sha256(f"{model}\0{dimensions}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str], batch_size: int = 500) -> Dict[str, List[float]]:
+        """Get the cached vectors of the keys; the keys without a vector are missing from the result."""
+        found = {}
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            rows = self._connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+            for key, blob in rows:
+                vector = array.array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]]) -> None:
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            ((key, array.array("f", vector).tobytes()) for key, vector in items))
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class EmbeddingBuilder:
+    """
+    Embed the chunks through the Azure OpenAI client, reusing the cached embeddings.
+
+    The distinct chunk texts missing from the cache are sent in batches limited by the number of inputs
+    and by their characters, with at most max_concurrency requests in flight. Requests, which are
+    throttled (429) or fail on the connection or on the server, are retried with an exponential backoff,
+    waiting at least the retry-after time returned by the service.
+
+    :param embedding_client: The AsyncAzureOpenAI (or AsyncOpenAI) client.
+    :param deployment_name: The name of the embedding deployment.
+    :param dimensions: The number of dimensions of the embeddings, if the model accepts the parameter.
+    :param cache: The embedding cache, or None to embed all the chunks.
+    :param max_batch_inputs: The maximal number of chunks in a request.
+    :param max_batch_characters: The maximal number of characters of the chunks in a request.
+    :param max_concurrency: The maximal number of requests in flight.
+    :param max_retries: The number of retries of a failed request.
+    """
+
+    def __init__(
+            self,
+            embedding_client: Any,
+            deployment_name: str,
+            dimensions: Optional[int] = None,
+            cache: Optional[EmbeddingCache] = None,
+            max_batch_inputs: int = DEFAULT_EMBED_BATCH_INPUTS,
+            max_batch_characters: int = DEFAULT_EMBED_BATCH_CHARACTERS,
+            max_concurrency: int = DEFAULT_EMBED_CONCURRENCY,
+            max_retries: int = DEFAULT_EMBED_RETRIES,
+        ) -> None:
+        """Constructor."""
+        self._client = embedding_client
+        self._deployment_name = deployment_name
+        self._dimensions = dimensions
+        self._cache = cache
+        self._max_batch_inputs = max(1, max_batch_inputs)
+        self._max_batch_characters = max(1, max_batch_characters)
+        self._max_concurrency = max(1, max_concurrency)
+        self._max_retries = max_retries
+
+    async def build(self, chunks: Iterable[Tuple[str, str]]) -> Tuple[List[EmbeddedChunk], EmbeddingBuildReport]:
+        """
+        Embed the chunks.
+
+        :param chunks: The titles and the texts of the chunks.
+        :return: The embedded chunks in the order of the input and the statistics of the build.
+        :raises: The error of a batch, which failed after all the retries.
+        """
+        start = time.perf_counter()
+        chunks = list(chunks)
+        report = EmbeddingBuildReport(chunks=len(chunks))
+        keys = {text: EmbeddingCache.get_key(self._deployment_name, self._dimensions, text) for _, text in chunks}
+        vectors = self._cache.get_many(list(set(keys.values()))) if self._cache else {}
+        missing = [text for text, key in keys.items() if key not in vectors]
+        report.cached = sum(1 for _, text in chunks if keys[text] in vectors)
+
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def embed(batch: List[str]) -> None:
+            async with semaphore:
+                embeddings = await self._embed_batch(batch, report)
+            items = [(keys[text], embedding) for text, embedding in zip(batch, embeddings)]
+            vectors.update(items)
+            if self._cache:
+                self._cache.put_many(items)
+            report.embedded += len(batch)
+            logger.debug(f"Embedded {report.embedded}/{len(missing)} chunk text(s).")
+
+        await asyncio.gather(*(embed(batch) for batch in self._get_batches(missing)))
+
+        report.seconds = time.perf_counter() - start
+        logger.info(f"Built the embeddings of {report.chunks} chunk(s) in {report.seconds:.1f}s "
+                    f"({report.chunks_per_second:.1f} chunks/s): {report.cached} reused from the cache "
+                    f"({report.cache_hit_ratio:.0%}), {report.embedded} embedded in {report.requests} request(s), "
+                    f"{report.retries} retried.")
+        embedded = [EmbeddedChunk(chunk=text, embedding=vectors[keys[text]], title=title) for title, text in chunks]
+        return embedded, report
+
+    def _get_batches(self, texts: List[str]) -> List[List[str]]:
+        """Group the texts into the batches limited by the number of inputs and by the characters."""
+        batches = []
+        batch = []
+        characters = 0
+        for text in texts:
+            if batch and (len(batch) >= self._max_batch_inputs or characters + len(text) > self._max_batch_characters):
+                batches.append(batch)
+                batch = []
+                characters = 0
+            batch.append(text)
+            characters += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _embed_batch(self, batch: List[str], report: EmbeddingBuildReport) -> List[List[float]]:
+        """Embed the batch, retrying the throttled and the transient failures."""
+        kwargs = {"dimensions": self._dimensions} if self._dimensions else {}
+        attempt = 0
+        while True:
+            try:
+                report.requests += 1
+                response = await self._client.embeddings.create(input=batch, model=self._deployment_name, **kwargs)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except (RateLimitError, APIConnectionError, APIStatusError) as e:
+                status_code = getattr(e, "status_code", None)
+                if attempt >= self._max_retries or (status_code is not None and status_code != 429 and status_code < 500):
+                    raise
+                delay = _get_retry_delay(e, attempt)
+                attempt += 1
+                report.retries += 1
+                logger.warning(f"Embedding request of {len(batch)} chunk(s) failed ({status_code or type(e).__name__}), "
+                               f"retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+
+async def build_embeddings_file(
+    embedding_client: Any,
+    deployment_name: str,
+    dimensions: Optional[int],
+    input_directory: str,
+    output_file: str,
+    cache_path: Optional[str] = None,
+    max_page_length: int = DEFAULT_MAX_PAGE_LENGTH,
+    page_overlap_length: int = DEFAULT_PAGE_OVERLAP_LENGTH,
+    max_concurrency: int = DEFAULT_EMBED_CONCURRENCY,
+) -> EmbeddingBuildReport:
+    """
+    Chunk the documents of the directory, embed the chunks and write the embeddings file.
+
+    :param embedding_client: The AsyncAzureOpenAI (or AsyncOpenAI) client.
+    :param deployment_name: The name of the embedding deployment.
+    :param dimensions: The number of dimensions of the embeddings, if the model accepts the parameter.
+    :param input_directory: The directory with the .md, .txt and .pdf documents.
+    :param output_file: The embeddings file to write, with the columns token, embedding and title.
+    :param cache_path: The embedding cache database, or None to embed all the chunks.
+    :param max_page_length: The maximal number of characters in a chunk.
+    :param page_overlap_length: The number of characters repeated from the end of the previous chunk.
+    :param max_concurrency: The maximal number of embedding requests in flight.
+    :return: The statistics of the build.
+    """
+    # The documents are parsed and split in a process pool, as the PDF text extraction is CPU bound.
+    chunks = await asyncio.to_thread(lambda: [
+        (record.title, record.chunk)
+        for record in ingest_directory(input_directory, max_page_length, page_overlap_length)
+    ])
+    cache = EmbeddingCache(cache_path) if cache_path else None
+    try:
+        builder = EmbeddingBuilder(embedding_client, deployment_name, dimensions, cache, max_concurrency=max_concurrency)
+        embedded, report = await builder.build(chunks)
+    finally:
+        if cache:
+            cache.close()
+    count = await asyncio.to_thread(write_embeddings_csv, embedded, output_file)
+    logger.info(f"Wrote {count} chunk(s) of '{input_directory}' to '{output_file}'.")
+    return report
+
+
+def _get_retry_delay(error: Exception, attempt: int) -> float:
+    """Get the exponential backoff with jitter, but at least the retry-after time of the response."""
+    delay = min(MAX_RETRY_DELAY_SECONDS, 2 ** attempt) * (0.5 + random.random() / 2)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return max(delay, min(MAX_RETRY_DELAY_SECONDS, float(headers[header]) * scale))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return delay
+
+
+async def _main(args) -> None:
+    from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+    from openai import AsyncAzureOpenAI
+
+    async with DefaultAzureCredential() as credential:
+        embedding_client = AsyncAzureOpenAI(
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+            azure_endpoint=args.endpoint,
+            azure_ad_token_provider=get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default"),
+        )
+        async with embedding_client:
+            await build_embeddings_file(
+                embedding_client, args.deployment, args.dimensions, args.input, args.output,
+                cache_path=None if args.no_cache else args.cache, max_concurrency=args.concurrency)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+    from util import get_cache_dir
+
+    from .embedding_store import DEFAULT_EMBEDDINGS_FILE
+
+    parser = argparse.ArgumentParser(description="Chunk the documents, embed the chunks and write the embeddings file.")
+    parser.add_argument("--input", default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "files"))
+    parser.add_argument("--output", default=DEFAULT_EMBEDDINGS_FILE)
+    parser.add_argument("--endpoint", default=os.getenv("AZURE_OPENAI_ENDPOINT"), required=not os.getenv("AZURE_OPENAI_ENDPOINT"))
+    parser.add_argument("--deployment", default=os.getenv("AZURE_AI_EMBED_DEPLOYMENT_NAME", "text-embedding-3-small"))
+    parser.add_argument("--dimensions", type=int, default=int(os.getenv("AZURE_AI_EMBED_DIMENSIONS", "0")) or None)
+    parser.add_argument("--cache", default=os.path.join(get_cache_dir(), "embedding_cache.sqlite"))
+    parser.add_argument("--no-cache", action="store_true", help="Embed all the chunks without reading or writing the cache.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_EMBED_CONCURRENCY)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
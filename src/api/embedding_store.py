@@ -0,0 +1,341 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from dataclasses import dataclass
+import argparse
+import csv
+import json
+import logging
+import mmap
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The embeddings of the sample corpus: 953 chunks of the product files with 100-dimensional vectors.
+DEFAULT_EMBEDDINGS_FILE = os.path.join(os.path.dirname(__file__), "data", "embeddings.csv")
+
+# The files of a binary embedding store directory.
+STORE_VERSION = 1
+STORE_META_FILE = "meta.json"
+STORE_VECTORS_FILE = "vectors.npy"
+STORE_CHUNKS_FILE = "chunks.bin"
+STORE_OFFSETS_FILE = "offsets.npy"
+STORE_TITLE_IDS_FILE = "title_ids.npy"
+STORE_DTYPES = ("float32", "float16")
+
+
+@dataclass
+class EmbeddedChunk:
+    """A chunk of a document with its embedding."""
+    chunk: str
+    embedding: List[float]
+    title: str
+
+
+def iter_embeddings_csv(path: str = DEFAULT_EMBEDDINGS_FILE) -> Iterator[EmbeddedChunk]:
+    """
+    Stream the chunks from the embeddings file.
+
+    The file has the columns token (the chunk text), embedding (the vector as JSON array) and title.
+
+    :param path: The path of the embeddings file.
+    :return: The generator of the chunks, reading the file row by row.
+    """
+    # The embedding cells are longer than the default field size limit.
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield EmbeddedChunk(chunk=row["token"], embedding=json.loads(row["embedding"]), title=row["title"])
+
+
+def write_embeddings_csv(chunks: Iterable[EmbeddedChunk], path: str) -> int:
+    """
+    Write the chunks to the embeddings file read by iter_embeddings_csv.
+
+    The file is written next to the target and moved in place at the end.
+
+    :param chunks: The chunks with their embeddings.
+    :param path: The path of the embeddings file.
+    :return: The number of written chunks.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    count = 0
+    try:
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["token", "embedding", "title"])
+            for embedded in chunks:
+                writer.writerow([embedded.chunk, json.dumps(embedded.embedding), embedded.title])
+                count += 1
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+class EmbeddingStore:
+    """
+    The binary embedding store, memory-mapped instead of parsed.
+
+    The store is a directory with the vectors as a row-major .npy matrix, the UTF-8 text of the chunks
+    concatenated in chunks.bin with their byte offsets, the title index of every chunk and meta.json
+    with the titles. Opening the store reads only meta.json; the pages of the vectors and of the text are
+    read on access from the page cache, so the workers forked from the same process, and any other
+    process opening the store, share them instead of holding private copies.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open the store.
+
+        :param path: The store directory, written by convert_embeddings_csv.
+        :raises ValueError: If the directory is not an embedding store of a supported version.
+        """
+        self._path = path
+        # The files are opened in the version directory, so a conversion swapping the store is not seen midway.
+        version_path = os.path.realpath(path)
+        meta_path = os.path.join(version_path, STORE_META_FILE)
+        if not os.path.isfile(meta_path):
+            raise ValueError(f"'{path}' is not an embedding store: {STORE_META_FILE} is missing.")
+        with open(meta_path, encoding="utf-8") as f:
+            self._meta: Dict[str, Any] = json.load(f)
+        if self._meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Embedding store '{path}' has version {self._meta.get('version')}, expected {STORE_VERSION}.")
+
+        self._titles: List[str] = self._meta["titles"]
+        self._vectors = np.load(os.path.join(version_path, STORE_VECTORS_FILE), mmap_mode="r")
+        self._offsets = np.load(os.path.join(version_path, STORE_OFFSETS_FILE), mmap_mode="r")
+        self._title_ids = np.load(os.path.join(version_path, STORE_TITLE_IDS_FILE), mmap_mode="r")
+        if len(self._offsets) != len(self._vectors) + 1 or len(self._title_ids) != len(self._vectors):
+            raise ValueError(f"Embedding store '{path}' is inconsistent: {len(self._vectors)} vectors, "
+                             f"{len(self._offsets) - 1} chunks and {len(self._title_ids)} titles.")
+
+        self._chunks_file = open(os.path.join(version_path, STORE_CHUNKS_FILE), "rb")
+        # mmap cannot map an empty file.
+        self._chunks = (mmap.mmap(self._chunks_file.fileno(), 0, access=mmap.ACCESS_READ)
+                        if int(self._offsets[-1]) > 0 else b"")
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The read-only memory-mapped matrix of the vectors, one row per chunk."""
+        return self._vectors
+
+    @property
+    def dimensions(self) -> int:
+        return int(self._vectors.shape[1])
+
+    @property
+    def dtype(self) -> str:
+        return str(self._vectors.dtype)
+
+    @property
+    def titles(self) -> List[str]:
+        """The distinct titles of the chunks."""
+        return self._titles
+
+    @property
+    def source(self) -> Optional[Dict[str, Any]]:
+        """The path, size and mtime of the file the store was converted from."""
+        return self._meta.get("source")
+
+    def __len__(self) -> int:
+        return int(self._vectors.shape[0])
+
+    def get_chunk(self, index: int) -> str:
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return self._chunks[start:end].decode("utf-8")
+
+    def get_title(self, index: int) -> str:
+        return self._titles[int(self._title_ids[index])]
+
+    def __getitem__(self, index: int) -> EmbeddedChunk:
+        return EmbeddedChunk(
+            chunk=self.get_chunk(index),
+            embedding=self._vectors[index].astype(np.float32).tolist(),
+            title=self.get_title(index),
+        )
+
+    def __iter__(self) -> Iterator[EmbeddedChunk]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self) -> None:
+        if isinstance(self._chunks, mmap.mmap):
+            self._chunks.close()
+        self._chunks_file.close()
+
+    def __enter__(self) -> "EmbeddingStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def is_embedding_store(path: str) -> bool:
+    """
+    Check whether the path is a binary embedding store rather than an embeddings CSV file.
+
+    :param path: The path of the embeddings.
+    :return: True if the path is a store directory.
+    """
+    return os.path.isfile(os.path.join(path, STORE_META_FILE))
+
+
+def iter_embeddings(path: str = DEFAULT_EMBEDDINGS_FILE) -> Iterator[EmbeddedChunk]:
+    """
+    Stream the chunks from the binary embedding store or from the embeddings CSV file.
+
+    :param path: The store directory or the CSV file.
+    :return: The generator of the chunks.
+    """
+    if not is_embedding_store(path):
+        yield from iter_embeddings_csv(path)
+        return
+    with EmbeddingStore(path) as store:
+        yield from store
+
+
+def _get_source(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _swap_store(version_path: str, store_path: str) -> None:
+    """Point the store path to the version directory with a single rename and remove the previous version."""
+    previous = os.path.realpath(store_path) if os.path.islink(store_path) else None
+    if os.path.isdir(store_path) and previous is None:
+        # A store written as a plain directory is replaced once, and not atomically.
+        shutil.rmtree(store_path)
+    link_path = f"{version_path}.link"
+    try:
+        os.symlink(os.path.basename(version_path), link_path, target_is_directory=True)
+    except OSError as e:
+        # Creating symbolic links may require a privilege on Windows.
+        logger.warning(f"Replacing the embedding store '{store_path}' in place, without a symbolic link: {e}")
+        if previous is not None:
+            os.remove(store_path)
+        os.replace(version_path, store_path)
+    else:
+        os.replace(link_path, store_path)
+    # The processes, which memory-mapped the previous version, keep reading it until they close it.
+    if previous is not None and previous != os.path.realpath(version_path):
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def convert_embeddings_csv(csv_path: str, store_path: str, dtype: str = "float32") -> EmbeddingStore:
+    """
+    Convert the embeddings CSV file to the binary embedding store.
+
+    The CSV file is streamed: the vectors are appended to a raw file and the .npy header is written once
+    the number of rows is known, so the memory stays bounded for large corpora. The store is written to a new
+    version directory next to the target, which is then a symbolic link swapped to it with a single rename,
+    so a store being read is never seen half written or missing.
+
+    :param csv_path: The embeddings file with the columns token, embedding and title.
+    :param store_path: The directory of the store, replaced if it exists.
+    :param dtype: The type of the stored vectors, float32 or float16.
+    :return: The opened store.
+    :raises ValueError: If the dtype is not supported or the rows have different dimensions.
+    """
+    if dtype not in STORE_DTYPES:
+        raise ValueError(f"Unsupported embedding store dtype '{dtype}', expected one of {STORE_DTYPES}.")
+
+    start = time.perf_counter()
+    tmp_path = f"{store_path}.v{time.time_ns()}-{os.getpid()}"
+    os.makedirs(tmp_path)
+    raw_path = os.path.join(tmp_path, "vectors.raw")
+
+    titles: Dict[str, int] = {}
+    offsets = [0]
+    title_ids = []
+    dimensions = None
+    try:
+        with open(raw_path, "wb") as raw, open(os.path.join(tmp_path, STORE_CHUNKS_FILE), "wb") as chunks:
+            for row, embedded in enumerate(iter_embeddings_csv(csv_path)):
+                vector = np.asarray(embedded.embedding, dtype=dtype)
+                if dimensions is None:
+                    dimensions = len(vector)
+                elif len(vector) != dimensions:
+                    raise ValueError(f"Row {row} of '{csv_path}' has {len(vector)} dimensions, expected {dimensions}.")
+                raw.write(vector.tobytes())
+                text = embedded.chunk.encode("utf-8")
+                chunks.write(text)
+                offsets.append(offsets[-1] + len(text))
+                title_ids.append(titles.setdefault(embedded.title, len(titles)))
+
+        count = len(title_ids)
+        with open(os.path.join(tmp_path, STORE_VECTORS_FILE), "wb") as f:
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+                      "shape": (count, dimensions or 0)}
+            np.lib.format.write_array_header_1_0(f, header)
+            with open(raw_path, "rb") as raw:
+                shutil.copyfileobj(raw, f, 16 * 1024 * 1024)
+        os.remove(raw_path)
+        np.save(os.path.join(tmp_path, STORE_OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+        np.save(os.path.join(tmp_path, STORE_TITLE_IDS_FILE), np.asarray(title_ids, dtype=np.int32))
+
+        meta = {
+            "version": STORE_VERSION,
+            "count": count,
+            "dimensions": dimensions or 0,
+            "dtype": dtype,
+            "titles": list(titles),
+            "source": _get_source(csv_path),
+        }
+        with open(os.path.join(tmp_path, STORE_META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        _swap_store(tmp_path, store_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    logger.info(f"Converted {count} chunk(s) of '{csv_path}' to the {dtype} embedding store '{store_path}' "
+                f"in {time.perf_counter() - start:.2f}s.")
+    return EmbeddingStore(store_path)
+
+
+def get_or_convert_embedding_store(csv_path: str, store_path: str, dtype: str = "float32") -> EmbeddingStore:
+    """
+    Open the binary embedding store of the CSV file, converting the file if the store is missing or stale.
+
+    The store is stale if the size or the mtime of the CSV file changed, or if it was written with another dtype.
+
+    :param csv_path: The embeddings CSV file.
+    :param store_path: The directory of the store.
+    :param dtype: The type of the stored vectors, float32 or float16.
+    :return: The opened store.
+    """
+    if is_embedding_store(store_path):
+        try:
+            store = EmbeddingStore(store_path)
+        except ValueError as e:
+            logger.warning(f"Ignoring the embedding store '{store_path}': {e}")
+        else:
+            source = store.source or {}
+            current = _get_source(csv_path)
+            if (store.dtype == dtype and source.get("size") == current["size"]
+                    and source.get("mtime_ns") == current["mtime_ns"]):
+                return store
+            store.close()
+    return convert_embeddings_csv(csv_path, store_path, dtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the embeddings CSV file to the binary embedding store.")
+    parser.add_argument("csv_path", nargs="?", default=DEFAULT_EMBEDDINGS_FILE)
+    parser.add_argument("store_path")
+    parser.add_argument("--dtype", choices=STORE_DTYPES, default="float32")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with convert_embeddings_csv(args.csv_path, args.store_path, args.dtype) as converted:
+        print(f"{len(converted)} chunks, {converted.dimensions} dimensions, {converted.dtype}: {converted.path}")
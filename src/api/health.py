@@ -0,0 +1,203 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import fastapi
+from fastapi import Response
+
+logger = logging.getLogger("azureaiapp")
+
+DEFAULT_INTERVAL_SECONDS = 30.0
+DEFAULT_JITTER = 0.2
+DEFAULT_TIMEOUT_SECONDS = 10.0
+DEFAULT_UPSTREAM_MAX_AGE_SECONDS = 120.0
+# The token must stay valid for this long, so that the requests do not all wait on its renewal.
+TOKEN_MIN_TTL_SECONDS = 60.0
+# The scope of the tokens of AIProjectClient.
+TOKEN_SCOPE = "https://ai.azure.com/.default"
+
+router = fastapi.APIRouter()
+
+
+@dataclass
+class HealthState:
+    """
+    The state of the worker, which the probes read without any I/O. The lifespan and the requests update it,
+    and the background prober refreshes the credential token and checks the upstream when the requests do not.
+    """
+    agent_loaded: bool = False
+    # Set by the on_starting hook of gunicorn.conf.py: "done", or "incomplete" while the search index is not
+    # populated yet; "unmanaged" if the app was started without it.
+    provisioning: str = "unmanaged"
+    probing: bool = False
+    # The time.monotonic of the last upstream call, which succeeded.
+    last_upstream_success: float = 0.0
+    # The expiry of the credential token, in seconds since the epoch.
+    token_expires_on: float = 0.0
+
+
+state = HealthState()
+# Read once, the probes only compare it.
+_upstream_max_age = float(os.getenv("APP_READY_UPSTREAM_MAX_AGE_SECONDS", str(DEFAULT_UPSTREAM_MAX_AGE_SECONDS)))
+_livez_body = json.dumps({"status": "ok"}).encode()
+# The deployed container runs the provisioning of gunicorn.conf.py, so a worker started without it is not ready.
+_provisioning_expected = bool(os.getenv("RUNNING_IN_PRODUCTION"))
+
+
+def record_upstream_success() -> None:
+    """Record that the upstream answered, e.g. the first event of a response stream."""
+    state.last_upstream_success = time.monotonic()
+
+
+def is_provisioned() -> bool:
+    """Whether the resources were provisioned, or the provisioning is not expected, e.g. in local development."""
+    if state.provisioning == "unmanaged":
+        return not _provisioning_expected
+    return state.provisioning == "done"
+
+
+def get_readiness(agent_loaded: bool) -> Tuple[bool, Dict]:
+    """
+    Compute the readiness of the worker from the cached state.
+
+    Without the prober, the credential and the upstream are not checked.
+
+    :param agent_loaded: Whether the lifespan loaded the agent.
+    :return: The readiness and its checks.
+    """
+    checks = {
+        "agent": agent_loaded,
+        "provisioning": is_provisioned(),
+    }
+    details = {"provisioning": state.provisioning}
+    if state.probing:
+        token_ttl = state.token_expires_on - time.time()
+        upstream_age = time.monotonic() - state.last_upstream_success
+        checks["credential"] = token_ttl > TOKEN_MIN_TTL_SECONDS
+        checks["upstream"] = upstream_age <= _upstream_max_age
+        details["token_ttl_seconds"] = round(max(token_ttl, 0.0))
+        details["upstream_age_seconds"] = round(upstream_age) if state.last_upstream_success else None
+    ready = all(checks.values())
+    return ready, {"status": "ready" if ready else "not_ready", "checks": checks, **details}
+
+
+@router.get("/livez", include_in_schema=False)
+async def livez() -> Response:
+    # Answered by the event loop, which is therefore not blocked.
+    return Response(content=_livez_body, media_type="application/json")
+
+
+@router.get("/readyz", include_in_schema=False)
+async def readyz(request: fastapi.Request) -> Response:
+    agent_loaded = state.agent_loaded and getattr(request.app.state, "agent_version_details", None) is not None
+    ready, body = get_readiness(agent_loaded)
+    return Response(content=json.dumps(body), status_code=200 if ready else 503, media_type="application/json")
+
+
+class HealthProber:
+    """
+    Refresh the credential token and check the upstream on a jittered interval, so that the probes never call Azure.
+
+    The upstream is only called when no request reached it since the previous probe, with a light read of the agent.
+    While the provisioning is incomplete, the search index is checked until it holds AZURE_AI_SEARCH_MIN_DOCUMENTS.
+
+    :param project_client: The AIProjectClient of the worker.
+    :param credential: The credential of the project client.
+    :param agent: The AgentVersionDetails of the agent.
+    :param interval: The mean interval of the probes in seconds.
+    :param jitter: The relative jitter of the interval, so that the workers do not probe together.
+    :param timeout: The timeout of every call in seconds.
+    """
+
+    def __init__(self, project_client, credential, agent, interval: float = DEFAULT_INTERVAL_SECONDS,
+                 jitter: float = DEFAULT_JITTER, timeout: float = DEFAULT_TIMEOUT_SECONDS) -> None:
+        self._project_client = project_client
+        self._credential = credential
+        self._agent = agent
+        self._interval = interval
+        self._jitter = jitter
+        self._timeout = timeout
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        state.probing = True
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        state.probing = False
+
+    async def probe(self) -> None:
+        """Refresh the token, then check the upstream unless a request reached it within the interval."""
+        if state.provisioning == "incomplete":
+            try:
+                await asyncio.wait_for(self._check_search_index(), self._timeout)
+            except Exception as e:
+                logger.warning(f"Health probe failed to check the search index: {e}")
+        try:
+            token = await asyncio.wait_for(self._credential.get_token(TOKEN_SCOPE), self._timeout)
+            state.token_expires_on = token.expires_on
+        except Exception as e:
+            logger.warning(f"Health probe failed to get a credential token: {e}")
+        if time.monotonic() - state.last_upstream_success < self._interval:
+            return
+        try:
+            await asyncio.wait_for(self._project_client.agents.get_version(self._agent.name, self._agent.version),
+                                   self._timeout)
+            record_upstream_success()
+        except Exception as e:
+            logger.warning(f"Health probe failed to reach the agent service: {e}")
+
+    async def _check_search_index(self) -> None:
+        """Complete the provisioning, which did not wait until the search index was populated, once it is."""
+        from .indexer_monitor import IndexerMonitor
+        from .search_index_manager import get_indexer_names
+
+        index_name = os.getenv("AZURE_AI_SEARCH_INDEX_NAME", "index-sample")
+        monitor = IndexerMonitor(os.environ["AZURE_AI_SEARCH_ENDPOINT"], self._credential, index_name,
+                                 get_indexer_names(index_name))
+        progress = await monitor.get_progress()
+        if progress.chunk_count >= int(os.getenv("AZURE_AI_SEARCH_MIN_DOCUMENTS", "0")):
+            state.provisioning = "done"
+            logger.info(f"Search index '{index_name}' is populated, the provisioning is done.")
+
+    async def _run(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(self._interval * random.uniform(1 - self._jitter, 1 + self._jitter))
+
+
+def start_health_prober(app: fastapi.FastAPI) -> Optional[HealthProber]:
+    """
+    Record the state of the worker and start its prober, configured by APP_HEALTH_PROBE_INTERVAL_SECONDS
+    (0 disables it), APP_HEALTH_PROBE_JITTER and APP_HEALTH_PROBE_TIMEOUT_SECONDS.
+    """
+    state.agent_loaded = app.state.agent_version_details is not None
+    state.provisioning = os.getenv("APP_PROVISIONING_STATE", "unmanaged")
+    interval = float(os.getenv("APP_HEALTH_PROBE_INTERVAL_SECONDS", str(DEFAULT_INTERVAL_SECONDS)))
+    if interval <= 0:
+        return None
+    prober = HealthProber(
+        app.state.ai_project,
+        app.state.credential,
+        app.state.agent_version_details,
+        interval=interval,
+        jitter=float(os.getenv("APP_HEALTH_PROBE_JITTER", str(DEFAULT_JITTER))),
+        timeout=float(os.getenv("APP_HEALTH_PROBE_TIMEOUT_SECONDS", str(DEFAULT_TIMEOUT_SECONDS))),
+    )
+    prober.start()
+    return prober
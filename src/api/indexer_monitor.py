@@ -0,0 +1,228 @@
+from typing import AsyncGenerator, Dict, List, Optional
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+import asyncio
+import logging
+import time
+
+from azure.core.credentials_async import AsyncTokenCredential
+from azure.core.exceptions import HttpResponseError
+from azure.search.documents.indexes.aio import SearchIndexClient, SearchIndexerClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IndexerProgress:
+    """Progress of the current or last run of an indexer."""
+    indexer_name: str
+    status: str
+    items_processed: int = 0
+    items_failed: int = 0
+    elapsed_seconds: float = 0.0
+    documents_per_second: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def running(self) -> bool:
+        return self.status in ("inProgress", "reset")
+
+
+@dataclass
+class IndexProgress:
+    """Progress of the indexers writing to an index together with the index statistics."""
+    index_name: str
+    chunk_count: int = 0
+    vector_index_size_bytes: int = 0
+    indexers: List[IndexerProgress] = field(default_factory=list)
+
+    @property
+    def running(self) -> bool:
+        return any(indexer.running for indexer in self.indexers)
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["running"] = self.running
+        return data
+
+
+@dataclass
+class ReindexReport:
+    """
+    Reuse of the enrichment cache by the last run of an indexer.
+
+    The service does not report cache hits, so the number of reused enrichments is estimated as the
+    difference between the largest run in the execution history (a full run) and the documents
+    recomputed by the last run.
+    """
+    indexer_name: str
+    status: str
+    recomputed_documents: int = 0
+    reused_documents: int = 0
+    failed_documents: int = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        total = self.recomputed_documents + self.reused_documents
+        return self.reused_documents / total if total else 0.0
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["reuse_ratio"] = self.reuse_ratio
+        return data
+
+
+class IndexerMonitor:
+    """
+    Monitor of the indexer runs, polling the status with an adaptive backoff.
+
+    :param endpoint: The search endpoint to be used.
+    :param credential: The credential to be used for the search.
+    :param index_name: The name of the index the indexers write to.
+    :param indexer_names: The names of the indexers to monitor.
+    """
+
+    MIN_POLL_INTERVAL_SECONDS = 2.0
+    MAX_POLL_INTERVAL_SECONDS = 30.0
+
+    def __init__(
+        self,
+        endpoint: str,
+        credential: AsyncTokenCredential,
+        index_name: str,
+        indexer_names: List[str],
+    ) -> None:
+        """Constructor."""
+        self._endpoint = endpoint
+        self._credential = credential
+        self._index_name = index_name
+        self._indexer_names = indexer_names
+
+    async def get_progress(self) -> IndexProgress:
+        """
+        Get the progress of the indexers and the statistics of the index.
+
+        :return: The progress of the indexers.
+        """
+        progress = IndexProgress(index_name=self._index_name)
+        async with SearchIndexerClient(endpoint=self._endpoint, credential=self._credential) as indexer_client:
+            for indexer_name in self._indexer_names:
+                try:
+                    status = await indexer_client.get_indexer_status(indexer_name)
+                    progress.indexers.append(_to_indexer_progress(indexer_name, status))
+                except HttpResponseError as e:
+                    logger.warning(f"Failed to get status of indexer '{indexer_name}': {e}")
+                    progress.indexers.append(IndexerProgress(indexer_name=indexer_name, status="unknown", errors=[str(e)]))
+        async with SearchIndexClient(endpoint=self._endpoint, credential=self._credential) as ix_client:
+            try:
+                statistics = await ix_client.get_index_statistics(self._index_name)
+                progress.chunk_count = get_statistic(statistics, "document_count")
+                progress.vector_index_size_bytes = get_statistic(statistics, "vector_index_size")
+            except HttpResponseError as e:
+                logger.warning(f"Failed to get statistics of index '{self._index_name}': {e}")
+        return progress
+
+    async def get_reindex_reports(self) -> List[ReindexReport]:
+        """
+        Get the reports of the enrichments reused from the cache and recomputed by the last runs.
+
+        :return: The report for every indexer, which has run.
+        """
+        reports = []
+        async with SearchIndexerClient(endpoint=self._endpoint, credential=self._credential) as indexer_client:
+            for indexer_name in self._indexer_names:
+                status = await indexer_client.get_indexer_status(indexer_name)
+                if status.last_result is None:
+                    continue
+                recomputed = status.last_result.item_count or 0
+                full_run = max([run.item_count or 0 for run in status.execution_history or []] + [recomputed])
+                reports.append(ReindexReport(
+                    indexer_name=indexer_name,
+                    status=status.last_result.status,
+                    recomputed_documents=recomputed,
+                    reused_documents=full_run - recomputed,
+                    failed_documents=status.last_result.failed_item_count or 0,
+                ))
+        return reports
+
+    async def watch(
+        self,
+        min_interval: float = MIN_POLL_INTERVAL_SECONDS,
+        max_interval: float = MAX_POLL_INTERVAL_SECONDS,
+        until_idle: bool = True,
+    ) -> AsyncGenerator[IndexProgress, None]:
+        """
+        Poll the progress, backing off while it does not change.
+
+        The interval is reset to min_interval whenever the number of processed items or chunks changes
+        and doubled up to max_interval otherwise.
+
+        :param min_interval: The minimal polling interval in seconds.
+        :param max_interval: The maximal polling interval in seconds.
+        :param until_idle: Stop when none of the indexers is running.
+        :return: The generator of the progress snapshots.
+        """
+        interval = min_interval
+        last_key = None
+        while True:
+            progress = await self.get_progress()
+            yield progress
+            if until_idle and not progress.running:
+                return
+            key = (progress.chunk_count, tuple((i.items_processed, i.items_failed, i.status) for i in progress.indexers))
+            interval = min_interval if key != last_key else min(interval * 2, max_interval)
+            last_key = key
+            await asyncio.sleep(interval)
+
+    async def wait_for_documents(self, min_documents: int, timeout: float) -> bool:
+        """
+        Wait until the index contains at least min_documents chunks.
+
+        :param min_documents: The minimal number of chunks in the index.
+        :param timeout: The maximal time to wait in seconds.
+        :return: True if the index was populated in time.
+        """
+        deadline = time.monotonic() + timeout
+        async for progress in self.watch(until_idle=False):
+            _log_progress(progress)
+            if progress.chunk_count >= min_documents:
+                return True
+            if not progress.running and any(i.status in ("error", "transientFailure") for i in progress.indexers):
+                logger.error(f"Indexers of '{self._index_name}' failed before {min_documents} chunks were indexed.")
+                return False
+            if time.monotonic() >= deadline:
+                return False
+
+
+def get_statistic(statistics, name: str) -> int:
+    """Read the index statistic from the model (azure-search-documents 12) or from the dict (11.x)."""
+    value = statistics.get(name) if isinstance(statistics, dict) else getattr(statistics, name, None)
+    return value or 0
+
+
+def _to_indexer_progress(indexer_name: str, status) -> IndexerProgress:
+    """Convert the SearchIndexerStatus to the progress of the last run."""
+    result = status.last_result
+    if result is None:
+        return IndexerProgress(indexer_name=indexer_name, status=status.status or "unknown")
+    end_time: Optional[datetime] = result.end_time or datetime.now(timezone.utc)
+    elapsed = (end_time - result.start_time).total_seconds() if result.start_time else 0.0
+    processed = result.item_count or 0
+    return IndexerProgress(
+        indexer_name=indexer_name,
+        status=result.status,
+        items_processed=processed,
+        items_failed=result.failed_item_count or 0,
+        elapsed_seconds=elapsed,
+        documents_per_second=processed / elapsed if elapsed > 0 else 0.0,
+        errors=[error.error_message for error in (result.errors or [])][:10],
+    )
+
+
+def _log_progress(progress: IndexProgress) -> None:
+    for indexer in progress.indexers:
+        logger.info(
+            f"Indexer '{indexer.indexer_name}': {indexer.status}, {indexer.items_processed} processed, "
+            f"{indexer.items_failed} failed, {indexer.documents_per_second:.2f} docs/s")
+    logger.info(f"Index '{progress.index_name}': {progress.chunk_count} chunks, "
+                f"{progress.vector_index_size_bytes} bytes of vector index")
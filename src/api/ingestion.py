@@ -0,0 +1,174 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+import logging
+import multiprocessing
+import os
+import time
+
+from .chunking import DEFAULT_MAX_PAGE_LENGTH, DEFAULT_PAGE_OVERLAP_LENGTH, iter_document_paths, read_document_pages, split_pages
+
+logger = logging.getLogger(__name__)
+
+# The number of documents parsed ahead of the consumer per worker process; it bounds the memory of the pipeline.
+DEFAULT_PENDING_PER_WORKER = 4
+
+
+@dataclass
+class ChunkRecord:
+    """A chunk of a document, with the file name of the document as its title, as set by the indexers."""
+    title: str
+    chunk: str
+    path: str
+    chunk_index: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class IngestionReport:
+    """The statistics of an ingestion, updated while the chunks are consumed."""
+    documents: int = 0
+    failed_documents: int = 0
+    pages: int = 0
+    chunks: int = 0
+    characters: int = 0
+    workers: int = 0
+    seconds: float = 0.0
+    failures: List[str] = field(default_factory=list)
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds if self.seconds else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = asdict(self)
+        result["pages_per_second"] = round(self.pages_per_second, 1)
+        result["chunks_per_second"] = round(self.chunks_per_second, 1)
+        return result
+
+
+def parse_document(path: str, max_page_length: int, page_overlap_length: int) -> Tuple[int, List[str]]:
+    """
+    Read and split a document; run in the worker processes.
+
+    :return: The number of pages of the document (1 for a text file) and its chunks.
+    """
+    pages = read_document_pages(path)
+    return len(pages), split_pages("\n".join(pages), max_page_length, page_overlap_length)
+
+
+def ingest_directory(
+    directory: str,
+    max_page_length: int = DEFAULT_MAX_PAGE_LENGTH,
+    page_overlap_length: int = DEFAULT_PAGE_OVERLAP_LENGTH,
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    report: Optional[IngestionReport] = None,
+) -> Iterator[ChunkRecord]:
+    """
+    Parse and chunk the documents of the directory and of its subdirectories in a process pool.
+
+    The PDF text extraction is CPU bound, so the documents are parsed and split in parallel worker processes,
+    like the split skill of the indexers in pages mode. At most max_pending documents are parsed ahead of
+    the consumer, so the memory does not depend on the size of the corpus. The chunks are yielded in the
+    order of the documents, like by chunking.iter_chunks; the documents, which can not be read, are skipped
+    with an error.
+
+    :param directory: The directory with the .md, .txt and .pdf documents.
+    :param max_page_length: The maximal number of characters in a chunk.
+    :param page_overlap_length: The number of characters repeated from the end of the previous chunk.
+    :param max_workers: The number of worker processes, the number of CPUs by default; 0 parses in this process.
+    :param max_pending: The maximal number of documents parsed ahead, DEFAULT_PENDING_PER_WORKER per worker by default.
+    :param report: The report to update with the statistics of the ingestion.
+    :return: The generator of the chunk records.
+    """
+    report = report if report is not None else IngestionReport()
+    workers = (os.cpu_count() or 1) if max_workers is None else max(0, max_workers)
+    report.workers = workers
+    start = time.perf_counter()
+    paths = iter_document_paths(directory)
+    try:
+        if workers == 0:
+            for path in paths:
+                yield from _get_records(path, _parse_safely(path, max_page_length, page_overlap_length), report)
+                report.seconds = time.perf_counter() - start
+            return
+
+        max_pending = max(1, max_pending or workers * DEFAULT_PENDING_PER_WORKER)
+        # Spawn the workers, so they do not inherit the threads and the locks of the app.
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        pending: deque = deque()
+        try:
+            for path in paths:
+                pending.append((path, executor.submit(parse_document, path, max_page_length, page_overlap_length)))
+                if len(pending) >= max_pending:
+                    yield from _get_records(*_get_result(*pending.popleft()), report)
+                    report.seconds = time.perf_counter() - start
+            while pending:
+                yield from _get_records(*_get_result(*pending.popleft()), report)
+                report.seconds = time.perf_counter() - start
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        report.seconds = time.perf_counter() - start
+        logger.info(f"Ingested {report.documents} document(s) ({report.failed_documents} failed) of '{directory}' "
+                    f"with {workers} worker(s): {report.pages} page(s), {report.chunks} chunk(s) "
+                    f"in {report.seconds:.2f}s, {report.pages_per_second:.1f} pages/s.")
+
+
+def _parse_safely(path: str, max_page_length: int, page_overlap_length: int) -> Any:
+    try:
+        return parse_document(path, max_page_length, page_overlap_length)
+    except Exception as e:
+        return e
+
+
+def _get_result(path: str, future: Future) -> Tuple[str, Any]:
+    try:
+        return path, future.result()
+    except Exception as e:
+        return path, e
+
+
+def _get_records(path: str, result: Any, report: IngestionReport) -> Iterator[ChunkRecord]:
+    if isinstance(result, Exception):
+        logger.error(f"Failed to read '{path}': {result}")
+        report.failed_documents += 1
+        report.failures.append(path)
+        return
+    pages, chunks = result
+    report.documents += 1
+    report.pages += pages
+    report.chunks += len(chunks)
+    title = os.path.basename(path)
+    for index, chunk in enumerate(chunks):
+        report.characters += len(chunk)
+        yield ChunkRecord(title=title, chunk=chunk, path=path, chunk_index=index)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Parse and chunk the documents of a directory and write the chunks as JSON lines.")
+    parser.add_argument("input", help="The directory with the documents.")
+    parser.add_argument("output", help="The JSON lines file of the chunks.")
+    parser.add_argument("--max-page-length", type=int, default=DEFAULT_MAX_PAGE_LENGTH)
+    parser.add_argument("--page-overlap-length", type=int, default=DEFAULT_PAGE_OVERLAP_LENGTH)
+    parser.add_argument("--workers", type=int, default=None, help="The number of worker processes (0: in this process).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    ingestion_report = IngestionReport()
+    with open(args.output, "w", encoding="utf-8") as f:
+        for record in ingest_directory(args.input, args.max_page_length, args.page_overlap_length,
+                                       args.workers, report=ingestion_report):
+            f.write(json.dumps(record.to_dict()) + "\n")
+    print(json.dumps(ingestion_report.to_dict(), indent=2))
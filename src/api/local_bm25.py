@@ -0,0 +1,145 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import array
+import logging
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+# The rank constant of the reciprocal rank fusion, as used by AI Search for the hybrid queries.
+DEFAULT_RRF_K = 60
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split the text to lowercase word tokens."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    The compact in-memory inverted index with the BM25 scoring of the chunks.
+
+    The postings are stored in CSR layout: the chunk ids and the term frequencies of all the terms are
+    concatenated in two arrays, and the postings of the term t are the slice indptr[t]:indptr[t + 1].
+    The IDF of the terms and the length normalization of the chunks are precomputed, so a query only
+    gathers and adds the posting arrays of its terms.
+
+    :param texts: The texts of the chunks, in the order of their ids.
+    :param k1: The term frequency saturation of BM25.
+    :param b: The length normalization of BM25.
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> None:
+        """Constructor."""
+        start = time.perf_counter()
+        self._vocabulary: Dict[str, int] = {}
+        term_ids = array.array("i")
+        doc_ids = array.array("i")
+        frequencies = array.array("i")
+        lengths = array.array("i")
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                term_ids.append(self._vocabulary.setdefault(term, len(self._vocabulary)))
+                doc_ids.append(doc_id)
+                frequencies.append(frequency)
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        # The postings are grouped by term; the stable sort keeps the chunk ids of a term in ascending order.
+        order = np.argsort(term_ids, kind="stable")
+        self._doc_ids = np.frombuffer(doc_ids, dtype=np.int32)[order]
+        self._frequencies = np.frombuffer(frequencies, dtype=np.int32)[order].astype(np.float32)
+        document_frequencies = np.bincount(term_ids, minlength=len(self._vocabulary))
+        self._indptr = np.zeros(len(self._vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequencies, out=self._indptr[1:])
+
+        self._lengths = np.frombuffer(lengths, dtype=np.int32).astype(np.float32)
+        count = len(self._lengths)
+        average_length = float(self._lengths.mean()) if count else 0.0
+        self._k1 = k1
+        self._idf = np.log1p((count - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+        self._length_norms = (k1 * (1 - b + b * self._lengths / max(average_length, 1e-9))).astype(np.float32)
+        logger.info(f"Built the BM25 index of {count} chunk(s) with {len(self._vocabulary)} term(s) "
+                    f"in {time.perf_counter() - start:.2f}s.")
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._vocabulary)
+
+    @property
+    def postings_count(self) -> int:
+        return len(self._doc_ids)
+
+    @property
+    def array_bytes(self) -> int:
+        """The memory of the posting and chunk arrays, without the vocabulary dictionary."""
+        arrays = (self._doc_ids, self._frequencies, self._indptr, self._lengths, self._idf, self._length_norms)
+        return sum(a.nbytes for a in arrays)
+
+    def get_scores(self, query: str) -> np.ndarray:
+        """
+        Score all the chunks for the query.
+
+        :param query: The query text.
+        :return: The BM25 scores of the chunks; the chunks without a query term score 0.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term, count in Counter(tokenize(query)).items():
+            term_id = self._vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self._indptr[term_id], self._indptr[term_id + 1]
+            doc_ids = self._doc_ids[start:end]
+            frequencies = self._frequencies[start:end]
+            scores[doc_ids] += count * self._idf[term_id] * frequencies * (self._k1 + 1) / (frequencies + self._length_norms[doc_ids])
+        return scores
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the chunks with the highest BM25 scores for the query.
+
+        :param query: The query text.
+        :param top_k: The maximal number of chunks to return.
+        :return: The ids and the scores of the chunks, which contain a query term, by descending score.
+        """
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self.get_scores(query)
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(scores[candidates], -top_k)[-top_k:]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return candidates, scores[candidates]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]],
+    top_k: int,
+    k: int = DEFAULT_RRF_K,
+    weights: Optional[Sequence[float]] = None,
+) -> List[Tuple[int, float]]:
+    """
+    Fuse the rankings with the reciprocal rank fusion: every ranking adds weight / (k + rank) to its ids.
+
+    :param rankings: The ids of every ranking by descending relevance.
+    :param top_k: The number of fused ids to return.
+    :param k: The rank constant, which lowers the weight of the first ranks.
+    :param weights: The weights of the rankings, 1 by default.
+    :return: The ids and the fused scores by descending score.
+    """
+    fused: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, item in enumerate(ranking, start=1):
+            fused[int(item)] = fused.get(int(item), 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])[:max(top_k, 0)]
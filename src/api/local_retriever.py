@@ -0,0 +1,215 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, asdict
+import logging
+import time
+
+import numpy as np
+
+from .local_bm25 import DEFAULT_RRF_K, BM25Index, reciprocal_rank_fusion
+from .embedding_store import EmbeddingStore, get_or_convert_embedding_store, is_embedding_store, iter_embeddings_csv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 5
+# The number of candidates of every ranking fused by the hybrid search, as retrieved by AI Search.
+DEFAULT_HYBRID_CANDIDATES = 50
+# The scores of a query batch are computed in blocks of at most this many floats, to bound the memory.
+DEFAULT_MAX_BLOCK_SCORES = 16 * 1024 * 1024
+# The vectors, whose norms differ from 1 by less than this, are used as they are, without a normalized copy.
+_NORM_TOLERANCE = 1e-3
+
+
+@dataclass
+class RetrievedChunk:
+    """A chunk found by the local retriever, with its cosine similarity to the query."""
+    index: int
+    score: float
+    title: str
+    chunk: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class LocalRetriever:
+    """
+    The in-process top-k cosine retriever over a matrix of embeddings.
+
+    The vectors are kept as a contiguous float32 matrix of unit rows, so a query batch is scored by
+    one matrix product and the top k of every query are selected with argpartition before only those
+    are sorted. The unit float32 vectors of a memory-mapped embedding store are used without a copy,
+    so the workers forked after the load share them.
+
+    :param vectors: The matrix of the embeddings, one row per chunk.
+    :param get_chunk: The function returning the text of the chunk of a row.
+    :param get_title: The function returning the title of the chunk of a row.
+    :param max_block_scores: The maximal number of scores computed at once for a query batch.
+    """
+
+    def __init__(
+            self,
+            vectors: np.ndarray,
+            get_chunk: Callable[[int], str],
+            get_title: Callable[[int], str],
+            max_block_scores: int = DEFAULT_MAX_BLOCK_SCORES,
+        ) -> None:
+        """Constructor."""
+        if vectors.ndim != 2:
+            raise ValueError(f"The vectors must be a matrix, got {vectors.ndim} dimension(s).")
+        self._matrix = _normalize(vectors)
+        self._get_chunk = get_chunk
+        self._get_title = get_title
+        self._max_block_scores = max(1, max_block_scores)
+        self._keyword_index: Optional[BM25Index] = None
+
+    @classmethod
+    def from_store(cls, store: EmbeddingStore, **kwargs) -> "LocalRetriever":
+        """Create the retriever over the vectors of the binary embedding store."""
+        return cls(store.vectors, store.get_chunk, store.get_title, **kwargs)
+
+    @classmethod
+    def from_embeddings(cls, path: str, store_path: Optional[str] = None, **kwargs) -> "LocalRetriever":
+        """
+        Create the retriever over the binary embedding store or the embeddings CSV file.
+
+        :param path: The store directory or the CSV file.
+        :param store_path: The store directory, to which the CSV file is converted if it is missing or stale.
+                           If None, the CSV file is parsed into memory.
+        :return: The retriever.
+        """
+        start = time.perf_counter()
+        if is_embedding_store(path):
+            retriever = cls.from_store(EmbeddingStore(path), **kwargs)
+        elif store_path:
+            retriever = cls.from_store(get_or_convert_embedding_store(path, store_path), **kwargs)
+        else:
+            chunks = list(iter_embeddings_csv(path))
+            vectors = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32).reshape(len(chunks), -1)
+            retriever = cls(vectors, lambda index: chunks[index].chunk, lambda index: chunks[index].title, **kwargs)
+        logger.info(f"Loaded {len(retriever)} chunk(s) with {retriever.dimensions} dimensions from '{path}' "
+                    f"for the local retriever in {time.perf_counter() - start:.2f}s.")
+        return retriever
+
+    @property
+    def dimensions(self) -> int:
+        return int(self._matrix.shape[1])
+
+    def __len__(self) -> int:
+        return int(self._matrix.shape[0])
+
+    @property
+    def keyword_index(self) -> Optional[BM25Index]:
+        return self._keyword_index
+
+    def build_keyword_index(self, **kwargs) -> BM25Index:
+        """Build the BM25 index over the text of the chunks, used by the keyword and the hybrid search."""
+        self._keyword_index = BM25Index((self._get_chunk(index) for index in range(len(self))), **kwargs)
+        return self._keyword_index
+
+    def search_keyword(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[RetrievedChunk]:
+        """
+        Find the chunks with the highest BM25 scores for the query text.
+
+        :param query: The query text.
+        :param top_k: The maximal number of chunks to return.
+        :return: The chunks, which contain a query term, by descending BM25 score.
+        """
+        indices, scores = self._get_keyword_index().search(query, top_k)
+        return [self._get_retrieved(index, score) for index, score in zip(indices, scores)]
+
+    def search_hybrid(
+        self,
+        query: str,
+        vector: Sequence[float],
+        top_k: int = DEFAULT_TOP_K,
+        candidates: int = DEFAULT_HYBRID_CANDIDATES,
+        rrf_k: int = DEFAULT_RRF_K,
+    ) -> List[RetrievedChunk]:
+        """
+        Fuse the vector and the keyword rankings of the query with the reciprocal rank fusion.
+
+        :param query: The query text, ranked by BM25.
+        :param vector: The embedding of the query, ranked by the cosine similarity.
+        :param top_k: The number of chunks to return.
+        :param candidates: The number of chunks taken from each ranking.
+        :param rrf_k: The rank constant of the fusion.
+        :return: The chunks by descending fused score, which is returned as their score.
+        """
+        vector_indices, _ = self.search_indices([vector], max(candidates, top_k))
+        keyword_indices, _ = self._get_keyword_index().search(query, max(candidates, top_k))
+        fused = reciprocal_rank_fusion([vector_indices[0], keyword_indices], top_k, k=rrf_k)
+        return [self._get_retrieved(index, score) for index, score in fused]
+
+    def _get_keyword_index(self) -> BM25Index:
+        if self._keyword_index is None:
+            raise ValueError("The keyword index of the local retriever is not built.")
+        return self._keyword_index
+
+    def _get_retrieved(self, index: int, score: float) -> RetrievedChunk:
+        return RetrievedChunk(index=int(index), score=float(score), title=self._get_title(int(index)),
+                              chunk=self._get_chunk(int(index)))
+
+    def search(self, query: Sequence[float], top_k: int = DEFAULT_TOP_K) -> List[RetrievedChunk]:
+        """
+        Find the chunks most similar to the query.
+
+        :param query: The embedding of the query.
+        :param top_k: The number of chunks to return.
+        :return: The chunks by descending cosine similarity.
+        """
+        return self.search_batch([query], top_k)[0]
+
+    def search_batch(self, queries: Sequence[Sequence[float]], top_k: int = DEFAULT_TOP_K) -> List[List[RetrievedChunk]]:
+        """
+        Find the chunks most similar to every query of the batch.
+
+        :param queries: The embeddings of the queries, one per row.
+        :param top_k: The number of chunks to return per query.
+        :return: The chunks of every query by descending cosine similarity.
+        """
+        indices, scores = self.search_indices(queries, top_k)
+        return [
+            [self._get_retrieved(index, score) for index, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def search_indices(self, queries: Sequence[Sequence[float]], top_k: int = DEFAULT_TOP_K) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows most similar to every query of the batch, without reading the chunks.
+
+        :param queries: The embeddings of the queries, one per row.
+        :param top_k: The number of rows to return per query.
+        :return: The matrices of the row indices and of the cosine similarities, both of shape (queries, k),
+                 by descending similarity.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if queries.shape[1] != self.dimensions:
+            raise ValueError(f"The queries have {queries.shape[1]} dimensions, expected {self.dimensions}.")
+        k = max(0, min(top_k, len(self)))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        if k == 0:
+            return indices, scores
+
+        block = max(1, self._max_block_scores // max(1, len(self)))
+        for start in range(0, len(queries), block):
+            block_scores = queries[start:start + block] @ self._matrix.T
+            if k < len(self):
+                top = np.argpartition(block_scores, -k, axis=1)[:, -k:]
+            else:
+                top = np.broadcast_to(np.arange(len(self)), block_scores.shape)
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            indices[start:start + block] = np.take_along_axis(top, order, axis=1)
+            scores[start:start + block] = np.take_along_axis(top_scores, order, axis=1)
+        return indices, scores
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Get the contiguous float32 matrix of unit rows, reusing the vectors if they are one already."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True).astype(np.float32)
+    if (vectors.dtype == np.float32 and vectors.flags["C_CONTIGUOUS"]
+            and np.all(np.abs(norms - 1) < _NORM_TOLERANCE)):
+        return vectors
+    norms[norms == 0] = 1
+    return np.ascontiguousarray(vectors, dtype=np.float32) / norms
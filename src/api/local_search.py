@@ -0,0 +1,184 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import fastapi
+from fastapi import Request, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from azure.ai.projects.models import FunctionTool
+from openai import AsyncOpenAI
+
+from util import get_cache_dir
+
+from .embedding_store import DEFAULT_EMBEDDINGS_FILE
+from .local_retriever import DEFAULT_TOP_K, LocalRetriever, RetrievedChunk
+from .routes import auth_dependency, get_openai_client, logger
+
+LOCAL_SEARCH_TOOL_NAME = "search_local_corpus"
+MAX_TOP_K = 50
+# The query types of the local search, named like the query types of the AI Search tool.
+QUERY_TYPES = ("simple", "vector", "vector_simple_hybrid")
+
+# The local search works without AI Search, so it follows the authentication of the chat endpoints.
+router = fastapi.APIRouter(prefix="/search", dependencies=[auth_dependency] if auth_dependency else [])
+
+
+def load_local_retriever() -> LocalRetriever:
+    """
+    Load the local retriever over LOCAL_RETRIEVER_EMBEDDINGS_FILE (default: the sample embeddings).
+
+    An embeddings CSV file is converted once to the binary store in APP_CACHE_DIR, which is memory-mapped,
+    so the workers forked from the preloading process share the vectors.
+    """
+    path = os.getenv("LOCAL_RETRIEVER_EMBEDDINGS_FILE", DEFAULT_EMBEDDINGS_FILE)
+    retriever = LocalRetriever.from_embeddings(path, store_path=os.path.join(get_cache_dir(), "local_retriever_store"))
+    if os.getenv("LOCAL_RETRIEVER_KEYWORD_INDEX", "true").lower() == "true":
+        retriever.build_keyword_index()
+    return retriever
+
+
+def get_default_query_type() -> str:
+    """Get the query type of the local search from LOCAL_RETRIEVER_QUERY_TYPE (default: vector)."""
+    query_type = os.getenv("LOCAL_RETRIEVER_QUERY_TYPE", "vector").lower()
+    if query_type not in QUERY_TYPES:
+        raise ValueError(f"Unsupported LOCAL_RETRIEVER_QUERY_TYPE '{query_type}', expected one of {QUERY_TYPES}.")
+    return query_type
+
+
+def get_local_retriever(request: Request) -> LocalRetriever:
+    retriever = getattr(request.app.state, "local_retriever", None)
+    if retriever is None:
+        raise HTTPException(status_code=404, detail="The local retriever is not enabled.")
+    return retriever
+
+
+def get_local_search_tool() -> FunctionTool:
+    """Get the definition of the function tool, with which the agent searches the local corpus."""
+    return FunctionTool(
+        name=LOCAL_SEARCH_TOOL_NAME,
+        description="Search the product information documents for the chunks most relevant to the query.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "The search query."},
+                "top_k": {"type": "integer", "description": f"The number of chunks to return, at most {MAX_TOP_K}."},
+            },
+            "required": ["query"],
+            "additionalProperties": False,
+        },
+        strict=False,
+    )
+
+
+async def embed_queries(openai_client: AsyncOpenAI, queries: List[str], dimensions: int) -> List[List[float]]:
+    """Embed the queries with the AZURE_AI_EMBED_DEPLOYMENT_NAME deployment to the dimensions of the corpus."""
+    response = await openai_client.embeddings.create(
+        input=queries,
+        model=os.getenv("AZURE_AI_EMBED_DEPLOYMENT_NAME", "text-embedding-3-small"),
+        dimensions=dimensions,
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def clamp_top_k(top_k: Any) -> int:
+    """Limit the number of chunks requested by the client or the agent to [1, MAX_TOP_K]."""
+    return max(1, min(int(top_k), MAX_TOP_K))
+
+
+async def search_local_corpus(
+    openai_client: AsyncOpenAI,
+    retriever: LocalRetriever,
+    queries: List[str],
+    top_k: int = DEFAULT_TOP_K,
+    query_type: Optional[str] = None,
+) -> List[List[RetrievedChunk]]:
+    """
+    Find the chunks of the local corpus most relevant to the queries.
+
+    The queries are embedded unless the query type is simple (BM25 only); the hybrid query type fuses
+    the vector and the BM25 rankings. The scoring runs in a worker thread, so a large corpus does not
+    block the event loop.
+
+    :param query_type: One of QUERY_TYPES, LOCAL_RETRIEVER_QUERY_TYPE by default.
+    :raises ValueError: If the query type is unsupported or needs the keyword index, which was not built.
+    """
+    query_type = query_type or get_default_query_type()
+    if query_type not in QUERY_TYPES:
+        raise ValueError(f"Unsupported query type '{query_type}', expected one of {QUERY_TYPES}.")
+    top_k = clamp_top_k(top_k)
+    if query_type == "simple":
+        return await asyncio.to_thread(lambda: [retriever.search_keyword(query, top_k) for query in queries])
+
+    vectors = await embed_queries(openai_client, queries, retriever.dimensions)
+    if query_type == "vector":
+        return await asyncio.to_thread(retriever.search_batch, vectors, top_k)
+    return await asyncio.to_thread(
+        lambda: [retriever.search_hybrid(query, vector, top_k) for query, vector in zip(queries, vectors)])
+
+
+async def call_function_tool(openai_client: AsyncOpenAI, retriever: Optional[LocalRetriever], name: str, arguments: str) -> str:
+    """
+    Run the function tool called by the agent.
+
+    :return: The JSON output of the function, or the JSON error, which is returned to the agent.
+    """
+    if name != LOCAL_SEARCH_TOOL_NAME or retriever is None:
+        logger.error(f"The agent called the unavailable function '{name}'.")
+        return json.dumps({"error": f"The function '{name}' is not available."})
+    try:
+        parsed = json.loads(arguments or "{}")
+        results = await search_local_corpus(
+            openai_client, retriever, [parsed["query"]], int(parsed.get("top_k") or DEFAULT_TOP_K))
+        return json.dumps([
+            {"title": result.title, "chunk": result.chunk, "score": round(result.score, 4)}
+            for result in results[0]
+        ])
+    except Exception as e:
+        logger.error(f"Error calling the function '{name}': {e}")
+        return json.dumps({"error": str(e)})
+
+
+@router.post("/local")
+async def local_search(
+    request: Request,
+    retriever: LocalRetriever = Depends(get_local_retriever),
+):
+    """
+    Find the chunks of the local corpus most similar to the queries.
+
+    The body has either "query" (a string), "queries" (a list of strings, embedded in one request) or
+    "vectors" (a list of embeddings), and optionally "top_k" and "query_type" (one of QUERY_TYPES, ignored
+    for vectors). The results are returned per query.
+    """
+    try:
+        body: Dict[str, Any] = await request.json()
+        top_k = clamp_top_k(body.get("top_k", DEFAULT_TOP_K))
+        query_type = body.get("query_type") or get_default_query_type()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON in request: {e}")
+    if query_type not in QUERY_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported query type '{query_type}', expected one of {QUERY_TYPES}.")
+
+    try:
+        if body.get("vectors") is not None:
+            results = await asyncio.to_thread(retriever.search_batch, body["vectors"], top_k)
+        else:
+            queries = body.get("queries") or ([body["query"]] if body.get("query") else [])
+            if not queries:
+                raise HTTPException(status_code=400, detail="The request needs a query, queries or vectors.")
+            if query_type == "simple":
+                # The keyword search does not embed the queries.
+                results = await search_local_corpus(None, retriever, queries, top_k, query_type)
+            else:
+                async with get_openai_client(request) as openai_client:
+                    results = await search_local_corpus(openai_client, retriever, queries, top_k, query_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return JSONResponse(content={
+        "results": [[result.to_dict() for result in query_results] for query_results in results]
+    })
@@ -0,0 +1,180 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Optional, Tuple
+
+import fastapi
+
+from .routes import logger
+
+DEFAULT_INTERVAL_MS = 100.0
+DEFAULT_SLOW_CALLBACK_MS = 250.0
+DEFAULT_MAX_LOGS_PER_MINUTE = 6
+DEFAULT_EXPORT_INTERVAL_SECONDS = 10.0
+# The lags kept between two exports, at most.
+MAX_SAMPLES = 10000
+
+
+def loop_monitor_enabled() -> bool:
+    return os.getenv("ENABLE_LOOP_MONITOR", "false").lower() == "true"
+
+
+@dataclass
+class LoopLagSnapshot:
+    """The scheduling lag of the event loop measured by the heartbeat since the previous snapshot, in seconds."""
+    samples: int
+    p50: float
+    p99: float
+    max: float
+    slow_callbacks: int
+
+
+class LoopMonitor:
+    """
+    Measure the scheduling lag of the event loop and log the stack of the code blocking it.
+
+    A heartbeat task sleeps for the interval and measures how late it wakes up. A watchdog thread checks whether
+    the heartbeat is overdue by the slow callback threshold, and captures the stack of the event loop thread while
+    it is still blocked; the heartbeat then logs the stall with that stack. At most max_logs_per_minute stalls are
+    logged, the others are counted in the next log.
+
+    :param interval_ms: The interval of the heartbeat.
+    :param slow_callback_ms: The lag, from which the loop is reported as blocked.
+    :param max_logs_per_minute: The maximal number of logged stalls per minute.
+    :param on_snapshot: Called with the snapshot of the lags every export_interval seconds, e.g. to export metrics.
+    :param export_interval: The interval of the snapshots in seconds.
+    """
+
+    def __init__(
+        self,
+        interval_ms: float = DEFAULT_INTERVAL_MS,
+        slow_callback_ms: float = DEFAULT_SLOW_CALLBACK_MS,
+        max_logs_per_minute: int = DEFAULT_MAX_LOGS_PER_MINUTE,
+        on_snapshot: Optional[Callable[[LoopLagSnapshot], None]] = None,
+        export_interval: float = DEFAULT_EXPORT_INTERVAL_SECONDS,
+    ) -> None:
+        self._interval = interval_ms / 1000
+        self._threshold = slow_callback_ms / 1000
+        self._max_logs_per_minute = max_logs_per_minute
+        self._on_snapshot = on_snapshot
+        self._export_interval = export_interval
+        self._lags: Deque[float] = deque(maxlen=MAX_SAMPLES)
+        self._slow_callbacks = 0
+        self._log_times: Deque[float] = deque()
+        self._suppressed_logs = 0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        # The time the heartbeat went to sleep, and the stack captured by the watchdog for the sleep, which overran.
+        self._beat = 0.0
+        self._stall: Optional[Tuple[float, str]] = None
+
+    def start(self) -> None:
+        """Start the heartbeat on the running event loop and the watchdog thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def take_snapshot(self) -> LoopLagSnapshot:
+        """Get the lag percentiles and the number of stalls since the previous snapshot."""
+        lags = sorted(self._lags)
+        self._lags.clear()
+        slow_callbacks, self._slow_callbacks = self._slow_callbacks, 0
+        if not lags:
+            return LoopLagSnapshot(0, 0.0, 0.0, 0.0, slow_callbacks)
+        return LoopLagSnapshot(
+            samples=len(lags),
+            p50=lags[len(lags) // 2],
+            p99=lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+            max=lags[-1],
+            slow_callbacks=slow_callbacks,
+        )
+
+    async def _heartbeat(self) -> None:
+        last_export = time.perf_counter()
+        while True:
+            start = time.perf_counter()
+            self._beat = start
+            await asyncio.sleep(self._interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - start - self._interval)
+            self._lags.append(lag)
+            if lag >= self._threshold:
+                self._report_stall(start, lag)
+            if self._on_snapshot is not None and now - last_export >= self._export_interval:
+                last_export = now
+                self._on_snapshot(self.take_snapshot())
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self._threshold / 2):
+            beat = self._beat
+            if self._stall is not None and self._stall[0] == beat:
+                continue
+            if time.perf_counter() - beat - self._interval >= self._threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._stall = (beat, "".join(traceback.format_stack(frame)))
+
+    def _report_stall(self, beat: float, lag: float) -> None:
+        self._slow_callbacks += 1
+        now = time.monotonic()
+        while self._log_times and now - self._log_times[0] >= 60:
+            self._log_times.popleft()
+        if len(self._log_times) >= self._max_logs_per_minute:
+            self._suppressed_logs += 1
+            return
+        self._log_times.append(now)
+        message = f"Event loop blocked for {lag * 1000:.0f} ms"
+        if self._suppressed_logs:
+            message += f" ({self._suppressed_logs} stalls not logged before)"
+            self._suppressed_logs = 0
+        stall = self._stall
+        if stall is not None and stall[0] == beat:
+            message += f", blocking stack:\n{stall[1]}"
+        logger.warning(message)
+
+
+def start_loop_monitor(app: fastapi.FastAPI) -> LoopMonitor:
+    """
+    Start the monitor of the event loop of this worker, configured by APP_LOOP_MONITOR_INTERVAL_MS,
+    APP_LOOP_SLOW_CALLBACK_MS and APP_LOOP_SLOW_LOG_PER_MINUTE. The lag percentiles are exported
+    as metrics if they are enabled.
+    """
+    on_snapshot = None
+    if getattr(app.state, "metrics_enabled", False):
+        from .metrics import record_loop_health
+        on_snapshot = record_loop_health
+    monitor = LoopMonitor(
+        interval_ms=float(os.getenv("APP_LOOP_MONITOR_INTERVAL_MS", str(DEFAULT_INTERVAL_MS))),
+        slow_callback_ms=float(os.getenv("APP_LOOP_SLOW_CALLBACK_MS", str(DEFAULT_SLOW_CALLBACK_MS))),
+        max_logs_per_minute=int(os.getenv("APP_LOOP_SLOW_LOG_PER_MINUTE", str(DEFAULT_MAX_LOGS_PER_MINUTE))),
+        on_snapshot=on_snapshot,
+    )
+    monitor.start()
+    logger.info("Event loop monitor is enabled.")
+    return monitor
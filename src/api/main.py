@@ -2,12 +2,9 @@
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
 import contextlib
+import importlib.util
 import os
 
-from azure.ai.projects.aio import AIProjectClient
-from azure.identity.aio import DefaultAzureCredential
-from azure.ai.projects.telemetry import AIProjectInstrumentor
-
 import fastapi
 from fastapi.staticfiles import StaticFiles
 from fastapi import Request
@@ -22,6 +19,10 @@ logger = None
 
 @contextlib.asynccontextmanager
 async def lifespan(app: fastapi.FastAPI):
+    # Imported by the workers, or before they are forked by the when_ready hook of gunicorn.conf.py.
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.identity.aio import DefaultAzureCredential
+
     agent_version_details = None
     proj_endpoint = os.environ.get("AZURE_EXISTING_AIPROJECT_ENDPOINT")
     agent_id = os.environ.get("AZURE_EXISTING_AGENT_ID")    
@@ -45,9 +46,8 @@ async def lifespan(app: fastapi.FastAPI):
                     logger.error("Enable it via the 'Tracing' tab in your AI Foundry project page.")
                     exit()
                 else:
-                    from azure.monitor.opentelemetry import configure_azure_monitor
-                    configure_azure_monitor(connection_string=application_insights_connection_string)
-                    AIProjectInstrumentor().instrument(True)
+                    from .tracing_config import configure_tracing
+                    configure_tracing(application_insights_connection_string)
                     app.state.application_insights_connection_string = application_insights_connection_string
                     logger.info("Configured Application Insights for tracing.")                        
 
@@ -71,8 +71,21 @@ async def lifespan(app: fastapi.FastAPI):
                 raise RuntimeError(message)
 
             app.state.ai_project = project_client
+            app.state.credential = credential
             app.state.agent_version_details = agent_version_details
-            yield
+            from . import loop_monitor
+            if loop_monitor.loop_monitor_enabled():
+                app.state.loop_monitor = loop_monitor.start_loop_monitor(app)
+            try:
+                from .health import start_health_prober
+                app.state.health_prober = start_health_prober(app)
+                yield
+            finally:
+                # Stopped before the credential and the project client are closed, as a probe in progress uses them.
+                if getattr(app.state, "health_prober", None) is not None:
+                    await app.state.health_prober.stop()
+                if getattr(app.state, "loop_monitor", None) is not None:
+                    await app.state.loop_monitor.stop()
 
     except Exception as e:
         logger.error(f"Error during startup: {e}", exc_info=True)
@@ -106,9 +119,8 @@ def create_app():
         enable_trace = str(enable_trace_string).lower() == "true"
     if enable_trace:
         logger.info("Tracing is enabled.")
-        try:
-            from azure.monitor.opentelemetry import configure_azure_monitor
-        except ModuleNotFoundError:
+        # Only checked here, the tracing is configured in lifespan.
+        if importlib.util.find_spec("azure.monitor.opentelemetry") is None:
             logger.error("Required libraries for tracing not installed.")
             logger.error("Please make sure azure-monitor-opentelemetry is installed.")
             exit()
@@ -127,6 +139,45 @@ def create_app():
     from . import routes  # Import routes
     app.include_router(routes.router)
 
+    # The probes of the container platform, without authentication.
+    from . import health
+    app.include_router(health.router)
+
+    from . import admin
+    if admin.admin_enabled():
+        if routes.basic_auth:
+            app.include_router(admin.router)
+            logger.info("Admin endpoints are enabled.")
+        else:
+            logger.warning("Admin endpoints require WEB_APP_USERNAME and WEB_APP_PASSWORD. Not enabling them.")
+
+    from . import profiling
+    if profiling.profiling_enabled():
+        if routes.basic_auth:
+            app.include_router(profiling.router)
+            logger.info("Profiling endpoints are enabled.")
+        else:
+            logger.warning("Profiling endpoints require WEB_APP_USERNAME and WEB_APP_PASSWORD. Not enabling them.")
+
+    app.state.local_retriever = None
+    if os.getenv("ENABLE_LOCAL_RETRIEVER", "false").lower() == "true":
+        # Imported only when enabled, as the retriever needs NumPy.
+        from . import local_search
+        # Loaded before gunicorn forks the workers (preload_app), so they share the memory-mapped vectors
+        app.state.local_retriever = local_search.load_local_retriever()
+        app.include_router(local_search.router)
+        logger.info("Local retriever endpoint is enabled.")
+
+    # Added before the metrics, whose middleware then counts the rejected requests too.
+    from .concurrency import add_concurrency_limit
+    add_concurrency_limit(app)
+
+    if os.getenv("ENABLE_METRICS", "false").lower() == "true":
+        # Imported only when enabled, as the metrics are created in PROMETHEUS_MULTIPROC_DIR on import.
+        from . import metrics
+        metrics.add_metrics(app)
+        app.state.metrics_enabled = True
+
     # Global exception handler for any unhandled exceptions
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
@@ -0,0 +1,168 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import os
+import resource
+import time
+from typing import Optional
+
+import fastapi
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from worker_memory import read_memory_usage
+
+from .routes import auth_dependency, logger
+
+METRICS_PATH = "/metrics"
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 5.0
+# The chat responses are streamed for seconds to minutes, so the buckets reach further than the defaults.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route, method and status code.", ["method", "route", "status"])
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Duration of the HTTP requests until the response is sent completely.",
+    ["method", "route"], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being processed.", ["method", "route"], multiprocess_mode="livesum")
+RESIDENT_MEMORY = Gauge("app_worker_resident_memory_bytes", "Resident memory of the worker.", multiprocess_mode="liveall")
+WORKER_MEMORY = Gauge(
+    "app_worker_memory_bytes", "Memory of the worker from smaps_rollup: rss, pss (shared pages divided between their processes), "
+    "shared and private.", ["kind"], multiprocess_mode="liveall")
+OPEN_FDS = Gauge("app_worker_open_fds", "Open file descriptors of the worker.", multiprocess_mode="liveall")
+LOOP_LAG = Histogram("app_event_loop_lag_seconds", "Delay of the event loop in waking up a periodic task.", buckets=LOOP_LAG_BUCKETS)
+LOOP_LAG_QUANTILES = Gauge(
+    "app_event_loop_lag_quantile_seconds", "Lag percentiles of the event loop heartbeat of the worker over the last export interval.",
+    ["quantile"], multiprocess_mode="liveall")
+LOOP_SLOW_CALLBACKS = Counter("app_event_loop_slow_callbacks_total", "Stalls of the event loop longer than APP_LOOP_SLOW_CALLBACK_MS.")
+
+router = fastapi.APIRouter(dependencies=[auth_dependency] if auth_dependency else [])
+
+
+def is_multiprocess() -> bool:
+    """Whether the metrics of the workers are aggregated through the files in PROMETHEUS_MULTIPROC_DIR."""
+    return bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def get_route(scope: Scope) -> str:
+    """Get the path template of the route of the request, so the label does not grow with the paths."""
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unknown")
+    return "unmatched"
+
+
+def read_process_memory() -> Optional[int]:
+    """Read the resident memory of this process in bytes, from /proc on Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def count_open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+class MetricsMiddleware:
+    """
+    The ASGI middleware recording the count, the duration and the in-flight number of the HTTP requests per route.
+
+    The duration lasts until the response is sent completely, so it includes the streaming of the chat responses.
+    The first request of every worker starts the task sampling its memory, open files and event loop lag.
+
+    :param app: The ASGI app.
+    :param sample_interval: The interval of the process samples in seconds.
+    """
+
+    def __init__(self, app: ASGIApp, sample_interval: float = DEFAULT_SAMPLE_INTERVAL_SECONDS) -> None:
+        self.app = app
+        self._sample_interval = sample_interval
+        self._sampler: Optional[asyncio.Task] = None
+        self._sampler_pid: Optional[int] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+        self._start_sampler()
+
+        method = scope["method"]
+        route = get_route(scope)
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status)).inc()
+            in_progress.dec()
+
+    def _start_sampler(self) -> None:
+        # The workers are forked after the app is created, so the task is started by the first request of each.
+        if self._sampler_pid != os.getpid() or self._sampler is None or self._sampler.done():
+            self._sampler_pid = os.getpid()
+            self._sampler = asyncio.get_running_loop().create_task(self._sample_process())
+
+    async def _sample_process(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self._sample_interval)
+            LOOP_LAG.observe(max(0.0, time.perf_counter() - start - self._sample_interval))
+            memory = read_process_memory()
+            if memory is not None:
+                RESIDENT_MEMORY.set(memory)
+            usage = read_memory_usage()
+            for kind, value in (usage or {}).items():
+                WORKER_MEMORY.labels(kind).set(value)
+            fds = count_open_fds()
+            if fds is not None:
+                OPEN_FDS.set(fds)
+
+
+def record_loop_health(snapshot) -> None:
+    """Export a snapshot of the event loop monitor, an api.loop_monitor.LoopLagSnapshot."""
+    if snapshot.samples:
+        LOOP_LAG_QUANTILES.labels("0.5").set(snapshot.p50)
+        LOOP_LAG_QUANTILES.labels("0.99").set(snapshot.p99)
+        LOOP_LAG_QUANTILES.labels("1").set(snapshot.max)
+    LOOP_SLOW_CALLBACKS.inc(snapshot.slow_callbacks)
+
+
+@router.get(METRICS_PATH)
+async def get_metrics() -> Response:
+    """Serve the metrics of all the workers in the Prometheus text format."""
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def add_metrics(app: fastapi.FastAPI) -> None:
+    """Record the metrics of the requests of the app and serve them on /metrics."""
+    app.add_middleware(MetricsMiddleware, sample_interval=float(
+        os.getenv("APP_METRICS_SAMPLE_INTERVAL_SECONDS", str(DEFAULT_SAMPLE_INTERVAL_SECONDS))))
+    app.include_router(router)
+    logger.info(f"Metrics endpoint is enabled{' for all the workers' if is_multiprocess() else ''}.")
@@ -0,0 +1,198 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import FrameType
+from typing import Dict, List, Optional
+
+import fastapi
+from fastapi import Depends, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from .routes import authenticate, logger
+
+MAX_PROFILE_SECONDS = 60.0
+DEFAULT_SAMPLE_INTERVAL_MS = 5.0
+# The frames of the profiler itself and of tracemalloc, left out of the reports.
+_IGNORED_FILES = (__file__, tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>")
+
+# The profiling endpoints are disabled by default and always require the basic authentication.
+# Every request is served by one worker, so the reports are of that worker, whose pid they contain.
+router = fastapi.APIRouter(prefix="/admin/profile", dependencies=[Depends(authenticate)])
+
+_cpu_profile_lock = threading.Lock()
+_memory_lock = asyncio.Lock()
+_previous_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("ENABLE_PROFILING_ENDPOINTS", "false").lower() == "true"
+
+
+def _format_frame(frame: FrameType) -> str:
+    return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})"
+
+
+def _collapse(frame: Optional[FrameType], thread_name: str) -> str:
+    names = []
+    while frame is not None:
+        names.append(_format_frame(frame))
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+def sample_cpu_profile(seconds: float, interval_ms: float = DEFAULT_SAMPLE_INTERVAL_MS) -> Counter:
+    """
+    Sample the stacks of all the threads of the process but the calling one, every interval for the given seconds.
+
+    The idle threads are sampled too; the event loop thread waiting for I/O shows as its selector call.
+
+    :param seconds: The duration of the profile.
+    :param interval_ms: The interval of the samples.
+    :return: The number of samples by collapsed stack, the thread name followed by the functions from the outermost.
+    """
+    own_id = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_id:
+                stacks[_collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+        time.sleep(interval_ms / 1000)
+    return stacks
+
+
+def get_await_stack(task: asyncio.Task) -> List[str]:
+    """Get the frames of the coroutines awaited by the task, from the task coroutine to the innermost awaited one."""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) or getattr(awaitable, "ag_frame", None)
+        if frame is not None:
+            line = linecache.getline(frame.f_code.co_filename, frame.f_lineno).strip()
+            stack.append(f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}: {line}")
+        elif awaitable is not task.get_coro():
+            stack.append(repr(awaitable))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) or getattr(awaitable, "ag_await", None)
+    return stack
+
+
+def dump_tasks() -> List[Dict[str, object]]:
+    """Describe all the tasks of the running event loop with their await stacks."""
+    current = asyncio.current_task()
+    tasks = []
+    for task in asyncio.all_tasks():
+        if task is current:
+            continue
+        coro = task.get_coro()
+        tasks.append({
+            "name": task.get_name(),
+            "coroutine": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "cancelling": task.cancelling() if hasattr(task, "cancelling") else None,
+            "await_stack": get_await_stack(task),
+        })
+    return sorted(tasks, key=lambda task: task["name"])
+
+
+def _format_statistic(statistic) -> Dict[str, object]:
+    entry = {"size_kb": round(statistic.size / 1024, 1), "count": statistic.count,
+             "traceback": [f"{frame.filename}:{frame.lineno}" for frame in statistic.traceback]}
+    if hasattr(statistic, "size_diff"):
+        entry["size_diff_kb"] = round(statistic.size_diff / 1024, 1)
+        entry["count_diff"] = statistic.count_diff
+    return entry
+
+
+def take_memory_report(limit: int, key_type: str) -> Dict[str, object]:
+    """
+    Snapshot the traced allocations and compare them with the previous snapshot.
+
+    :param limit: The number of allocators in the top and in the diff.
+    :param key_type: How the allocations are grouped: "lineno", "filename" or "traceback".
+    :return: The top allocators and, from the second report on, the allocators grown the most since the previous one.
+    """
+    global _previous_snapshot
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, filename) for filename in _IGNORED_FILES])
+    current, peak = tracemalloc.get_traced_memory()
+    report: Dict[str, object] = {
+        "pid": os.getpid(),
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "top": [_format_statistic(statistic) for statistic in snapshot.statistics(key_type)[:limit]],
+    }
+    if _previous_snapshot is not None:
+        report["diff"] = [_format_statistic(statistic) for statistic in snapshot.compare_to(_previous_snapshot, key_type)[:limit]]
+    _previous_snapshot = snapshot
+    return report
+
+
+@router.get("/cpu", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = fastapi.Query(10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = fastapi.Query(DEFAULT_SAMPLE_INTERVAL_MS, ge=1),
+):
+    """
+    Profile the worker for the given seconds and return the collapsed stacks, one "stack count" per line,
+    which flamegraph.pl, speedscope or inferno render as a flame graph.
+    """
+    if not _cpu_profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A CPU profile of this worker is already running.")
+    try:
+        logger.info(f"Profiling the CPU of worker {os.getpid()} for {seconds} seconds.")
+        # Sampled from a thread, so the event loop keeps serving the requests being profiled.
+        stacks = await asyncio.to_thread(sample_cpu_profile, seconds, interval_ms)
+    finally:
+        _cpu_profile_lock.release()
+    content = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    return PlainTextResponse(content, headers={
+        "Content-Disposition": f'attachment; filename="cpu-{os.getpid()}.collapsed"'})
+
+
+@router.get("/tasks")
+async def tasks():
+    return JSONResponse(content={"pid": os.getpid(), "tasks": dump_tasks()})
+
+
+@router.post("/memory/start")
+async def start_memory_tracing(frames: int = fastapi.Query(10, ge=1, le=100)):
+    """Start tracing the allocations, which slows down the worker, until /memory/stop."""
+    global _previous_snapshot
+    async with _memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _previous_snapshot = None
+            logger.info(f"Started tracing the memory allocations of worker {os.getpid()}.")
+    return JSONResponse(content={"pid": os.getpid(), "tracing": True, "frames": tracemalloc.get_traceback_limit()})
+
+
+@router.get("/memory")
+async def memory_report(
+    limit: int = fastapi.Query(20, ge=1, le=500),
+    key_type: str = fastapi.Query("lineno", pattern="^(lineno|filename|traceback)$"),
+):
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="The memory allocations are not traced; call /admin/profile/memory/start.")
+    async with _memory_lock:
+        report = await asyncio.to_thread(take_memory_report, limit, key_type)
+    return JSONResponse(content=report)
+
+
+@router.post("/memory/stop")
+async def stop_memory_tracing():
+    global _previous_snapshot
+    async with _memory_lock:
+        tracemalloc.stop()
+        _previous_snapshot = None
+    logger.info(f"Stopped tracing the memory allocations of worker {os.getpid()}.")
+    return JSONResponse(content={"pid": os.getpid(), "tracing": False})
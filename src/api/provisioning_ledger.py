@@ -0,0 +1,120 @@
+from typing import Any, Dict, Optional
+from enum import Enum
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERIFY_INTERVAL_SECONDS = 24 * 60 * 60
+
+
+class LedgerState(Enum):
+    """State of a ledger entry compared with the desired configuration."""
+    CURRENT = "current"
+    NEEDS_VERIFICATION = "needs_verification"
+    MISSING = "missing"
+
+
+class ProvisioningLedger:
+    """
+    Local ledger of successful provisioning runs.
+
+    Each entry is keyed by a resource group name (for example "ai_search") and stores the hash of the
+    desired configuration it was provisioned with and the time it was last verified against Azure.
+    When the hash of the desired configuration matches a verified entry, the control-plane probes
+    can be skipped; once the verification interval expires, a cheap verification should be made.
+
+    :param ledger_path: The path of the ledger file.
+    :param verify_interval_seconds: The time after which an entry needs to be verified again.
+    :param force: Treat every entry as missing to force the full reconciliation.
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        ledger_path: str,
+        verify_interval_seconds: float = DEFAULT_VERIFY_INTERVAL_SECONDS,
+        force: bool = False,
+    ) -> None:
+        """Constructor."""
+        self._ledger_path = ledger_path
+        self._verify_interval_seconds = verify_interval_seconds
+        self._force = force
+        self._entries = self._load()
+
+    @staticmethod
+    def hash_config(config: Dict[str, Any]) -> str:
+        """
+        Return the hash of the desired configuration.
+
+        :param config: The JSON-serializable desired configuration.
+        :return: The SHA-256 of the canonical JSON of the configuration.
+        """
+        canonical = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def check(self, key: str, config_hash: str) -> LedgerState:
+        """
+        Compare the entry with the hash of the desired configuration.
+
+        :param key: The key of the entry.
+        :param config_hash: The hash of the desired configuration.
+        :return: LedgerState.CURRENT, LedgerState.NEEDS_VERIFICATION or LedgerState.MISSING
+        """
+        entry = self._entries.get(key)
+        if self._force or not entry or entry.get("config_hash") != config_hash:
+            return LedgerState.MISSING
+        if time.time() - entry.get("verified_at", 0) > self._verify_interval_seconds:
+            return LedgerState.NEEDS_VERIFICATION
+        return LedgerState.CURRENT
+
+    def get_outputs(self, key: str) -> Dict[str, Any]:
+        """Return the outputs recorded with the entry."""
+        return dict(self._entries.get(key, {}).get("outputs", {}))
+
+    def record(self, key: str, config_hash: str, outputs: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Record a successful and verified provisioning run.
+
+        :param key: The key of the entry.
+        :param config_hash: The hash of the provisioned configuration.
+        :param outputs: Optional values produced by the run, which are needed when it is skipped.
+        """
+        self._entries[key] = {
+            "config_hash": config_hash,
+            "verified_at": time.time(),
+            "outputs": outputs if outputs is not None else self.get_outputs(key),
+        }
+        self._save()
+
+    def invalidate(self, key: str) -> None:
+        """Remove the entry, so that the next run makes the full reconciliation."""
+        if self._entries.pop(key, None) is not None:
+            self._save()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._ledger_path, "r") as f:
+                ledger = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable provisioning ledger '{self._ledger_path}': {e}")
+            return {}
+        if ledger.get("version") != ProvisioningLedger.VERSION:
+            return {}
+        return ledger.get("entries", {})
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self._ledger_path)), exist_ok=True)
+            tmp_path = f"{self._ledger_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"version": ProvisioningLedger.VERSION, "entries": self._entries}, f, indent=2)
+            os.replace(tmp_path, self._ledger_path)
+        except Exception as e:
+            logger.warning(f"Failed to write provisioning ledger '{self._ledger_path}': {e}")
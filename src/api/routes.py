@@ -4,8 +4,9 @@
 import asyncio
 import json
 import os
+import time
 from datetime import datetime, timezone
-from typing import AsyncGenerator, Mapping, Optional, Dict
+from typing import TYPE_CHECKING, AsyncGenerator, Mapping, Optional, Dict
 
 
 import fastapi
@@ -16,22 +17,27 @@ from fastapi.responses import JSONResponse
 
 import logging
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from azure.ai.projects.models import AgentVersionDetails
-from openai.types.conversations.message import Message
-from openai.types.responses import ResponseOutputMessage
-from openai.types.conversations import Conversation
-
-from azure.ai.projects.aio import AIProjectClient
 
 from util import encode_project_resource_id
 
-from urllib.parse import quote
+from . import health
+from .timing import PhaseTimer
 
+from urllib.parse import quote
 
-from openai import AsyncOpenAI
+# The SDKs are imported by the lifespan of the app, the types only for the annotations.
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.ai.projects.models import AgentVersionDetails
+    from openai import AsyncOpenAI
+    from openai.types.conversations import Conversation
+    from openai.types.conversations.message import Message
+    from openai.types.responses import ResponseOutputMessage
 
 # Create a logger for this module
 logger = logging.getLogger("azureaiapp")
+# The per-event logs of the response streams, at DEBUG level, which can be sampled with APP_LOG_SAMPLING.
+stream_logger = logging.getLogger("azureaiapp.stream")
 
 # Set the log level for the azure HTTP logging policy to WARNING (or ERROR)
 logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(logging.WARNING)
@@ -76,6 +82,9 @@ def authenticate(credentials: Optional[HTTPBasicCredentials] = Depends(security)
 
 auth_dependency = Depends(authenticate) if basic_auth else None
 
+# The maximal number of rounds of function calls run for one user message.
+MAX_FUNCTION_CALL_ROUNDS = 5
+
 def cleanup_created_at_metadata(metadata: Mapping[str, str]) -> None:
     """Remove oldest created_at timestamp entries to keep metadata under 16 items limit."""
     if not metadata:
@@ -89,13 +98,13 @@ def cleanup_created_at_metadata(metadata: Mapping[str, str]) -> None:
         min_key = min(created_at_keys, key=metadata.get)
         del metadata[min_key]
 
-def get_project_client(request: Request) -> AIProjectClient:
+def get_project_client(request: Request) -> "AIProjectClient":
     return request.app.state.ai_project
 
-def get_agent_version_details(request: Request) -> AgentVersionDetails:
+def get_agent_version_details(request: Request) -> "AgentVersionDetails":
     return request.app.state.agent_version_details
 
-def get_openai_client(request: Request) -> AsyncOpenAI:
+def get_openai_client(request: Request) -> "AsyncOpenAI":
     return get_project_client(request).get_openai_client()
 
 def get_created_at_label(message_id: str) -> str:
@@ -105,22 +114,25 @@ def serialize_sse_event(data: Dict) -> str:
     return f"data: {json.dumps(data)}\n\n"
 
 async def get_or_create_conversation(
-    openai_client: AsyncOpenAI,
+    openai_client: "AsyncOpenAI",
     conversation_id: Optional[str],
     agent_id: Optional[str],
-    current_agent_id: str
-) -> Conversation:
+    current_agent_id: str,
+    timer: Optional[PhaseTimer] = None
+) -> "Conversation":
     """
     Get an existing conversation or create a new one.
     Returns the conversation_id.
     """
-    conversation: Optional[Conversation] = None
+    conversation: Optional["Conversation"] = None
+    timer = timer or PhaseTimer("conversation")
     
     # Attempt to get an existing conversation if we have matching agent and conversation IDs
     if conversation_id and agent_id == current_agent_id:
         try:
             logger.info(f"Using existing conversation with ID {conversation_id}")
-            conversation = await openai_client.conversations.retrieve(conversation_id=conversation_id)
+            with timer.phase("conversation_retrieve"):
+                conversation = await openai_client.conversations.retrieve(conversation_id=conversation_id)
             logger.info(f"Retrieved conversation: {conversation.id}")
         except Exception as e:
             logger.error(f"Error retrieving conversation: {e}")
@@ -129,7 +141,8 @@ async def get_or_create_conversation(
     if not conversation:
         try:
             logger.info("Creating a new conversation")
-            conversation = await openai_client.conversations.create()
+            with timer.phase("conversation_create"):
+                conversation = await openai_client.conversations.create()
             logger.info(f"Generated new conversation ID: {conversation.id}")
         except Exception as e:
             logger.error(f"Error creating conversation: {e}")
@@ -137,7 +150,7 @@ async def get_or_create_conversation(
     
     return conversation
 
-async def get_message_and_annotations(event: Message | ResponseOutputMessage) -> Dict:
+async def get_message_and_annotations(event: "Message | ResponseOutputMessage") -> Dict:
     annotations = []
     # Get file annotations for the file search.
     text = ""
@@ -174,14 +187,14 @@ async def index(request: Request, _ = auth_dependency):
         }
     )
 
-async def save_user_message_created_at(openai_client: AsyncOpenAI, conversation: Conversation,  input_created_at: float):
+async def save_user_message_created_at(openai_client: "AsyncOpenAI", conversation: "Conversation",  input_created_at: float):
     conversation.metadata = conversation.metadata  or {}
     try:
         logger.info(f"Saving created_at.")
         messages = await openai_client.conversations.items.list(conversation_id=conversation.id, order="desc")
         last_input_message = None
         async for message in messages:
-            if isinstance(message, Message) and message.role == "user":
+            if message.type == "message" and message.role == "user":
                 last_input_message = message
                 break
         if last_input_message:
@@ -199,38 +212,66 @@ async def save_user_message_created_at(openai_client: AsyncOpenAI, conversation:
 
 
 async def get_result(
-    agent: AgentVersionDetails,
-    conversation: Conversation,
+    agent: "AgentVersionDetails",
+    conversation: "Conversation",
     user_message: str, 
-    project_client: AIProjectClient,
-    carrier: Dict[str, str]
+    project_client: "AIProjectClient",
+    carrier: Dict[str, str],
+    local_retriever=None,
+    timer: Optional[PhaseTimer] = None
 ) -> AsyncGenerator[str, None]:
+    timer = timer or PhaseTimer("/chat")
     ctx = TraceContextTextMapPropagator().extract(carrier=carrier)
-    with tracer.start_as_current_span('get_result', context=ctx):
+    with tracer.start_as_current_span('get_result', context=ctx) as span:
         async with project_client.get_openai_client() as openai_client:
             logger.info(f"get_result invoked for conversation={conversation.id}")
             input_created_at = datetime.now(timezone.utc).timestamp()
             try:
-                response = await openai_client.responses.create(
-                    conversation=conversation.id,
-                    input=user_message,
-                    extra_body={"agent_reference": {"name": agent.name, "type": "agent_reference"}},
-                    stream=True
-                )
-                logger.info("Successfully created stream; starting to process events")
-                async for event in response:
-                    if event.type == "response.created":
-                        logger.info(f"Stream response created with ID: {event.response.id}")
-                    elif event.type == "response.output_text.delta":
-                        logger.info(f"Delta: {event.delta}")
-                        stream_data = {'content': event.delta, 'type': "message"}
-                        yield serialize_sse_event(stream_data)
-                    elif event.type == "response.output_item.done" and event.item.type == "message":
-                        stream_data = await get_message_and_annotations(event.item)
-                        stream_data['type'] = "completed_message"
-                        yield serialize_sse_event(stream_data)
-                    elif event.type == "response.completed":
-                        logger.info(f"Response completed with full message: {event.response.output_text}")
+                response_input = user_message
+                # The function calls of the agent are run here and their outputs sent back, until it answers.
+                for _ in range(MAX_FUNCTION_CALL_ROUNDS + 1):
+                    function_calls = []
+                    # The time to the first event of every round is accumulated as upstream_ttfb, the rest as upstream_stream.
+                    round_start = time.perf_counter()
+                    first_event_at = None
+                    response = await openai_client.responses.create(
+                        conversation=conversation.id,
+                        input=response_input,
+                        extra_body={"agent_reference": {"name": agent.name, "type": "agent_reference"}},
+                        stream=True
+                    )
+                    logger.info("Successfully created stream; starting to process events")
+                    async for event in response:
+                        if first_event_at is None:
+                            first_event_at = time.perf_counter()
+                            timer.record("upstream_ttfb", first_event_at - round_start)
+                            health.record_upstream_success()
+                        if event.type == "response.created":
+                            logger.info(f"Stream response created with ID: {event.response.id}")
+                        elif event.type == "response.output_text.delta":
+                            stream_logger.debug(f"Delta: {event.delta}")
+                            stream_data = {'content': event.delta, 'type': "message"}
+                            yield serialize_sse_event(stream_data)
+                        elif event.type == "response.output_item.done" and event.item.type == "message":
+                            stream_data = await get_message_and_annotations(event.item)
+                            stream_data['type'] = "completed_message"
+                            yield serialize_sse_event(stream_data)
+                        elif event.type == "response.output_item.done" and event.item.type == "function_call":
+                            function_calls.append(event.item)
+                        elif event.type == "response.completed":
+                            logger.info(f"Response completed with full message: {event.response.output_text}")
+                    if first_event_at is not None:
+                        timer.record("upstream_stream", time.perf_counter() - first_event_at)
+                    if not function_calls:
+                        break
+
+                    from .local_search import call_function_tool
+                    response_input = []
+                    for call in function_calls:
+                        logger.info(f"Calling function '{call.name}' for conversation={conversation.id}")
+                        with timer.phase("function_calls"):
+                            output = await call_function_tool(openai_client, local_retriever, call.name, call.arguments)
+                        response_input.append({"type": "function_call_output", "call_id": call.call_id, "output": output})
                                                         
             except Exception as e:
                 logger.exception(f"Exception in get_result: {e}")
@@ -242,7 +283,11 @@ async def get_result(
                 yield serialize_sse_event(error_data)
             finally:
                 stream_data = {'type': "stream_end"}
-                await save_user_message_created_at(openai_client, conversation, input_created_at)
+                with timer.phase("save_created_at"):
+                    await save_user_message_created_at(openai_client, conversation, input_created_at)
+                timer.set_span_attributes(span)
+                timer.log_if_slow(conversation.id)
+                yield serialize_sse_event({'type': "timing", 'phases': timer.to_dict()})
                 yield serialize_sse_event(stream_data)           
 
 
@@ -250,34 +295,39 @@ async def get_result(
 @router.get("/chat/history")
 async def history(
     request: Request,
-    agent: AgentVersionDetails = Depends(get_agent_version_details),
-    openai_client : AsyncOpenAI = Depends(get_openai_client),
+    agent: "AgentVersionDetails" = Depends(get_agent_version_details),
+    openai_client : "AsyncOpenAI" = Depends(get_openai_client),
 	_ = auth_dependency
 ):
-    with tracer.start_as_current_span("chat_history"):
+    timer = PhaseTimer("/chat/history")
+    with tracer.start_as_current_span("chat_history") as span:
         async with openai_client:
             conversation_id = request.cookies.get('conversation_id')
             agent_id = request.cookies.get('agent_id')
 
             # Get or create conversation using the reusable function
             conversation = await get_or_create_conversation(
-                openai_client, conversation_id, agent_id, agent.id
+                openai_client, conversation_id, agent_id, agent.id, timer
             )
             agent_id = agent.id
             # Create a new message from the user's input.
             try:
                 content = []
-                items = await openai_client.conversations.items.list(conversation_id=conversation.id, order="desc", limit=16)
-                async for item in items:
-                    if item.type == "message":
-                        formatteded_message = await get_message_and_annotations(item)
-                        formatteded_message['role'] = item.role
-                        formatteded_message['created_at'] = conversation.metadata.get(get_created_at_label(item.id), "")
-                        content.append(formatteded_message)
+                with timer.phase("list_items"):
+                    items = await openai_client.conversations.items.list(conversation_id=conversation.id, order="desc", limit=16)
+                    async for item in items:
+                        if item.type == "message":
+                            formatteded_message = await get_message_and_annotations(item)
+                            formatteded_message['role'] = item.role
+                            formatteded_message['created_at'] = conversation.metadata.get(get_created_at_label(item.id), "")
+                            content.append(formatteded_message)
+                health.record_upstream_success()
 
 
                 logger.info(f"List message, conversation ID: {conversation_id}")
-                response = JSONResponse(content=content)
+                timer.set_span_attributes(span)
+                timer.log_if_slow(conversation.id)
+                response = JSONResponse(content=content, headers={"Server-Timing": timer.server_timing()})
             
                 # Update cookies to persist the conversation IDs.
                 response.set_cookie("conversation_id", conversation_id)
@@ -289,7 +339,7 @@ async def history(
 
 @router.get("/agent")
 async def get_chat_agent(
-    agent: AgentVersionDetails = Depends(get_agent_version_details),
+    agent: "AgentVersionDetails" = Depends(get_agent_version_details),
 ):
     wsid = os.environ.get("AZURE_EXISTING_AIPROJECT_RESOURCE_ID")
     agent_id = os.environ.get("AZURE_EXISTING_AGENT_ID")
@@ -302,8 +352,8 @@ async def get_chat_agent(
 @router.post("/chat")
 async def chat(
     request: Request,
-    project_client: AIProjectClient = Depends(get_project_client),
-    agent: AgentVersionDetails = Depends(get_agent_version_details),
+    project_client: "AIProjectClient" = Depends(get_project_client),
+    agent: "AgentVersionDetails" = Depends(get_agent_version_details),
     
 	_ = auth_dependency
 ):
@@ -313,34 +363,39 @@ async def chat(
 
     carrier = {}        
     TraceContextTextMapPropagator().inject(carrier)
+    timer = PhaseTimer("/chat")
 
     with tracer.start_as_current_span("chat_request"):
         async with project_client.get_openai_client() as openai_client:
             # if the connection no longer exist or agent is changed, create a new one
             conversation = await get_or_create_conversation(
-                openai_client, conversation_id, agent_id, agent.id
+                openai_client, conversation_id, agent_id, agent.id, timer
             )
             conversation_id = conversation.id
             agent_id = agent.id
         
     # Parse the JSON from the request.
     try:
-        user_message = await request.json()
+        with timer.phase("parse_json"):
+            user_message = await request.json()
     except Exception as e:
         logger.error(f"Invalid JSON in request: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid JSON in request: {e}")
     # Create a new message from the user's input.
 
     # Set the Server-Sent Events (SSE) response headers.
+    # The Server-Timing header has the phases before the stream, the trailing timing event all of them.
     headers = {
         "Cache-Control": "no-cache",
         "Connection": "keep-alive",
-        "Content-Type": "text/event-stream"
+        "Content-Type": "text/event-stream",
+        "Server-Timing": timer.server_timing()
     }
     logger.info(f"Starting streaming response for conversation ID {conversation_id}")
 
     # Create the streaming response using the generator.
-    response = StreamingResponse(get_result(agent, conversation, user_message.get('message', ''), project_client, carrier), headers=headers)
+    local_retriever = getattr(request.app.state, "local_retriever", None)
+    response = StreamingResponse(get_result(agent, conversation, user_message.get('message', ''), project_client, carrier, local_retriever, timer), headers=headers)
 
     # Update cookies to persist the conversation and agent IDs.
     response.set_cookie("conversation_id", conversation_id)
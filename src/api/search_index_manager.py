@@ -1,14 +1,27 @@
-from typing import Any, Dict, Literal, Optional
+from typing import Any, Dict, Iterator, List, Literal, Optional
+from dataclasses import dataclass
 from enum import Enum
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import time
 
 from azure.core.credentials_async import AsyncTokenCredential
+from azure.search.documents.aio import SearchClient
 from azure.search.documents.indexes.aio import SearchIndexClient, SearchIndexerClient
 from azure.core.exceptions import HttpResponseError
 from azure.search.documents.indexes.models import (
     AzureOpenAIVectorizer,
     AzureOpenAIVectorizerParameters,
+    BinaryQuantizationCompression,
     HnswAlgorithmConfiguration,
+    HnswParameters,
+    RescoringOptions,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters,
+    VectorSearchCompressionRescoreStorageMethod,
     SearchField,
     SearchFieldDataType,
     SearchIndex,
@@ -20,6 +33,7 @@ from azure.search.documents.indexes.models import (
     VectorSearch,
     VectorSearchProfile,
     SearchIndexerDataSourceConnection,
+    SoftDeleteColumnDeletionDetectionPolicy,
     SearchIndexerDataContainer,
     SearchIndexer,
     FieldMapping,
@@ -36,14 +50,85 @@ from azure.search.documents.indexes.models import (
     IndexProjectionMode,
 )
 
+from .chunking import DEFAULT_MAX_PAGE_LENGTH, DEFAULT_PAGE_OVERLAP_LENGTH
+from .embedding_builder import DEFAULT_EMBED_CONCURRENCY, EmbeddingBuildReport, build_embeddings_file
+from .embedding_store import EmbeddedChunk, iter_embeddings
+
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PUSH_BATCH_BYTES = 8 * 1024 * 1024
+DEFAULT_PUSH_BATCH_DOCUMENTS = 1000
+DEFAULT_PUSH_CONCURRENCY = 4
+DEFAULT_PUSH_RETRIES = 3
+# The API version supporting the incremental enrichment cache of the indexers.
+SEARCH_PREVIEW_API_VERSION = os.getenv("AZURE_AI_SEARCH_PREVIEW_API_VERSION", "2025-08-01-preview")
+# Statuses of the indexing results, which may succeed when retried.
+_RETRIABLE_STATUS_CODES = {409, 422, 429, 503}
+
+# Indexers reading the blob datasource: kind, indexed file extensions and parsing mode.
+INDEXERS = [
+    ("markdown", ".md", "markdown"),
+    ("documents", ".pdf,.docx,.pptx,.xlsx,.txt", "default"),
+]
+
+
+def get_resource_prefix(index_name: str) -> str:
+    """Sanitize the index name to the prefix of the datasource, skillset and indexer names."""
+    return index_name.lower().replace("_", "-")
+
+
+def get_indexer_names(index_name: str) -> List[str]:
+    """Get the names of the indexers writing to the index."""
+    prefix = get_resource_prefix(index_name)
+    return [f"{prefix}-{kind}-indexer" for kind, _, _ in INDEXERS]
+
+
+@dataclass
+class VectorIndexOptions:
+    """
+    Options of the vector field and of the vector search configuration of the index.
+
+    :param compression: Quantization of the vectors in the index: none, scalar (int8) or binary.
+    :param rescoring: Rescore the results of the compressed vectors with the full-precision vectors.
+    :param oversampling: The number of candidates retrieved from the compressed vectors per requested result.
+    :param vector_type: The type of the vector components: single (float32) or half (float16).
+    :param stored: Store a retrievable copy of the vectors; disabling it reduces storage, but the
+                   vectors can not be returned by queries.
+    :param hnsw_m: The number of bi-directional links created for every new element of HNSW graph.
+    :param hnsw_ef_construction: The size of the dynamic candidate list used when building HNSW graph.
+    :param hnsw_ef_search: The size of the dynamic candidate list used when querying HNSW graph.
+    """
+    compression: Literal["none", "scalar", "binary"] = "none"
+    rescoring: bool = True
+    oversampling: float = 4.0
+    vector_type: Literal["single", "half"] = "single"
+    stored: bool = True
+    hnsw_m: int = 4
+    hnsw_ef_construction: int = 400
+    hnsw_ef_search: int = 500
+
+    @classmethod
+    def from_env(cls) -> "VectorIndexOptions":
+        """Read the options from the AZURE_AI_SEARCH_VECTOR_* environment variables."""
+        defaults = cls()
+        return cls(
+            compression=os.getenv("AZURE_AI_SEARCH_VECTOR_COMPRESSION", defaults.compression).lower(),
+            rescoring=os.getenv("AZURE_AI_SEARCH_VECTOR_RESCORING", str(defaults.rescoring)).lower() == "true",
+            oversampling=float(os.getenv("AZURE_AI_SEARCH_VECTOR_OVERSAMPLING", str(defaults.oversampling))),
+            vector_type=os.getenv("AZURE_AI_SEARCH_VECTOR_TYPE", defaults.vector_type).lower(),
+            stored=os.getenv("AZURE_AI_SEARCH_VECTOR_STORED", str(defaults.stored)).lower() == "true",
+            hnsw_m=int(os.getenv("AZURE_AI_SEARCH_HNSW_M", str(defaults.hnsw_m))),
+            hnsw_ef_construction=int(os.getenv("AZURE_AI_SEARCH_HNSW_EF_CONSTRUCTION", str(defaults.hnsw_ef_construction))),
+            hnsw_ef_search=int(os.getenv("AZURE_AI_SEARCH_HNSW_EF_SEARCH", str(defaults.hnsw_ef_search))),
+        )
+
 
 class ResourceStatus(Enum):
     """Status of a resource operation."""
     CREATED = "created"
     EXISTING = "existing"
+    UPDATED = "updated"
     FAILED = "failed"
 
 
@@ -61,8 +146,10 @@ class SearchIndexManager:
     :param deployment_name: The name of the embedding deployment.
     :param embeddings_endpoint: The the endpoint used for embedding.
     :param embed_api_key: The api key used by the embedding resource.
-    :param embedding_client: The embedding client, used t build the embedding. Needed only
-                             to create embedding file. Not used in inference time.
+    :param embedding_client: The AsyncAzureOpenAI client, used to build the embeddings file.
+                             Not used in inference time.
+    :param vector_options: The options of the vector field and vector search configuration,
+                           used when the index is created.
     """
     
     MIN_DIFF_CHARACTERS_IN_LINE = 5
@@ -71,6 +158,8 @@ class SearchIndexManager:
     _SEMANTIC_CONFIG = "semantic_search"
     _EMBEDDING_CONFIG = "embedding_config"
     _VECTORIZER = "search_vectorizer"
+    _ALGORITHM_CONFIG = "embed-algorithms-config"
+    _COMPRESSION_CONFIG = "embed-compression-config"
 
 
     def __init__(
@@ -83,7 +172,8 @@ class SearchIndexManager:
             deployment_name: str,
             embedding_endpoint: str, 
             embed_api_key: Optional[str],
-            embedding_client: Optional[Any] = None
+            embedding_client: Optional[Any] = None,
+            vector_options: Optional[VectorIndexOptions] = None
         ) -> None:
         """Constructor."""
         self._dimensions = dimensions
@@ -97,6 +187,7 @@ class SearchIndexManager:
         self._embed_api_key = embed_api_key
         self._client = None
         self._embedding_client = embedding_client
+        self._vector_options = vector_options or VectorIndexOptions()
 
 
     def _check_dimensions(self, vector_index_dimensions: Optional[int] = None) -> int:
@@ -149,6 +240,8 @@ class SearchIndexManager:
                https://platform.openai.com/docs/models#embeddings
         :return: The newly created search index.
         """
+        options = self._vector_options
+        vector_type = "Edm.Half" if options.vector_type == "half" else SearchFieldDataType.Single
         async with SearchIndexClient(endpoint=self._endpoint, credential=self._credential) as ix_client:
             fields = [
                 SearchField(
@@ -163,21 +256,37 @@ class SearchIndexManager:
                 SearchField(name="title", type=SearchFieldDataType.String, hidden=False),
                 SearchField(
                     name="text_vector",
-                    type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                    type=SearchFieldDataType.Collection(vector_type),
                     vector_search_dimensions=vector_index_dimensions,
                     searchable=True,
+                    # Vectors, which are not stored, can not be retrievable.
+                    hidden=True if not options.stored else None,
+                    stored=False if not options.stored else None,
                     vector_search_profile_name=SearchIndexManager._EMBEDDING_CONFIG
                 ),
             ]
+            compressions = self._get_compressions()
             vector_search = VectorSearch(
                 profiles=[
                     VectorSearchProfile(
                         name=SearchIndexManager._EMBEDDING_CONFIG,
-                        algorithm_configuration_name="embed-algorithms-config",
-                        vectorizer_name=SearchIndexManager._VECTORIZER
+                        algorithm_configuration_name=SearchIndexManager._ALGORITHM_CONFIG,
+                        vectorizer_name=SearchIndexManager._VECTORIZER,
+                        compression_name=SearchIndexManager._COMPRESSION_CONFIG if compressions else None
                     )
                 ],
-                algorithms=[HnswAlgorithmConfiguration(name="embed-algorithms-config")],
+                algorithms=[
+                    HnswAlgorithmConfiguration(
+                        name=SearchIndexManager._ALGORITHM_CONFIG,
+                        parameters=HnswParameters(
+                            m=options.hnsw_m,
+                            ef_construction=options.hnsw_ef_construction,
+                            ef_search=options.hnsw_ef_search,
+                            metric="cosine"
+                        )
+                    )
+                ],
+                compressions=compressions,
                 vectorizers=[
                     AzureOpenAIVectorizer(
                         vectorizer_name=SearchIndexManager._VECTORIZER,
@@ -212,38 +321,90 @@ class SearchIndexManager:
             new_index = await ix_client.create_index(search_index)
         return new_index
 
+    def _get_compressions(self) -> Optional[List]:
+        """Get the vector compression configured by the vector options, None if vectors are not compressed."""
+        options = self._vector_options
+        if options.compression == "none":
+            return None
+        # Full-precision originals are kept only if they are needed for rescoring.
+        rescoring_options = RescoringOptions(
+            enable_rescoring=options.rescoring,
+            default_oversampling=options.oversampling if options.rescoring else None,
+            rescore_storage_method=(
+                VectorSearchCompressionRescoreStorageMethod.PRESERVE_ORIGINALS if options.rescoring
+                else VectorSearchCompressionRescoreStorageMethod.DISCARD_ORIGINALS)
+        )
+        if options.compression == "scalar":
+            return [ScalarQuantizationCompression(
+                compression_name=SearchIndexManager._COMPRESSION_CONFIG,
+                rescoring_options=rescoring_options,
+                parameters=ScalarQuantizationParameters(quantized_data_type="int8")
+            )]
+        if options.compression == "binary":
+            return [BinaryQuantizationCompression(
+                compression_name=SearchIndexManager._COMPRESSION_CONFIG,
+                rescoring_options=rescoring_options
+            )]
+        raise ValueError(f"Unknown vector compression '{options.compression}', expected none, scalar or binary.")
+
     async def create_datasource_maybe(
         self,
         datasource_name: str,
         container_name: str,
         connection_string: str,
+        soft_delete_column_name: Optional[str] = "IsDeleted",
+        soft_delete_marker_value: str = "true",
     ) -> ResourceStatus:
         """
         Create or get data source for blob storage.
 
+        The blob indexers detect changed blobs by their LastModified time, which serves as the built-in
+        high-water mark of the azureblob datasource, so only the delta is processed by every run.
+        Blobs marked with the soft-delete metadata are removed from the index together with their chunks.
+        An existing datasource without the same deletion detection policy is updated in place.
+
         :param datasource_name: Name of the datasource to create or retrieve
-        :param storage_account_endpoint: Azure Storage account endpoint
         :param container_name: Name of blob container
         :param connection_string: Connection string for blob storage
-        :return: ResourceStatus.CREATED, ResourceStatus.EXISTING, or ResourceStatus.FAILED
+        :param soft_delete_column_name: The blob metadata marking deleted blobs, None disables deletion detection
+        :param soft_delete_marker_value: The value of the metadata marking deleted blobs
+        :return: ResourceStatus.CREATED, ResourceStatus.EXISTING, ResourceStatus.UPDATED or ResourceStatus.FAILED
         """
         if not self._endpoint:
             logger.error("Search endpoint is required.")
             return ResourceStatus.FAILED
 
+        deletion_policy = SoftDeleteColumnDeletionDetectionPolicy(
+            soft_delete_column_name=soft_delete_column_name,
+            soft_delete_marker_value=soft_delete_marker_value,
+        ) if soft_delete_column_name else None
         data_source = SearchIndexerDataSourceConnection(
             name=datasource_name,
             type="azureblob",
             connection_string=connection_string,
             container=SearchIndexerDataContainer(name=container_name),
+            data_deletion_detection_policy=deletion_policy,
         )
 
         async with SearchIndexerClient(endpoint=self._endpoint, credential=self._credential) as indexer_client:
             try:
-                await indexer_client.get_data_source_connection(datasource_name)
-                logger.info(f"Data source '{datasource_name}' already exists. Using existing data source.")
-                return ResourceStatus.EXISTING
+                existing = await indexer_client.get_data_source_connection(datasource_name)
             except HttpResponseError:
+                existing = None
+            if existing:
+                if (existing.container.name == container_name
+                        and _deletion_policy(existing.data_deletion_detection_policy) == _deletion_policy(deletion_policy)):
+                    logger.info(f"Data source '{datasource_name}' already exists. Using existing data source.")
+                    return ResourceStatus.EXISTING
+                try:
+                    # The connection string of the existing datasource is not returned, so the desired one is set.
+                    await indexer_client.create_or_update_data_source_connection(data_source)
+                    logger.info(f"Data source '{datasource_name}' updated with the deletion detection policy.")
+                    return ResourceStatus.UPDATED
+                except Exception as e:
+                    logger.error(f"Failed to update data source '{datasource_name}': {e}")
+                    return ResourceStatus.FAILED
+            else:
                 try:
                     await indexer_client.create_data_source_connection(data_source)
                     logger.info(f"Data source '{datasource_name}' created successfully.")
@@ -257,8 +418,8 @@ class SearchIndexManager:
         skillset_name: str,
         target_index_name: str,
         split_mode: Literal["pages"] = "pages",
-        max_page_length: int = 2000,
-        page_overlap_length: int = 500,
+        max_page_length: int = DEFAULT_MAX_PAGE_LENGTH,
+        page_overlap_length: int = DEFAULT_PAGE_OVERLAP_LENGTH,
     ) -> ResourceStatus:
         """
         Create skillset with split and embedding skills.
@@ -324,10 +485,23 @@ class SearchIndexManager:
 
         async with SearchIndexerClient(endpoint=self._endpoint, credential=self._credential) as indexer_client:
             try:
-                await indexer_client.get_skillset(skillset_name)
-                logger.info(f"Skillset '{skillset_name}' already exists. Using existing skillset.")
-                return ResourceStatus.EXISTING
+                existing = await indexer_client.get_skillset(skillset_name)
             except HttpResponseError:
+                existing = None
+            if existing:
+                if _skill_parameters(existing) == _skill_parameters(skillset):
+                    logger.info(f"Skillset '{skillset_name}' already exists. Using existing skillset.")
+                    return ResourceStatus.EXISTING
+                # With the enrichment cache on the indexers, only the outputs of the changed skills are recomputed.
+                try:
+                    skillset.e_tag = existing.e_tag
+                    await indexer_client.create_or_update_skillset(skillset)
+                    logger.info(f"Skillset '{skillset_name}' updated with changed skill parameters.")
+                    return ResourceStatus.UPDATED
+                except Exception as e:
+                    logger.error(f"Failed to update skillset '{skillset_name}': {e}")
+                    return ResourceStatus.FAILED
+            else:
                 try:
                     await indexer_client.create_or_update_skillset(skillset)
                     logger.info(f"Skillset '{skillset_name}' created successfully with Split + Embedding skills and {self._dimensions} dimensions.")
@@ -343,6 +517,8 @@ class SearchIndexManager:
         skillset_name: str,
         file_extensions: str,
         parsing_mode: str,
+        cache_connection_string: Optional[str] = None,
+        run_existing: bool = False,
     ) -> ResourceStatus:
         """
         Create a single indexer for specific file types.
@@ -353,19 +529,46 @@ class SearchIndexManager:
         :param skillset_name: Skillset name to use
         :param file_extensions: Comma-separated file extensions to index (e.g., '.pdf,.docx')
         :param parsing_mode: Parsing mode (markdown or default)
-        :return: ResourceStatus.CREATED, ResourceStatus.EXISTING, or ResourceStatus.FAILED
+        :param cache_connection_string: Connection string of the storage account for the incremental
+               enrichment cache. The cache is added to an existing indexer, which does not have it.
+        :param run_existing: Run the existing indexer, for example after the skillset was updated
+        :return: ResourceStatus.CREATED, ResourceStatus.EXISTING, ResourceStatus.UPDATED or ResourceStatus.FAILED
         """
         if not self._endpoint:
             logger.error("Search endpoint is required.")
             return ResourceStatus.FAILED
 
-        async with SearchIndexerClient(endpoint=self._endpoint, credential=self._credential) as indexer_client:
+        # The enrichment cache is a preview feature, which is not modeled by the GA SDK,
+        # so it is set as a raw property and sent with the preview API version.
+        cache = {
+            "storageConnectionString": cache_connection_string,
+            "enableReprocessing": True,
+        } if cache_connection_string else None
+        client_kwargs = {"api_version": SEARCH_PREVIEW_API_VERSION} if cache else {}
+
+        async with SearchIndexerClient(endpoint=self._endpoint, credential=self._credential, **client_kwargs) as indexer_client:
             try:
-                await indexer_client.get_indexer(indexer_name)
-                logger.info(f"Indexer '{indexer_name}' already exists. Using existing indexer.")
-                return ResourceStatus.EXISTING
+                existing = await indexer_client.get_indexer(indexer_name)
             except HttpResponseError:
-                pass
+                existing = None
+            if existing:
+                status = ResourceStatus.EXISTING
+                try:
+                    if cache and not existing.get("cache"):
+                        existing["cache"] = cache
+                        await indexer_client.create_or_update_indexer(existing)
+                        logger.info(f"Enrichment cache enabled on existing indexer '{indexer_name}'.")
+                        status = ResourceStatus.UPDATED
+                    if run_existing:
+                        await indexer_client.run_indexer(indexer_name)
+                        logger.info(f"Indexer '{indexer_name}' started to process the changes.")
+                        status = ResourceStatus.UPDATED
+                except Exception as e:
+                    logger.error(f"Failed to update indexer '{indexer_name}': {e}")
+                    return ResourceStatus.FAILED
+                if status == ResourceStatus.EXISTING:
+                    logger.info(f"Indexer '{indexer_name}' already exists. Using existing indexer.")
+                return status
 
             config_kwargs = dict(
                 parsing_mode=parsing_mode,
@@ -396,6 +599,8 @@ class SearchIndexManager:
                 output_field_mappings=output_mappings,
                 parameters=indexer_params,
             )
+            if cache:
+                indexer["cache"] = cache
 
             try:
                 await indexer_client.create_indexer(indexer)
@@ -406,6 +611,108 @@ class SearchIndexManager:
                 return ResourceStatus.FAILED
 
 
+    async def build_embeddings_file(
+        self,
+        input_directory: str,
+        embeddings_file: str,
+        cache_path: Optional[str] = None,
+        max_page_length: int = DEFAULT_MAX_PAGE_LENGTH,
+        page_overlap_length: int = DEFAULT_PAGE_OVERLAP_LENGTH,
+        max_concurrency: int = DEFAULT_EMBED_CONCURRENCY,
+    ) -> EmbeddingBuildReport:
+        """
+        Build the embeddings file, uploaded by upload_embeddings_file, from the documents of the directory.
+
+        The documents are split like by the skillset and only the chunks, whose embedding is not in the
+        cache yet, are sent to the embedding deployment.
+
+        :param input_directory: The directory with the .md, .txt and .pdf documents.
+        :param embeddings_file: The embeddings file to write, with the columns token, embedding and title.
+        :param cache_path: The embedding cache database, or None to embed all the chunks.
+        :param max_page_length: The maximal number of characters in a chunk.
+        :param page_overlap_length: The number of characters repeated from the end of the previous chunk.
+        :param max_concurrency: The maximal number of embedding requests in flight.
+        :return: The statistics of the build.
+        :raises ValueError: If the manager was created without the embedding client.
+        """
+        if self._embedding_client is None:
+            raise ValueError("The embedding client is needed to build the embeddings file.")
+        return await build_embeddings_file(
+            self._embedding_client, self._embedding_deployment, self._dimensions, input_directory, embeddings_file,
+            cache_path=cache_path, max_page_length=max_page_length, page_overlap_length=page_overlap_length,
+            max_concurrency=max_concurrency)
+
+    async def upload_embeddings_file(
+        self,
+        embeddings_file: str,
+        max_batch_bytes: int = DEFAULT_PUSH_BATCH_BYTES,
+        max_batch_documents: int = DEFAULT_PUSH_BATCH_DOCUMENTS,
+        max_concurrency: int = DEFAULT_PUSH_CONCURRENCY,
+        max_retries: int = DEFAULT_PUSH_RETRIES,
+    ) -> ResourceStatus:
+        """
+        Push the chunks with precomputed embeddings to the index, without calling the embedding model.
+
+        The file is streamed and the chunks are uploaded in parallel batches, which are limited by their
+        JSON payload size. The documents, which failed with a retriable status, are uploaded again.
+        Any other error of a batch, like an authentication error, stops the push.
+        The chunk key is derived from the title and the text, so uploading the same file again is idempotent.
+
+        :param embeddings_file: The file with the columns token, embedding and title, or the binary embedding store.
+        :param max_batch_bytes: The maximal JSON payload of a batch.
+        :param max_batch_documents: The maximal number of documents in a batch.
+        :param max_concurrency: The maximal number of batches uploaded at the same time.
+        :param max_retries: The number of retries of a failed batch or document.
+        :return: ResourceStatus.CREATED or ResourceStatus.FAILED
+        """
+        chunks = iter_embeddings(embeddings_file)
+        first = await asyncio.to_thread(next, chunks, None)
+        if first is None:
+            logger.warning(f"No chunks found in embeddings file '{embeddings_file}'.")
+            return ResourceStatus.EXISTING
+        if self._dimensions is not None and len(first.embedding) != self._dimensions:
+            logger.error(f"Embeddings file '{embeddings_file}' has {len(first.embedding)} dimensions, "
+                         f"but the index has {self._dimensions}.")
+            return ResourceStatus.FAILED
+
+        documents = _iter_documents(first, chunks)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        uploaded = 0
+        failed = 0
+        start = time.perf_counter()
+
+        async def upload(batch: List[Dict[str, Any]]) -> None:
+            nonlocal uploaded, failed
+            try:
+                succeeded, errors = await _upload_batch(search_client, batch, max_retries)
+                uploaded += succeeded
+                failed += len(errors)
+                for key, message in errors[:5]:
+                    logger.error(f"Failed to upload chunk '{key}': {message}")
+            finally:
+                semaphore.release()
+
+        try:
+            async with SearchClient(endpoint=self._endpoint, index_name=self._index_name, credential=self._credential) as search_client:
+                # The first batch failing with an error, which is not retried, stops the reading and cancels the other batches.
+                async with asyncio.TaskGroup() as uploads:
+                    while True:
+                        batch = await asyncio.to_thread(_next_batch, documents, max_batch_bytes, max_batch_documents)
+                        if not batch:
+                            break
+                        # Read the next batch only when a slot is free, so the memory is bounded by the concurrency.
+                        await semaphore.acquire()
+                        uploads.create_task(upload(batch))
+        except ExceptionGroup as errors:
+            logger.error(f"Stopped pushing the chunks to index '{self._index_name}' after {uploaded} chunk(s): "
+                         f"{errors.exceptions[0]}")
+            return ResourceStatus.FAILED
+
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        logger.info(f"Pushed {uploaded} chunk(s) to index '{self._index_name}' in {elapsed:.1f}s "
+                    f"({uploaded / elapsed:.1f} docs/s), {failed} failed.")
+        return ResourceStatus.FAILED if failed else ResourceStatus.CREATED
+
     async def __aenter__(self):
         """Async context manager entry."""
         return self
@@ -419,3 +726,101 @@ class SearchIndexManager:
         """Close the closeable resources, associated with SearchIndexManager."""
         if self._client:
             await self._client.close()
+
+
+def _skill_parameters(skillset: SearchIndexerSkillset) -> Dict[str, Dict[str, Any]]:
+    """Get the parameters of the skills, which change their outputs, keyed by skill name."""
+    parameter_names = (
+        "text_split_mode", "maximum_page_length", "page_overlap_length",
+        "resource_url", "deployment_name", "model_name", "dimensions",
+    )
+    return {
+        skill.name: {name: getattr(skill, name, None) for name in parameter_names}
+        for skill in skillset.skills or []
+    }
+
+
+def _deletion_policy(policy: Optional[SoftDeleteColumnDeletionDetectionPolicy]) -> Optional[tuple]:
+    """Get the comparable settings of the deletion detection policy."""
+    if policy is None:
+        return None
+    return (
+        getattr(policy, "soft_delete_column_name", None),
+        getattr(policy, "soft_delete_marker_value", None),
+    )
+
+
+def _iter_documents(first: EmbeddedChunk, chunks: Iterator[EmbeddedChunk]) -> Iterator[Dict[str, Any]]:
+    """Map the embedded chunks to the documents of the index schema."""
+    yield _to_document(first)
+    for chunk in chunks:
+        yield _to_document(chunk)
+
+
+def _to_document(chunk: EmbeddedChunk) -> Dict[str, Any]:
+    """Map the embedded chunk to the document of the index schema."""
+    digest = hashlib.sha256(f"{chunk.title}\0{chunk.chunk}".encode()).hexdigest()
+    return {
+        "chunk_id": digest[:32],
+        "parent_id": chunk.title,
+        "chunk": chunk.chunk,
+        "title": chunk.title,
+        "text_vector": chunk.embedding,
+    }
+
+
+def _next_batch(documents: Iterator[Dict[str, Any]], max_batch_bytes: int, max_batch_documents: int) -> List[Dict[str, Any]]:
+    """Take the documents up to the payload size or count limit; called from a worker thread."""
+    batch = []
+    size = 0
+    for document in documents:
+        batch.append(document)
+        size += len(json.dumps(document))
+        if size >= max_batch_bytes or len(batch) >= max_batch_documents:
+            break
+    return batch
+
+
+async def _upload_batch(search_client: SearchClient, batch: List[Dict[str, Any]], max_retries: int) -> tuple:
+    """
+    Upload the batch, retrying the documents which failed with a retriable status.
+
+    :return: The number of uploaded documents and the keys and error messages of the failed documents.
+    :raises HttpResponseError: If the request failed with a status, which is not retriable, like 401 or 403.
+    """
+    pending = batch
+    succeeded = 0
+    failed = []
+    retry_errors = []
+    for attempt in range(max_retries + 1):
+        retry = []
+        retry_errors = []
+        try:
+            results = await search_client.merge_or_upload_documents(documents=pending)
+        except HttpResponseError as e:
+            if not _is_retriable(e.status_code):
+                # The other batches would fail the same way, so the push is stopped.
+                raise
+            retry = pending
+            retry_errors = [(document["chunk_id"], str(e)) for document in pending]
+        else:
+            by_key = {document["chunk_id"]: document for document in pending}
+            for result in results:
+                if result.succeeded:
+                    succeeded += 1
+                elif _is_retriable(result.status_code):
+                    retry.append(by_key[result.key])
+                    retry_errors.append((result.key, result.error_message))
+                else:
+                    failed.append((result.key, result.error_message))
+        if not retry:
+            return succeeded, failed
+        if attempt < max_retries:
+            await asyncio.sleep(2 ** attempt)
+        pending = retry
+    failed.extend(retry_errors)
+    return succeeded, failed
+
+
+def _is_retriable(status_code: Optional[int]) -> bool:
+    return status_code is None or status_code in _RETRIABLE_STATUS_CODES or status_code >= 500
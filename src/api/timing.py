@@ -0,0 +1,72 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from opentelemetry.trace import Span
+
+logger = logging.getLogger("azureaiapp.timing")
+
+DEFAULT_SLOW_REQUEST_MS = 5000.0
+
+
+class PhaseTimer:
+    """
+    Time the phases of a request, like the calls of the conversations API and the time to the first streamed event.
+
+    The timer costs a perf_counter call per phase boundary. A phase timed more than once, like the time to the
+    first event of every round of function calls, accumulates its durations.
+
+    :param route: The route of the request, written in the slow request log.
+    """
+
+    def __init__(self, route: str) -> None:
+        self.route = route
+        self.phases: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds * 1000
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self) -> Dict[str, float]:
+        """Get the durations of the phases and of the whole request so far in milliseconds."""
+        timings = {name: round(duration, 1) for name, duration in self.phases.items()}
+        timings["total"] = round(self.total_ms(), 1)
+        return timings
+
+    def server_timing(self) -> str:
+        """Format the durations as the value of a Server-Timing header, shown by the network tab of the browsers."""
+        return ", ".join(f"{name};dur={duration}" for name, duration in self.to_dict().items())
+
+    def set_span_attributes(self, span: Span) -> None:
+        for name, duration in self.to_dict().items():
+            span.set_attribute(f"app.timing.{name}_ms", duration)
+
+    def log_if_slow(self, conversation_id: Optional[str] = None) -> None:
+        """
+        Log the phases of the request, if it took at least APP_SLOW_REQUEST_MS (default 5000), for the share
+        APP_SLOW_REQUEST_LOG_SAMPLE_RATE (default 1) of the slow requests.
+        """
+        timings = self.to_dict()
+        if timings["total"] < float(os.getenv("APP_SLOW_REQUEST_MS", str(DEFAULT_SLOW_REQUEST_MS))):
+            return
+        if random.random() >= float(os.getenv("APP_SLOW_REQUEST_LOG_SAMPLE_RATE", "1.0")):
+            return
+        logger.warning(f"Slow request {self.route} conversation={conversation_id}: {json.dumps(timings)}")
@@ -0,0 +1,216 @@
+from typing import Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import os
+import threading
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_OFF, ALWAYS_ON, ParentBased, Sampler, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+logger = logging.getLogger("azureaiapp")
+
+SAMPLERS = ("always_on", "always_off", "ratio", "parentbased_ratio", "tail")
+DEFAULT_TAIL_LATENCY_MS = 5000.0
+DEFAULT_TAIL_MAX_TRACES = 2048
+# The trace id bits compared with the ratio, like by TraceIdRatioBased, so the services agree on a trace.
+_TRACE_ID_MASK = (1 << 64) - 1
+
+
+@dataclass
+class TracingSettings:
+    """
+    The settings of the tracing, read from the environment by get_tracing_settings.
+
+    :param sampler: One of SAMPLERS.
+    :param ratio: The share of the traces sampled by the ratio samplers, or kept by the tail sampling
+                  if they are neither slow nor failed.
+    :param tail_latency_ms: The duration, from which the tail sampling keeps a trace.
+    :param tail_max_traces: The maximal number of unfinished traces buffered by the tail sampling.
+    :param record_content: Whether the agent instrumentation records the messages and the tool arguments.
+    """
+    sampler: str = "always_on"
+    ratio: float = 1.0
+    tail_latency_ms: float = DEFAULT_TAIL_LATENCY_MS
+    tail_max_traces: int = DEFAULT_TAIL_MAX_TRACES
+    record_content: bool = False
+
+
+def get_tracing_settings() -> TracingSettings:
+    """
+    Read the tracing settings from APP_TRACE_SAMPLER, APP_TRACE_SAMPLING_RATIO, APP_TRACE_TAIL_LATENCY_MS,
+    APP_TRACE_TAIL_MAX_TRACES and OTEL_INSTRUMENTATION_GENAI_CAPTURE_MESSAGE_CONTENT.
+
+    :raises ValueError: If the sampler is unsupported or the ratio is not between 0 and 1.
+    """
+    settings = TracingSettings(
+        sampler=os.getenv("APP_TRACE_SAMPLER", "always_on").lower(),
+        ratio=float(os.getenv("APP_TRACE_SAMPLING_RATIO", "1.0")),
+        tail_latency_ms=float(os.getenv("APP_TRACE_TAIL_LATENCY_MS", str(DEFAULT_TAIL_LATENCY_MS))),
+        tail_max_traces=int(os.getenv("APP_TRACE_TAIL_MAX_TRACES", str(DEFAULT_TAIL_MAX_TRACES))),
+        record_content=os.getenv("OTEL_INSTRUMENTATION_GENAI_CAPTURE_MESSAGE_CONTENT", "false").lower() == "true",
+    )
+    if settings.sampler not in SAMPLERS:
+        raise ValueError(f"Unsupported APP_TRACE_SAMPLER '{settings.sampler}', expected one of {SAMPLERS}.")
+    if not 0.0 <= settings.ratio <= 1.0:
+        raise ValueError("APP_TRACE_SAMPLING_RATIO must be between 0 and 1.")
+    return settings
+
+
+def create_sampler(settings: TracingSettings) -> Sampler:
+    """
+    Create the head sampler of the settings.
+
+    The ratio sampler decides on the trace id of every span; the parent-based one follows the decision
+    of the caller or of the parent span and applies the ratio only to the root spans. The tail sampling
+    records all the spans, which are kept or dropped when their trace ends.
+    """
+    if settings.sampler == "always_off":
+        return ALWAYS_OFF
+    if settings.sampler == "ratio":
+        return TraceIdRatioBased(settings.ratio)
+    if settings.sampler == "parentbased_ratio":
+        return ParentBased(TraceIdRatioBased(settings.ratio))
+    return ParentBased(ALWAYS_ON)
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Keep the traces, which are slow or failed, and the ratio of the others, when their local root span ends.
+
+    The ended spans are buffered per trace until the root span of the trace in this process ends; a trace is
+    kept if the root took at least latency_ms, if one of its spans has the error status, or if its trace id
+    falls in the ratio. The spans of the kept traces are passed to the delegate processor, which exports them.
+    At most max_traces unfinished traces are buffered, the oldest are dropped beyond.
+
+    :param delegate: The processor of the kept spans, usually a BatchSpanProcessor.
+    :param latency_ms: The duration of the root span, from which a trace is kept.
+    :param ratio: The share of the other traces, which are kept.
+    :param max_traces: The maximal number of buffered unfinished traces.
+    """
+
+    def __init__(self, delegate: SpanProcessor, latency_ms: float, ratio: float, max_traces: int = DEFAULT_TAIL_MAX_TRACES) -> None:
+        self._delegate = delegate
+        self._latency_ns = int(latency_ms * 1e6)
+        self._bound = round(ratio * (1 << 64))
+        self._max_traces = max(1, max_traces)
+        self._traces: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        # The recent decisions, applied to the spans ending after their root span.
+        self._decisions: "OrderedDict[int, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.kept_traces = 0
+        self.dropped_traces = 0
+        self.evicted_traces = 0
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self._delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is None:
+                spans = self._traces.pop(trace_id, [])
+                spans.append(span)
+                if span.parent is not None and not span.parent.is_remote:
+                    self._traces[trace_id] = spans
+                    if len(self._traces) > self._max_traces:
+                        self._traces.popitem(last=False)
+                        self.evicted_traces += 1
+                    return
+                decision = self._decide(span, spans)
+                self._decisions[trace_id] = decision
+                if len(self._decisions) > self._max_traces:
+                    self._decisions.popitem(last=False)
+            else:
+                spans = [span]
+        if decision:
+            for ended in spans:
+                self._delegate.on_end(ended)
+
+    def _decide(self, root: ReadableSpan, spans: List[ReadableSpan]) -> bool:
+        keep = (
+            root.end_time - root.start_time >= self._latency_ns
+            or any(span.status.status_code == StatusCode.ERROR for span in spans)
+            or (root.context.trace_id & _TRACE_ID_MASK) < self._bound
+        )
+        if keep:
+            self.kept_traces += 1
+        else:
+            self.dropped_traces += 1
+        return keep
+
+    def shutdown(self) -> None:
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._delegate.force_flush(timeout_millis)
+
+
+def create_tracer_provider(settings: TracingSettings, exporter: SpanExporter, resource: Optional[Resource] = None) -> TracerProvider:
+    """
+    Create the tracer provider exporting the sampled spans through a batch span processor.
+
+    The batch span processor is tuned with the standard environment variables OTEL_BSP_SCHEDULE_DELAY,
+    OTEL_BSP_MAX_QUEUE_SIZE, OTEL_BSP_MAX_EXPORT_BATCH_SIZE and OTEL_BSP_EXPORT_TIMEOUT.
+    """
+    provider = TracerProvider(sampler=create_sampler(settings), resource=resource or Resource.create())
+    processor: SpanProcessor = BatchSpanProcessor(exporter)
+    if settings.sampler == "tail":
+        processor = TailSamplingSpanProcessor(processor, settings.tail_latency_ms, settings.ratio, settings.tail_max_traces)
+    provider.add_span_processor(processor)
+    return provider
+
+
+def get_tracing_summary(settings: TracingSettings) -> Dict[str, object]:
+    summary: Dict[str, object] = {"sampler": settings.sampler, "record_content": settings.record_content}
+    if settings.sampler in ("ratio", "parentbased_ratio", "tail"):
+        summary["ratio"] = settings.ratio
+    if settings.sampler == "tail":
+        summary["tail_latency_ms"] = settings.tail_latency_ms
+    return summary
+
+
+def configure_tracing(connection_string: str) -> TracingSettings:
+    """
+    Configure the export of the traces, logs and metrics to Application Insights and the agent instrumentation.
+
+    The tracer provider is created with the sampler of the settings; configure_azure_monitor, whose own
+    tracing pipeline only supports the ratio sampling, sets up the logs, the metrics and the library
+    instrumentations, which use that provider.
+
+    :param connection_string: The connection string of Application Insights.
+    :return: The applied tracing settings.
+    """
+    from azure.ai.projects.telemetry import AIProjectInstrumentor
+    from azure.monitor.opentelemetry import configure_azure_monitor
+    from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
+    from opentelemetry import trace
+
+    settings = get_tracing_settings()
+    trace.set_tracer_provider(create_tracer_provider(settings, AzureMonitorTraceExporter(connection_string=connection_string)))
+    try:
+        from azure.core.settings import settings as azure_settings
+        from azure.core.tracing.ext.opentelemetry_span import OpenTelemetrySpan
+        azure_settings.tracing_implementation = OpenTelemetrySpan
+    except ImportError as e:
+        logger.warning(f"The Azure SDK calls are not traced: {e}")
+
+    # configure_azure_monitor takes no sampler and reads disable_tracing only from OTEL_TRACES_EXPORTER,
+    # so it is set for the call, which then keeps the tracer provider set above.
+    traces_exporter = os.environ.get("OTEL_TRACES_EXPORTER")
+    os.environ["OTEL_TRACES_EXPORTER"] = "none"
+    try:
+        configure_azure_monitor(connection_string=connection_string)
+    finally:
+        if traces_exporter is None:
+            del os.environ["OTEL_TRACES_EXPORTER"]
+        else:
+            os.environ["OTEL_TRACES_EXPORTER"] = traces_exporter
+    AIProjectInstrumentor().instrument(enable_content_recording=settings.record_content)
+    logger.info(f"Configured the tracing: {get_tracing_summary(settings)}")
+    return settings
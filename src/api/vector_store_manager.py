@@ -0,0 +1,196 @@
+from typing import Dict, Iterable, List, Optional, Set
+import asyncio
+import hashlib
+import logging
+
+from openai import AsyncOpenAI
+
+from util import hash_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPLOAD_CONCURRENCY = 8
+
+
+class VectorStoreManager:
+    """
+    Manager for the File Search vector store built from the local files.
+
+    The corpus is fingerprinted by the content hashes of its files and the fingerprint is recorded
+    in the vector store metadata, so that a store built from the same corpus is reused across restarts.
+    Each vector store file carries the name and the content hash of its source file as attributes,
+    which allows to upload only the changed files when the corpus changes.
+
+    :param openai_client: The OpenAI client of the project.
+    :param corpus_name: The name identifying the corpus, recorded in the vector store metadata.
+    """
+
+    CORPUS_METADATA_KEY = "corpus"
+    FINGERPRINT_METADATA_KEY = "corpus_fingerprint"
+    FILE_NAME_ATTRIBUTE = "file_name"
+    CONTENT_HASH_ATTRIBUTE = "content_sha256"
+
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        corpus_name: str,
+    ) -> None:
+        """Constructor."""
+        self._client = openai_client
+        self._corpus_name = corpus_name
+
+    async def get_or_update_vector_store(
+        self,
+        file_paths: Dict[str, str],
+        max_concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+        in_use: Optional[Iterable[str]] = None,
+    ) -> str:
+        """
+        Get the vector store for the corpus, building a new one if the corpus changed.
+
+        The new store is built next to the current ones, which keep serving the agents meanwhile; the files
+        unchanged since the latest complete store are attached to it again instead of being uploaded. Only once
+        the new store is complete, the other stores of the corpus, which no agent version uses, are deleted.
+        If the build fails, the new store is deleted and the latest complete store is kept.
+
+        :param file_paths: The local paths of the corpus files keyed by file name.
+        :param max_concurrency: Maximum number of files hashed or uploaded at the same time.
+        :param in_use: The ids of the vector stores used by the agent versions, which are never deleted.
+                       If None, no store is deleted.
+        :return: The id of the vector store.
+        """
+        hashes = await _hash_files(file_paths, max_concurrency)
+        fingerprint = _fingerprint(hashes)
+
+        stores = [store async for store in self._client.vector_stores.list(order="desc")
+                  if (store.metadata or {}).get(VectorStoreManager.CORPUS_METADATA_KEY) == self._corpus_name]
+        completed = [store for store in stores if store.status == "completed"]
+        current = next((store for store in completed
+                        if store.metadata.get(VectorStoreManager.FINGERPRINT_METADATA_KEY) == fingerprint), None)
+
+        if current:
+            logger.info(f"Reusing vector store (id: {current.id}) with unchanged corpus fingerprint {fingerprint[:12]}.")
+        else:
+            base = next((store for store in completed
+                         if store.metadata.get(VectorStoreManager.FINGERPRINT_METADATA_KEY)), None)
+            current = await self._client.vector_stores.create(
+                name=self._corpus_name,
+                metadata={VectorStoreManager.CORPUS_METADATA_KEY: self._corpus_name})
+            failed = await self._add_files(current.id, file_paths, hashes, max_concurrency, base.id if base else None)
+            if failed:
+                logger.error(f"Failed to add {len(failed)} file(s) to vector store (id: {current.id}): {', '.join(failed)}")
+                if not base:
+                    # Without a complete store, serve the partial one; it has no fingerprint, so it is rebuilt next time.
+                    return current.id
+                await self._delete_stores([current], keep=[base.id])
+                logger.warning(f"Keeping the previous vector store (id: {base.id}).")
+                return base.id
+            # Record the fingerprint only when the store matches the corpus.
+            await self._client.vector_stores.update(current.id, metadata={
+                VectorStoreManager.CORPUS_METADATA_KEY: self._corpus_name,
+                VectorStoreManager.FINGERPRINT_METADATA_KEY: fingerprint,
+            })
+            logger.info(f"Vector store (id: {current.id}) built for corpus fingerprint {fingerprint[:12]}.")
+
+        if in_use is None:
+            logger.info("The vector stores used by the agent versions are unknown, not deleting superseded stores.")
+        else:
+            keep = {current.id} | set(in_use)
+            await self._delete_stores([store for store in stores if store.id not in keep], keep)
+        return current.id
+
+    async def _add_files(
+        self,
+        vector_store_id: str,
+        file_paths: Dict[str, str],
+        hashes: Dict[str, str],
+        max_concurrency: int,
+        base_id: Optional[str] = None,
+    ) -> List[str]:
+        """
+        Add the corpus files to the new vector store, attaching the unchanged files of the base store
+        and uploading the others.
+
+        :return: The names of the files which could not be added.
+        """
+        reusable: Dict[str, str] = {}
+        if base_id:
+            async for vs_file in self._client.vector_stores.files.list(vector_store_id=base_id):
+                attributes = vs_file.attributes or {}
+                file_name = attributes.get(VectorStoreManager.FILE_NAME_ATTRIBUTE)
+                if (file_name in hashes and vs_file.status == "completed"
+                        and attributes.get(VectorStoreManager.CONTENT_HASH_ATTRIBUTE) == hashes[file_name]):
+                    reusable[file_name] = vs_file.id
+        logger.info(f"Building vector store (id: {vector_store_id}): {len(file_paths) - len(reusable)} file(s) "
+                    f"to upload, {len(reusable)} unchanged.")
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        failed: List[str] = []
+
+        async def add(file_name: str) -> None:
+            async with semaphore:
+                try:
+                    file_id = reusable.get(file_name)
+                    if not file_id:
+                        # The file is streamed from disk and closed as soon as it is uploaded.
+                        stream = await asyncio.to_thread(open, file_paths[file_name], "rb")
+                        with stream:
+                            file_id = (await self._client.files.create(file=stream, purpose="assistants")).id
+                    vs_file = await self._client.vector_stores.files.create_and_poll(
+                        file_id=file_id,
+                        vector_store_id=vector_store_id,
+                        attributes={
+                            VectorStoreManager.FILE_NAME_ATTRIBUTE: file_name,
+                            VectorStoreManager.CONTENT_HASH_ATTRIBUTE: hashes[file_name],
+                        })
+                    if vs_file.status != "completed":
+                        raise RuntimeError(f"file processing ended with status '{vs_file.status}'")
+                except Exception as e:
+                    logger.warning(f"Failed to add '{file_name}' to vector store: {e}")
+                    failed.append(file_name)
+
+        await asyncio.gather(*(add(file_name) for file_name in sorted(file_paths)))
+        return failed
+
+    async def _delete_stores(self, stores: List, keep: Iterable[str]) -> None:
+        """Delete the vector stores and their files, except the files shared with the kept stores."""
+        if not stores:
+            return
+        kept_files: Set[str] = set()
+        for store_id in keep:
+            try:
+                kept_files.update([vs_file.id async for vs_file in self._client.vector_stores.files.list(vector_store_id=store_id)])
+            except Exception as e:
+                logger.warning(f"Failed to list the files of vector store (id: {store_id}), not deleting any store: {e}")
+                return
+        for store in stores:
+            try:
+                file_ids = [vs_file.id async for vs_file in self._client.vector_stores.files.list(vector_store_id=store.id)]
+                await self._client.vector_stores.delete(store.id)
+                for file_id in file_ids:
+                    if file_id not in kept_files:
+                        await self._client.files.delete(file_id)
+                logger.info(f"Deleted vector store (id: {store.id}).")
+            except Exception as e:
+                logger.warning(f"Failed to delete vector store (id: {store.id}): {e}")
+
+
+async def _hash_files(file_paths: Dict[str, str], max_concurrency: int) -> Dict[str, str]:
+    """Compute the SHA-256 of the files in worker threads."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def hash_one(path: str) -> str:
+        async with semaphore:
+            return await asyncio.to_thread(hash_file, path)
+
+    names = sorted(file_paths)
+    digests = await asyncio.gather(*(hash_one(file_paths[name]) for name in names))
+    return dict(zip(names, digests))
+
+
+def _fingerprint(hashes: Dict[str, str]) -> str:
+    """Return the fingerprint of the corpus from the file names and their content hashes."""
+    digest = hashlib.sha256()
+    for name in sorted(hashes):
+        digest.update(f"{name}\0{hashes[name]}\n".encode())
+    return digest.hexdigest()
@@ -329,6 +329,9 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
             } else if (data.type === "thread_run") {
               // Log the run status info
               console.log("[ChatClient] Run status info:", data.content);
+            } else if (data.type === "timing") {
+              // Log the server-side durations of the request phases
+              console.log("[ChatClient] Server timing (ms):", data.phases);
             } else {
               // If we have no messageDiv yet, create one
               if (!chatItem) {
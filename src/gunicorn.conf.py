@@ -1,33 +1,29 @@
 # Copyright (c) Microsoft. All rights reserved.
 # Licensed under the MIT license.
 # See LICENSE file in the project root for full license information.
-from typing import Dict, List, Optional
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
 
 import asyncio
+import gc
 import multiprocessing
 import os
+import sys
 import tempfile
 
-from azure.ai.projects.aio import AIProjectClient
-from azure.identity.aio import DefaultAzureCredential
-from azure.core.credentials_async import AsyncTokenCredential
-from azure.ai.projects.models import PromptAgentDefinition
-from azure.ai.projects.models import FileSearchTool, AzureAISearchTool, Tool, AzureAISearchToolResource, AISearchIndexResource, AgentVersionDetails, ConnectionType
-
-from azure.ai.projects.models import (
-    PromptAgentDefinition,
-    EvaluationRule,
-    ContinuousEvaluationRuleAction,
-    EvaluationRuleFilter,
-    EvaluationRuleEventType,
-    EvaluationRuleActionType
-)
-
-
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from logging_config import configure_logging
-from util import get_env_file_path
+from util import get_env_file_path, get_cache_dir
+from worker_memory import format_memory_usage, freeze_enabled, prepare_for_fork, read_memory_usage
+from worker_tuning import get_workers, read_tuning
+
+# The SDKs are imported by the provisioning steps using them, so loading the configuration stays fast.
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.ai.projects.models import AgentVersionDetails, Tool
+    from azure.core.credentials_async import AsyncTokenCredential
+    from openai import AsyncOpenAI
 
 # Load environment variables from azd environment folder for local development
 env_file = get_env_file_path()
@@ -40,6 +36,26 @@ else:
     logger.info("Loaded environment variables from default location")
 
 
+def _prepare_metrics_directory() -> None:
+    """
+    Set up the directory, through which the workers share their metrics, before the app imports prometheus_client.
+
+    The files of a previous run are removed, so the counters start from zero.
+    """
+    if os.getenv("ENABLE_METRICS", "false").lower() != "true":
+        return
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.path.join(get_cache_dir(), "metrics")
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    logger.info(f"The workers share their metrics through {metrics_dir}")
+
+
+_prepare_metrics_directory()
+
+
 def list_files_in_files_directory() -> List[str]:    
     # Get the absolute path of the 'files' directory
     files_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), 'files'))
@@ -51,6 +67,17 @@ def list_files_in_files_directory() -> List[str]:
 
 FILES_NAMES = list_files_in_files_directory()
 
+# Desired configuration of the AI Search resources
+SKILLSET_MAX_PAGE_LENGTH = 2000
+SKILLSET_PAGE_OVERLAP_LENGTH = 500
+
+# Keys of the provisioning ledger entries
+LEDGER_AI_SEARCH_KEY = "ai_search"
+LEDGER_EVAL_RULE_KEY = "eval_rule"
+
+# Precomputed embeddings of the files, pushed to the index in the push ingestion mode
+DEFAULT_EMBEDDINGS_FILE = os.path.join(os.path.dirname(__file__), 'api', 'data', 'embeddings.csv')
+
 
 async def execute_step(
     step_name: str,
@@ -101,7 +128,7 @@ def _print_summary(resources: Dict, steps_order: List[str]) -> None:
     for i, step_name in enumerate(steps_order, 1):
         status = resources.get(step_name)
         if status:
-            status_symbol = "✓" if status.value == "created" else "ℹ" if status.value == "existing" else "✗"
+            status_symbol = "✓" if status.value in ("created", "updated") else "ℹ" if status.value == "existing" else "✗"
             logger.info(f"{i}. {step_name}: {status_symbol} {status.value}")
         else:
             logger.info(f"{i}. {step_name}: ✗ failed")
@@ -109,6 +136,112 @@ def _print_summary(resources: Dict, steps_order: List[str]) -> None:
     logger.info("=" * 80)
 
 
+def _force_reconcile() -> bool:
+    """Whether the full reconciliation is forced with --force or PROVISIONING_FORCE=true."""
+    return "--force" in sys.argv or os.getenv("PROVISIONING_FORCE", "false").lower() == "true"
+
+
+def _get_provisioning_ledger():
+    """Get the ledger of the provisioning runs, stored in the cache directory."""
+    from api.provisioning_ledger import ProvisioningLedger, DEFAULT_VERIFY_INTERVAL_SECONDS
+    return ProvisioningLedger(
+        os.path.join(get_cache_dir(), "provisioning_ledger.json"),
+        verify_interval_seconds=float(os.getenv(
+            "PROVISIONING_VERIFY_INTERVAL_SECONDS", str(DEFAULT_VERIFY_INTERVAL_SECONDS))),
+        force=_force_reconcile()
+    )
+
+
+def _get_files_signature(files_directory: str) -> List[List]:
+    """
+    Get the relative path, size and mtime of every file, without reading the content.
+
+    :param files_directory: The directory with the files to upload.
+    """
+    signature = []
+    for root, _, filenames in os.walk(files_directory):
+        for filename in sorted(filenames):
+            stat = os.stat(os.path.join(root, filename))
+            signature.append([os.path.relpath(os.path.join(root, filename), files_directory), stat.st_size, stat.st_mtime_ns])
+    return sorted(signature)
+
+
+def _has_changes(resources: Dict) -> bool:
+    """Whether the synced files, datasource or skillset changed, so that the existing indexers need to run."""
+    return any(
+        resources.get(step_name) is not None and resources[step_name].value in ("created", "updated")
+        for step_name in ("blob_upload", "search_datasource", "search_skillset")
+    )
+
+
+def _build_ai_search_tool(conn_id: str, search_index_name: str) -> Tool:
+    """Build the AI Search tool for the index, with the query type from AZURE_AI_SEARCH_QUERY_TYPE."""
+    from azure.ai.projects.models import AISearchIndexResource, AzureAISearchTool, AzureAISearchToolResource
+
+    return AzureAISearchTool(
+        azure_ai_search=AzureAISearchToolResource(indexes=[AISearchIndexResource(
+            project_connection_id=conn_id,
+            index_name=search_index_name,
+            query_type=os.getenv('AZURE_AI_SEARCH_QUERY_TYPE', 'simple')
+        )])
+    )
+
+
+async def _verify_search_index(endpoint: str, creds: AsyncTokenCredential, search_index_name: str) -> bool:
+    """Cheap verification of the provisioned AI Search resources: check that the index exists."""
+    from azure.search.documents.indexes.aio import SearchIndexClient
+    try:
+        async with SearchIndexClient(endpoint=endpoint, credential=creds) as ix_client:
+            await ix_client.get_index(search_index_name)
+        return True
+    except Exception as e:
+        logger.warning(f"Verification of search index '{search_index_name}' failed: {e}")
+        return False
+
+
+async def _create_push_mode_tool_maybe(
+        search_mgr, search_index_name: str, embeddings_file: str,
+        ledger, config_hash: str, conn_id: Optional[str]) -> Optional[Tool]:
+    """
+    Create the index and push the chunks with precomputed embeddings, instead of the blob indexers.
+
+    :param search_mgr: The SearchIndexManager of the index.
+    :param search_index_name: The name of the index.
+    :param embeddings_file: The file with the chunks and their embeddings.
+    :param ledger: The provisioning ledger.
+    :param config_hash: The hash of the desired configuration.
+    :param conn_id: The id of the AI Search connection of the project.
+    :return: AzureAISearchAgentTool if successful, None otherwise
+    """
+    from api.search_index_manager import ResourceStatus
+
+    steps_order = ["search_index", "push_embeddings"]
+    resources = {}
+
+    async def search_index_step():
+        return await search_mgr.create_index_maybe(
+            vector_index_dimensions=int(os.getenv('AZURE_AI_EMBED_DIMENSIONS', '1536'))
+        )
+
+    await execute_step("search_index", search_index_step, resources, steps_order)
+
+    async def push_embeddings_step():
+        return await search_mgr.upload_embeddings_file(
+            embeddings_file,
+            max_concurrency=int(os.getenv('AZURE_AI_SEARCH_PUSH_CONCURRENCY', '4'))
+        )
+
+    await execute_step("push_embeddings", push_embeddings_step, resources, steps_order)
+    _print_summary(resources, steps_order)
+
+    if all(s != ResourceStatus.FAILED for s in resources.values()) and conn_id:
+        ledger.record(LEDGER_AI_SEARCH_KEY, config_hash)
+        return _build_ai_search_tool(conn_id, search_index_name)
+    ledger.invalidate(LEDGER_AI_SEARCH_KEY)
+    logger.error("✗ Failed to push the embeddings to the search index. Falling back to File Search.")
+    return None
+
+
 async def create_ai_search_tool_maybe(
         ai_client: AIProjectClient, creds: AsyncTokenCredential) -> Optional[Tool]:
     """
@@ -119,7 +252,11 @@ async def create_ai_search_tool_maybe(
     :param creds: The credentials, used for the resources.
     :return: AzureAISearchAgentTool if successful, None otherwise
     """
-    from api.search_index_manager import SearchIndexManager, ResourceStatus
+    from azure.ai.projects.models import ConnectionType
+    from api.search_index_manager import (
+        SearchIndexManager, ResourceStatus, VectorIndexOptions, INDEXERS, get_resource_prefix
+    )
+    from dataclasses import asdict
     from api.blob_store_manager import BlobStoreManager
     from openai import AsyncAzureOpenAI
     
@@ -131,6 +268,63 @@ async def create_ai_search_tool_maybe(
     if not endpoint or not embedding:
         logger.warning("AI Search endpoint or embedding deployment not configured. Skipping AI Search setup.")
         return None
+
+    from api.provisioning_ledger import LedgerState, ProvisioningLedger
+
+    # Sanitize index name for resource naming
+    sanitized_name = get_resource_prefix(search_index_name)
+    datasource_name = f"{sanitized_name}-datasource"
+    skillset_name = f"{sanitized_name}-skillset"
+    files_dir = os.path.join(os.path.dirname(__file__), 'files')
+    conn_id = os.environ.get('SEARCH_CONNECTION_ID')
+    vector_options = VectorIndexOptions.from_env()
+    ingestion_mode = os.getenv('AZURE_AI_SEARCH_INGESTION_MODE', 'indexer').lower()
+    embeddings_file = os.getenv('AZURE_AI_SEARCH_EMBEDDINGS_FILE', DEFAULT_EMBEDDINGS_FILE)
+    use_enrichment_cache = os.getenv('AZURE_AI_SEARCH_ENRICHMENT_CACHE', 'true').lower() == 'true'
+
+    # Skip the control-plane probes if this configuration was already provisioned and verified
+    desired_config = {
+        "search_endpoint": endpoint,
+        "search_connection_id": conn_id,
+        "storage_account_resource_id": os.getenv("STORAGE_ACCOUNT_RESOURCE_ID"),
+        "container": container_name,
+        "files": _get_files_signature(files_dir),
+        "index": {
+            "name": search_index_name,
+            "dimensions": int(os.getenv('AZURE_AI_EMBED_DIMENSIONS', '1536')),
+            "embedding_deployment": embedding,
+            "vector_options": asdict(vector_options),
+        },
+        "datasource": {
+            "name": datasource_name,
+            "soft_delete_column_name": "IsDeleted",
+        },
+        "skillset": {
+            "name": skillset_name,
+            "max_page_length": SKILLSET_MAX_PAGE_LENGTH,
+            "page_overlap_length": SKILLSET_PAGE_OVERLAP_LENGTH,
+        },
+        "indexers": {
+            f"{sanitized_name}-{kind}-indexer": [file_extensions, parsing_mode]
+            for kind, file_extensions, parsing_mode in INDEXERS
+        },
+        "enrichment_cache": use_enrichment_cache,
+        "ingestion_mode": ingestion_mode,
+    }
+    if ingestion_mode == "push":
+        # A binary embedding store is a directory, whose meta.json is rewritten by every conversion
+        embeddings_stat = os.stat(os.path.join(embeddings_file, 'meta.json') if os.path.isdir(embeddings_file) else embeddings_file)
+        desired_config["embeddings_file"] = [embeddings_file, embeddings_stat.st_size, embeddings_stat.st_mtime_ns]
+    ledger = _get_provisioning_ledger()
+    config_hash = ProvisioningLedger.hash_config(desired_config)
+    ledger_state = ledger.check(LEDGER_AI_SEARCH_KEY, config_hash)
+    if conn_id and ledger_state == LedgerState.NEEDS_VERIFICATION:
+        if await _verify_search_index(endpoint, creds, search_index_name):
+            ledger.record(LEDGER_AI_SEARCH_KEY, config_hash)
+            ledger_state = LedgerState.CURRENT
+    if conn_id and ledger_state == LedgerState.CURRENT:
+        logger.info("AI Search resources match the provisioning ledger. Skipping the provisioning steps.")
+        return _build_ai_search_tool(conn_id, search_index_name)
     
     try:
         aoai_connection = await ai_client.connections.get_default(
@@ -156,8 +350,13 @@ async def create_ai_search_tool_maybe(
         deployment_name=embedding,
         embedding_endpoint=aoai_connection.target,
         embed_api_key=None,
-        embedding_client=embedding_client
+        embedding_client=embedding_client,
+        vector_options=vector_options
     )
+
+    if ingestion_mode == "push":
+        return await _create_push_mode_tool_maybe(
+            search_mgr, search_index_name, embeddings_file, ledger, config_hash, conn_id)
     
     # Get blob storage connection
     try:
@@ -177,10 +376,6 @@ async def create_ai_search_tool_maybe(
     
     connection_string = f"ResourceId={storage_account_resource_id};"
     
-    # Sanitize index name for resource naming
-    sanitized_name = search_index_name.lower().replace("_", "-")
-    datasource_name = f"{sanitized_name}-datasource"
-    skillset_name = f"{sanitized_name}-skillset"
     # Define steps in execution order
     steps_order = [
         "blob_container",
@@ -210,8 +405,20 @@ async def create_ai_search_tool_maybe(
             account_url=storage_account_endpoint,
             credential=creds
         )
-        files_dir = os.path.join(os.path.dirname(__file__), 'files')
-        return await blob_mgr.upload_to_blob_store_maybe(container_name, files_dir)
+        max_concurrency = int(os.getenv('AZURE_BLOB_UPLOAD_CONCURRENCY', '16'))
+        if os.getenv('AZURE_BLOB_SYNC_MODE', 'manifest').lower() == 'skip_if_not_empty':
+            return await blob_mgr.upload_to_blob_store_maybe(
+                container_name,
+                files_dir,
+                max_concurrency=max_concurrency
+            )
+        return await blob_mgr.sync_to_blob_store(
+            container_name,
+            files_dir,
+            manifest_path=os.path.join(get_cache_dir(), f"blob_manifest_{container_name}.json"),
+            max_concurrency=max_concurrency,
+            verify_remote=os.getenv('AZURE_BLOB_SYNC_VERIFY_REMOTE', 'false').lower() == 'true'
+        )
     
     await execute_step("blob_upload", blob_upload_step, resources, steps_order)
     
@@ -237,36 +444,28 @@ async def create_ai_search_tool_maybe(
     async def skillset_step():
         return await search_mgr.create_skillset_maybe(
             skillset_name=skillset_name,
-            target_index_name=search_index_name
-        )
-    
-    await execute_step("search_skillset", skillset_step, resources, steps_order)
-    
-    # Step 6: Create Markdown indexer
-    async def markdown_indexer_step():
-        return await search_mgr.create_indexer_maybe(
-            indexer_name=f"{sanitized_name}-markdown-indexer",
-            datasource_name=datasource_name,
             target_index_name=search_index_name,
-            skillset_name=skillset_name,
-            file_extensions=".md",
-            parsing_mode="markdown"
+            max_page_length=SKILLSET_MAX_PAGE_LENGTH,
+            page_overlap_length=SKILLSET_PAGE_OVERLAP_LENGTH
         )
     
-    await execute_step("indexer_markdown", markdown_indexer_step, resources, steps_order)
-    
-    # Step 7: Create Documents indexer
-    async def documents_indexer_step():
-        return await search_mgr.create_indexer_maybe(
-            indexer_name=f"{sanitized_name}-documents-indexer",
-            datasource_name=datasource_name,
-            target_index_name=search_index_name,
-            skillset_name=skillset_name,
-            file_extensions=".pdf,.docx,.pptx,.xlsx,.txt",
-            parsing_mode="default"
-        )
+    await execute_step("search_skillset", skillset_step, resources, steps_order)
     
-    await execute_step("indexer_documents", documents_indexer_step, resources, steps_order)
+    # Steps 6 and 7: Create Markdown and Documents indexers
+    for kind, file_extensions, parsing_mode in INDEXERS:
+        async def indexer_step(kind=kind, file_extensions=file_extensions, parsing_mode=parsing_mode):
+            return await search_mgr.create_indexer_maybe(
+                indexer_name=f"{sanitized_name}-{kind}-indexer",
+                datasource_name=datasource_name,
+                target_index_name=search_index_name,
+                skillset_name=skillset_name,
+                file_extensions=file_extensions,
+                parsing_mode=parsing_mode,
+                cache_connection_string=connection_string if use_enrichment_cache else None,
+                run_existing=_has_changes(resources)
+            )
+
+        await execute_step(f"indexer_{kind}", indexer_step, resources, steps_order)
     
     # Check if all steps succeeded
     all_succeeded = all(s != ResourceStatus.FAILED for s in resources.values())
@@ -277,16 +476,11 @@ async def create_ai_search_tool_maybe(
     # Return tool only if all steps succeeded
     if all_succeeded:
         logger.info("✓ All AI Search resources created/configured successfully!")
-        conn_id = os.environ.get('SEARCH_CONNECTION_ID')
         if conn_id:
-            return AzureAISearchTool(
-                azure_ai_search=AzureAISearchToolResource(indexes=[AISearchIndexResource(
-                    project_connection_id=conn_id,
-                    index_name=search_index_name,
-                    query_type="simple"
-                )])
-            )
+            ledger.record(LEDGER_AI_SEARCH_KEY, config_hash)
+            return _build_ai_search_tool(conn_id, search_index_name)
     else:
+        ledger.invalidate(LEDGER_AI_SEARCH_KEY)
         logger.error("✗ Some AI Search resources failed to create/configure. Falling back to File Search.")
         return None
 
@@ -303,6 +497,28 @@ def _get_file_path(file_name: str) -> str:
                      file_name))
 
 
+async def _get_vector_stores_in_use(project_client: AIProjectClient, agent_name: str) -> Optional[Set[str]]:
+    """
+    Get the vector stores of the File Search tools of all the versions of the agent, which must not be deleted.
+
+    :return: The ids of the vector stores, or None if the agent versions could not be listed.
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+
+    in_use: Set[str] = set()
+    try:
+        async for version in project_client.agents.list_versions(agent_name):
+            for tool in (version.definition or {}).get("tools") or []:
+                if tool.get("type") == "file_search":
+                    in_use.update(tool.get("vector_store_ids") or [])
+    except ResourceNotFoundError:
+        return in_use
+    except Exception as e:
+        logger.warning(f"Failed to list the versions of agent '{agent_name}': {e}")
+        return None
+    return in_use
+
+
 async def get_available_tool(
         project_client: AIProjectClient,
         openai_client: AsyncOpenAI,
@@ -316,6 +532,8 @@ async def get_available_tool(
     :return: AzureAISearchAgentTool if AI Search enabled and succeeds, 
              FileSearchTool if File Search is used, or None if both fail.
     """
+    from azure.ai.projects.models import FileSearchTool
+
     use_ai_search = os.environ.get('USE_AZURE_AI_SEARCH_SERVICE', 'false').lower() == 'true'
     conn_id = os.environ.get('SEARCH_CONNECTION_ID')
     search_index_name = os.environ.get('AZURE_AI_SEARCH_INDEX_NAME')
@@ -346,17 +564,24 @@ async def get_available_tool(
     # If AI Search is not required, use File Search
     logger.info("AI Search is not enabled. Using File Search tool.")
     
-    # Upload files for file search
-    file_streams = [open(_get_file_path(file_name), "rb") for file_name in FILES_NAMES]
+    from api.vector_store_manager import VectorStoreManager
+
+    # Reuse the vector store of an unchanged corpus, otherwise upload only the changed files
+    agent_name = os.environ.get('AZURE_AI_AGENT_NAME', 'agent')
+    vector_store_mgr = VectorStoreManager(
+        openai_client,
+        corpus_name=f"{agent_name}-files"
+    )
 
     try:
-        vector_store = await openai_client.vector_stores.create()
-        await openai_client.vector_stores.file_batches.upload_and_poll(
-            vector_store_id=vector_store.id, files=file_streams
+        vector_store_id = await vector_store_mgr.get_or_update_vector_store(
+            {file_name: _get_file_path(file_name) for file_name in FILES_NAMES},
+            max_concurrency=int(os.getenv('AZURE_VECTOR_STORE_UPLOAD_CONCURRENCY', '8')),
+            in_use=await _get_vector_stores_in_use(project_client, agent_name)
         )
-        logger.info(f"Files uploaded to vector store (id: {vector_store.id})")
+        logger.info(f"Files available in vector store (id: {vector_store_id})")
         logger.info("File Search tool ready")
-        return FileSearchTool(vector_store_ids=[vector_store.id])
+        return FileSearchTool(vector_store_ids=[vector_store_id])
     except FileNotFoundError:
         logger.warning(f"Asset file not found.")
         logger.error("Failed to initialize File Search tool due to missing files.")
@@ -369,6 +594,8 @@ async def get_available_tool(
 async def create_agent(ai_project: AIProjectClient,
                        openai_client: AsyncOpenAI,
                        creds: AsyncTokenCredential) -> AgentVersionDetails:
+    from azure.ai.projects.models import AzureAISearchTool, PromptAgentDefinition
+
     logger.info("Creating new agent with resources")
     tool = await get_available_tool(ai_project, openai_client, creds)
 
@@ -388,6 +615,15 @@ async def create_agent(ai_project: AIProjectClient,
     else:
         logger.warning("No search tool available. Creating agent without search tool.")
 
+    # The function tool is run by the app over the local embeddings, so it needs ENABLE_LOCAL_RETRIEVER.
+    if os.getenv('AZURE_AI_AGENT_LOCAL_SEARCH_TOOL', 'false').lower() == 'true':
+        from api.local_search import LOCAL_SEARCH_TOOL_NAME, get_local_search_tool
+
+        tools.append(get_local_search_tool())
+        local_instructions = f"Use the {LOCAL_SEARCH_TOOL_NAME} function to search the product information and cite the titles of the chunks."
+        instructions = f"{instructions} {local_instructions}" if tool else f"{local_instructions} Avoid to use base knowledge."
+        logger.info(f"Added the {LOCAL_SEARCH_TOOL_NAME} function tool.")
+
     agent = await ai_project.agents.create_version(
         agent_name=os.environ["AZURE_AI_AGENT_NAME"],
         definition=PromptAgentDefinition(
@@ -400,7 +636,38 @@ async def create_agent(ai_project: AIProjectClient,
 
 
 async def initialize_eval(project_client: AIProjectClient, openai_client: AsyncOpenAI, agent_version_details: AgentVersionDetails, credential: AsyncTokenCredential):
+    from api.provisioning_ledger import LedgerState, ProvisioningLedger
+
     eval_rule_id = f"eval-rule-for-{agent_version_details.name}"
+    ledger = _get_provisioning_ledger()
+    ledger_key = f"{LEDGER_EVAL_RULE_KEY}:{agent_version_details.name}"
+    config_hash = ProvisioningLedger.hash_config({
+        "eval_rule_id": eval_rule_id,
+        "agent_name": agent_version_details.name,
+        "deployment_name": os.environ["AZURE_AI_AGENT_DEPLOYMENT_NAME"],
+        "evaluator_name": "builtin.violence",
+        "max_hourly_runs": 5,
+    })
+    ledger_state = ledger.check(ledger_key, config_hash)
+    if ledger_state == LedgerState.NEEDS_VERIFICATION:
+        try:
+            await project_client.evaluation_rules.get(eval_rule_id)
+            ledger.record(ledger_key, config_hash)
+            ledger_state = LedgerState.CURRENT
+        except Exception as e:
+            logger.info(f"Verification of Continuous Evaluation Rule {eval_rule_id} failed: {e}")
+    if ledger_state == LedgerState.CURRENT:
+        logger.info(f"Continuous Evaluation Rule for agent {agent_version_details.name} matches the provisioning ledger")
+        return
+
+    from azure.ai.projects.models import (
+        ContinuousEvaluationRuleAction,
+        EvaluationRule,
+        EvaluationRuleActionType,
+        EvaluationRuleEventType,
+        EvaluationRuleFilter,
+    )
+
     try:
         eval_rules = project_client.evaluation_rules.list(
             action_type=EvaluationRuleActionType.CONTINUOUS_EVALUATION,
@@ -409,6 +676,7 @@ async def initialize_eval(project_client: AIProjectClient, openai_client: AsyncO
 
         if len(rules_list) >= 1:
             logger.info(f"Continuous Evaluation Rule for agent {agent_version_details.name} already exists")
+            ledger.record(ledger_key, config_hash)
         else:
             # Create an evaluation with testing criteria
             data_source_config = {"type": "azure_ai_source", "scenario": "responses"}
@@ -443,10 +711,44 @@ async def initialize_eval(project_client: AIProjectClient, openai_client: AsyncO
             logger.info(
                 f"Continuous Evaluation Rule created (id: {continuous_eval_rule.id}, name: {continuous_eval_rule.display_name})"
             )
+            ledger.record(ledger_key, config_hash)
     except Exception as e:
         logger.error(f"Error creating Continuous Evaluation Rule: {e}", exc_info=True)
 
-async def initialize_resources():
+async def wait_for_search_index_maybe(creds: AsyncTokenCredential) -> bool:
+    """
+    Gate the startup on the population of the search index.
+
+    Waits until the index holds AZURE_AI_SEARCH_MIN_DOCUMENTS chunks, at most
+    AZURE_AI_SEARCH_READY_TIMEOUT_SECONDS. Does nothing if AI Search is not used or no minimum is set.
+
+    :return: False if the index is not populated yet.
+    """
+    min_documents = int(os.getenv('AZURE_AI_SEARCH_MIN_DOCUMENTS', '0'))
+    endpoint = os.environ.get('AZURE_AI_SEARCH_ENDPOINT')
+    search_index_name = os.getenv('AZURE_AI_SEARCH_INDEX_NAME', 'index-sample')
+    use_ai_search = os.environ.get('USE_AZURE_AI_SEARCH_SERVICE', 'false').lower() == 'true'
+    if not use_ai_search or not endpoint or min_documents <= 0:
+        return True
+
+    from api.indexer_monitor import IndexerMonitor
+    from api.search_index_manager import get_indexer_names
+
+    monitor = IndexerMonitor(endpoint, creds, search_index_name, get_indexer_names(search_index_name))
+    logger.info(f"Waiting for at least {min_documents} chunks in search index '{search_index_name}'")
+    if await monitor.wait_for_documents(
+            min_documents, timeout=float(os.getenv('AZURE_AI_SEARCH_READY_TIMEOUT_SECONDS', '600'))):
+        logger.info(f"Search index '{search_index_name}' is populated.")
+        return True
+    logger.warning(f"Search index '{search_index_name}' has fewer than {min_documents} chunks. Starting anyway.")
+    return False
+
+
+async def initialize_resources() -> bool:
+    """Provision the agent and its resources; return False if the search index is not populated yet."""
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.identity.aio import DefaultAzureCredential
+
     proj_endpoint = os.environ.get("AZURE_EXISTING_AIPROJECT_ENDPOINT")
     try:
         async with (
@@ -490,6 +792,8 @@ async def initialize_resources():
             os.environ["AZURE_EXISTING_AGENT_ID"] = agent_version_details.id
 
             await initialize_eval(project_client, openai_client, agent_version_details, credential)
+
+            return await wait_for_search_index_maybe(credential)
     except Exception as e:
         logger.info("Error creating agent: {e}", exc_info=True)
         raise RuntimeError(f"Failed to create the agent: {e}")  
@@ -497,7 +801,35 @@ async def initialize_resources():
 
 def on_starting(server):
     """This code runs once before the workers will start."""
-    asyncio.get_event_loop().run_until_complete(initialize_resources())
+    complete = asyncio.get_event_loop().run_until_complete(initialize_resources())
+    # Inherited by the workers, whose readiness probe reports it.
+    os.environ["APP_PROVISIONING_STATE"] = "done" if complete else "incomplete"
+
+
+def when_ready(server):
+    """Warm up and freeze the preloaded app once before the workers are forked, so they share its memory."""
+    if freeze_enabled():
+        prepare_for_fork()
+
+
+def pre_fork(server, worker):
+    """Freeze the objects created by the master since, e.g. before replacing a worker reaching max_requests."""
+    if freeze_enabled():
+        gc.freeze()
+
+
+def worker_exit(server, worker):
+    """Log the memory of the worker, private to it or still shared with the others, when it exits."""
+    usage = read_memory_usage()
+    if usage:
+        logger.info(f"Worker {worker.pid} exiting: {format_memory_usage(usage)}")
+
+
+def child_exit(server, worker):
+    """Remove the live gauges of the exited worker from the shared metrics."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
 
 
 max_requests = 1000
@@ -514,7 +846,12 @@ if not os.getenv("RUNNING_IN_PRODUCTION"):
 # https://docs.gunicorn.org/en/stable/settings.html
 preload_app = True
 num_cpus = multiprocessing.cpu_count()
-workers = (num_cpus * 2) + 1
+# The workers and their concurrency limit recommended by benchmarks/capacity_planner.py, if it wrote a tuning file.
+tuning = read_tuning()
+workers = get_workers(tuning, num_cpus)
+if tuning.get("max_concurrent_requests"):
+    # Read by api.concurrency when the app is created; a value set in the environment wins.
+    os.environ.setdefault("APP_MAX_CONCURRENT_REQUESTS", str(tuning["max_concurrent_requests"]))
 worker_class = "uvicorn.workers.UvicornWorker"
 
 timeout = 120
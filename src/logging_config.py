@@ -1,13 +1,170 @@
 # Copyright (c) Microsoft. All rights reserved.
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
-from typing import Optional
+import threading
+from typing import Dict, List, Optional
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# The queue handler and the listener of every configured logger, by logger name.
+_configured: Dict[str, "_QueuedLogging"] = {}
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format the records as JSON lines, with the trace context set by the OpenTelemetry logging instrumentation."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        for attribute, key in (("otelTraceID", "trace_id"), ("otelSpanID", "span_id")):
+            value = getattr(record, attribute, None)
+            if value and value != "0":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a share of the records below WARNING of the sampled loggers; warnings and errors are always kept.
+
+    :param rates: The share of the records to keep by logger name; a logger without a rate takes the rate
+                  of its closest configured parent, or keeps all the records.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self._rates = rates
+
+    def get_rate(self, logger_name: str) -> float:
+        name = logger_name
+        while True:
+            if name in self._rates:
+                return self._rates[name]
+            if "." not in name:
+                return 1.0
+            name = name.rsplit(".", 1)[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.get_rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+def parse_sampling_rates(value: str) -> Dict[str, float]:
+    """
+    Parse the sampling rates of the loggers.
+
+    :param value: The comma-separated logger=rate pairs, e.g. "azureaiapp.stream=0.01".
+    :return: The rates by logger name.
+    :raises ValueError: If a pair is malformed or a rate is not between 0 and 1.
+    """
+    rates = {}
+    for pair in filter(None, (item.strip() for item in value.split(","))):
+        name, separator, rate = pair.partition("=")
+        if not separator or not name.strip():
+            raise ValueError(f"Invalid logger sampling '{pair}', expected logger=rate.")
+        rates[name.strip()] = float(rate)
+        if not 0.0 <= rates[name.strip()] <= 1.0:
+            raise ValueError(f"The sampling rate of '{name.strip()}' must be between 0 and 1.")
+    return rates
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue the records with the message rendered, like QueueHandler, but keep the traceback in exc_text
+    instead of merging it into the message, so the formatter of the listener writes it separately.
+    """
+
+    _traceback_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._traceback_formatter.formatException(record.exc_info)
+        # The traceback objects are not kept alive by the queue.
+        record.exc_info = None
+        return record
+
+
+def _create_file_handler(log_file_name: str) -> logging.Handler:
+    """Create the handler of the log file, rotated by time (APP_LOG_ROTATE_WHEN) or by size (APP_LOG_MAX_BYTES)."""
+    backup_count = int(os.getenv("APP_LOG_BACKUP_COUNT", "5"))
+    when = os.getenv("APP_LOG_ROTATE_WHEN", "")
+    max_bytes = int(os.getenv("APP_LOG_MAX_BYTES", "0"))
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(log_file_name, when=when, backupCount=backup_count, encoding="utf-8")
+    if max_bytes > 0:
+        return logging.handlers.RotatingFileHandler(log_file_name, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    return logging.FileHandler(log_file_name, encoding="utf-8")
+
+
+class _QueuedLogging:
+    """The queue handler of a logger and the background listener, which writes its records to the handlers."""
+
+    def __init__(self, handlers: List[logging.Handler], filters: List[logging.Filter], settings: tuple) -> None:
+        self.handlers = handlers
+        self.settings = settings
+        self.queue_handler = _QueueHandler(queue.SimpleQueue())
+        for log_filter in filters:
+            self.queue_handler.addFilter(log_filter)
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.start()
+
+    def start(self) -> None:
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        for handler in self.handlers:
+            handler.close()
+
+    def restart_in_child(self) -> None:
+        # The listener thread is not copied by fork and the queue may have been locked by it,
+        # so the child gets a new queue and its own listener.
+        self.queue_handler.queue = queue.SimpleQueue()
+        self.listener = None
+        self.start()
+
 
 def configure_logging(log_file_name: Optional[str] = None, logger_name: str = "azureaiapp") -> logging.Logger:
     """
-    Configure and return a logger with both stream (stdout) and optional file handlers.
+    Configure and return a logger writing to stdout and to the optional log file through a background thread.
+
+    The records are put on a queue by a QueueHandler and written by a QueueListener thread, so logging does
+    not block the event loop on the writes. The function is idempotent: calling it again with the same
+    settings returns the configured logger without adding handlers. The listener is restarted in the
+    processes forked after the configuration, like the gunicorn workers of a preloaded app.
+
+    The output is set by the environment variables APP_LOG_LEVEL (default INFO), APP_LOG_FORMAT (text or json),
+    APP_LOG_ROTATE_WHEN (the time rotation of the log file, e.g. midnight), APP_LOG_MAX_BYTES (the size rotation,
+    if there is no time rotation), APP_LOG_BACKUP_COUNT (default 5) and APP_LOG_SAMPLING (the share of the
+    records below WARNING kept per logger, e.g. "azureaiapp.stream=0.01").
 
     :param log_file_name: The path to the log file. If provided, logs will also be written to this file.
     :type log_file_name: Optional[str]
@@ -16,22 +173,52 @@ def configure_logging(log_file_name: Optional[str] = None, logger_name: str = "a
     :return: The configured logger instance.
     :rtype: logging.Logger
     """
+    level = os.getenv("APP_LOG_LEVEL", "INFO").upper()
+    log_format = os.getenv("APP_LOG_FORMAT", "text").lower()
+    sampling = os.getenv("APP_LOG_SAMPLING", "")
+    settings = (log_file_name or "", level, log_format, sampling, os.getenv("APP_LOG_ROTATE_WHEN", ""),
+                os.getenv("APP_LOG_MAX_BYTES", "0"), os.getenv("APP_LOG_BACKUP_COUNT", "5"))
+
     logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.INFO)
-
-    # Stream handler (stdout)
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setLevel(logging.INFO)
-    stream_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
-    stream_handler.setFormatter(stream_formatter)
-    logger.addHandler(stream_handler)
-
-    # File handler if a log file is specified
-    if log_file_name:
-        file_handler = logging.FileHandler(log_file_name)
-        file_handler.setLevel(logging.INFO)
-        file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
-
-    return logger
\ No newline at end of file
+    with _lock:
+        configured = _configured.get(logger_name)
+        if configured is not None and configured.settings == settings:
+            return logger
+        if configured is not None:
+            logger.removeHandler(configured.queue_handler)
+            configured.stop()
+
+        formatter = JsonFormatter() if log_format == "json" else logging.Formatter(LOG_FORMAT)
+        handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+        if log_file_name:
+            handlers.append(_create_file_handler(log_file_name))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        filters = [SamplingFilter(parse_sampling_rates(sampling))] if sampling else []
+
+        configured = _QueuedLogging(handlers, filters, settings)
+        _configured[logger_name] = configured
+        logger.setLevel(level)
+        logger.addHandler(configured.queue_handler)
+    return logger
+
+
+def stop_logging() -> None:
+    """Write the queued records and stop the listeners of all the configured loggers."""
+    with _lock:
+        for logger_name, configured in _configured.items():
+            logging.getLogger(logger_name).removeHandler(configured.queue_handler)
+            configured.stop()
+        _configured.clear()
+
+
+def _restart_in_child() -> None:
+    global _lock
+    _lock = threading.Lock()
+    for configured in _configured.values():
+        configured.restart_in_child()
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
@@ -1,7 +1,7 @@
 # Copyright (c) Microsoft. All rights reserved.
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
-import os, json, base64
+import os, json, base64, hashlib
 from enum import IntEnum
 from typing import Dict
 from dataclasses import dataclass, field
@@ -52,6 +52,35 @@ def get_env_file_path():
     except Exception as e:
         # On any error, return None to use default
         return None
+
+
+def get_cache_dir() -> str:
+    """
+    Get the directory for the local caches of the application (manifests, ledgers, embeddings).
+
+    The directory is taken from APP_CACHE_DIR, defaults to src/.cache and is created if needed.
+
+    Returns:
+        str: Absolute path to the cache directory.
+    """
+    cache_dir = os.getenv("APP_CACHE_DIR") or os.path.join(os.path.dirname(__file__), '.cache')
+    cache_dir = os.path.abspath(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def hash_file(filepath: str) -> str:
+    """
+    Get the SHA-256 of the file content, read in blocks of 1 MB; called from a worker thread.
+
+    Returns:
+        str: The hex digest of the content.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
     
 
 # Constants
@@ -0,0 +1,117 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import gc
+import importlib
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger("azureaiapp")
+
+# The modules imported lazily by the requests, e.g. the resources of the OpenAI client and the transport of
+# the Azure SDK, which are imported before the fork so that the workers share them instead of each importing them.
+PRELOAD_MODULES = (
+    "aiohttp",
+    "azure.ai.projects.aio",
+    "azure.identity.aio",
+    "azure.core.pipeline.transport",
+    "openai.resources.conversations",
+    "openai.resources.responses",
+    "openai.types.conversations",
+    "openai.types.responses",
+    "opentelemetry.sdk.trace",
+    "opentelemetry.trace.propagation.tracecontext",
+    "jinja2",
+)
+TRACING_PRELOAD_MODULES = (
+    "azure.monitor.opentelemetry",
+    "azure.core.tracing.ext.opentelemetry_span",
+)
+
+# The fields of /proc/<pid>/smaps_rollup, in kB.
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def get_preload_modules() -> List[str]:
+    """Get the modules to import before the fork: PRELOAD_MODULES, those of the tracing if enabled, and APP_PRELOAD_MODULES."""
+    modules = list(PRELOAD_MODULES)
+    if os.getenv("ENABLE_AZURE_MONITOR_TRACING", "").lower() == "true":
+        modules.extend(TRACING_PRELOAD_MODULES)
+    modules.extend(filter(None, (module.strip() for module in os.getenv("APP_PRELOAD_MODULES", "").split(","))))
+    return modules
+
+
+def import_modules(modules: Iterable[str]) -> int:
+    """Import the modules, skipping those which are not installed. Returns the number of imported modules."""
+    imported = 0
+    for module in modules:
+        try:
+            importlib.import_module(module)
+            imported += 1
+        except ImportError as e:
+            logger.debug(f"Not preloading {module}: {e}")
+    return imported
+
+
+def warm_templates() -> None:
+    """Compile the templates of the app, which Jinja2 does on their first rendering."""
+    try:
+        from api.routes import templates
+    except ImportError:
+        return
+    for name in templates.env.list_templates():
+        templates.get_template(name)
+
+
+def prepare_for_fork(modules: Optional[Iterable[str]] = None) -> int:
+    """
+    Import and warm up the modules used by the workers, then freeze the objects of the process, before the fork.
+
+    The frozen objects are moved to the permanent generation of the garbage collector, which does not traverse it,
+    so the collections in the workers do not write to the pages of the objects inherited from the preloading
+    process, which then stay shared between the workers.
+
+    :param modules: The modules to import; by default get_preload_modules().
+    :return: The number of frozen objects.
+    """
+    imported = import_modules(get_preload_modules() if modules is None else modules)
+    warm_templates()
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Preloaded {imported} modules and froze {gc.get_freeze_count()} objects before forking the workers.")
+    return gc.get_freeze_count()
+
+
+def freeze_enabled() -> bool:
+    return os.getenv("APP_PRELOAD_FREEZE", "true").lower() == "true"
+
+
+def read_memory_usage(pid: str = "self") -> Optional[Dict[str, int]]:
+    """
+    Read the memory of a process from /proc/<pid>/smaps_rollup on Linux.
+
+    :param pid: The process id, by default the current process.
+    :return: The resident ("rss"), proportional ("pss"), "shared" and "private" memory in bytes, or None if not available.
+             The proportional memory divides every shared page between the processes sharing it, so the sum of
+             the proportional memory of the workers is the memory they use together.
+    """
+    values = dict.fromkeys(_SMAPS_FIELDS, 0)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in values:
+                    values[field] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "shared": values["Shared_Clean"] + values["Shared_Dirty"],
+        "private": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def format_memory_usage(usage: Dict[str, int]) -> str:
+    return ", ".join(f"{name} {value / 2**20:.1f} MiB" for name, value in usage.items())
@@ -0,0 +1,74 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+logger = logging.getLogger("azureaiapp")
+
+# Written by benchmarks/capacity_planner.py --write-config, and deployed with the app.
+DEFAULT_TUNING_FILE = os.path.join(os.path.dirname(__file__), "gunicorn_tuning.json")
+
+
+def get_tuning_file_path() -> str:
+    """Get the path of the tuning file from APP_GUNICORN_TUNING_FILE, defaulting to src/gunicorn_tuning.json."""
+    return os.getenv("APP_GUNICORN_TUNING_FILE") or DEFAULT_TUNING_FILE
+
+
+def read_tuning(path: Optional[str] = None) -> Dict:
+    """
+    Read the worker count and the per-worker concurrency limit recommended by the capacity planner.
+
+    :param path: The tuning file, by default the one of get_tuning_file_path.
+    :return: The tuning, empty if there is no tuning file or it cannot be read.
+    """
+    path = path or get_tuning_file_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            tuning = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring the tuning file {path}: {e}")
+        return {}
+    logger.info(f"Loaded the tuning from {path}: {tuning.get('workers')} workers, "
+                f"{tuning.get('max_concurrent_requests') or 'unlimited'} concurrent requests per worker")
+    return tuning
+
+
+def write_tuning(tuning: Dict, path: Optional[str] = None) -> str:
+    """
+    Write the tuning file read by gunicorn.conf.py.
+
+    :param tuning: The tuning, with at least workers, max_concurrent_requests and cpu_count.
+    :param path: The tuning file, by default the one of get_tuning_file_path.
+    :return: The path of the tuning file.
+    """
+    path = path or get_tuning_file_path()
+    with open(path, "w") as f:
+        json.dump(tuning, f, indent=2)
+    return path
+
+
+def get_workers(tuning: Dict, num_cpus: int) -> int:
+    """
+    Get the number of workers from the tuning, scaled to the CPUs if they differ from those it was measured on.
+
+    Without a tuning, keep the default of gunicorn for CPU bound apps, (num_cpus * 2) + 1.
+
+    :param tuning: The tuning read by read_tuning.
+    :param num_cpus: The number of CPUs of the machine.
+    :return: The number of workers.
+    """
+    if not tuning.get("workers"):
+        return (num_cpus * 2) + 1
+    workers = int(tuning["workers"])
+    measured_cpus = int(tuning.get("cpu_count") or num_cpus)
+    if measured_cpus != num_cpus:
+        scaled = max(1, round(workers * num_cpus / measured_cpus))
+        logger.warning(f"The tuning was measured on {measured_cpus} CPUs, scaling its {workers} workers "
+                       f"to {scaled} for {num_cpus} CPUs. Rerun the capacity planner on this machine.")
+        workers = scaled
+    return workers
@@ -0,0 +1,98 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+from api import blob_store_manager
+from api.blob_store_manager import (
+    CONTENT_HASH_METADATA_KEY,
+    SOFT_DELETE_METADATA_KEY,
+    BlobStoreManager,
+    ResourceStatus,
+)
+
+
+class FakeBlobClient:
+    def __init__(self, container: "FakeContainer", name: str) -> None:
+        self._container = container
+        self._name = name
+
+    async def upload_blob(self, data, overwrite=False, metadata=None) -> None:
+        self._container.blobs[self._name] = dict(metadata or {})
+
+    async def set_blob_metadata(self, metadata) -> None:
+        self._container.blobs[self._name] = dict(metadata)
+
+
+class FakeContainer:
+    container_name = "documents"
+
+    def __init__(self, blobs) -> None:
+        self.blobs = blobs
+
+    async def list_blobs(self, include=None):
+        for name, metadata in list(self.blobs.items()):
+            yield SimpleNamespace(name=name, metadata=metadata)
+
+    def get_blob_client(self, name: str) -> FakeBlobClient:
+        return FakeBlobClient(self, name)
+
+
+class FakeBlobServiceClient:
+    def __init__(self, container: FakeContainer) -> None:
+        self._container = container
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    def get_container_client(self, name: str) -> FakeContainer:
+        return self._container
+
+
+def sync(tmp_path, monkeypatch, container: FakeContainer, verify_remote: bool = False) -> ResourceStatus:
+    monkeypatch.setattr(blob_store_manager, "BlobServiceClient", lambda **kwargs: FakeBlobServiceClient(container))
+    manager = BlobStoreManager("https://account.blob.core.windows.net", credential=None)
+    return asyncio.run(manager.sync_to_blob_store(
+        "documents", str(tmp_path / "files"), str(tmp_path / "manifest.json"), verify_remote=verify_remote))
+
+
+def write_files(tmp_path, files) -> None:
+    directory = tmp_path / "files"
+    directory.mkdir(exist_ok=True)
+    for name, content in files.items():
+        (directory / name).write_text(content)
+
+
+def test_cold_sync_does_not_delete_foreign_blobs(tmp_path, monkeypatch):
+    write_files(tmp_path, {"a.md": "alpha"})
+    container = FakeContainer({
+        "user_upload.pdf": {},
+        "removed.md": {CONTENT_HASH_METADATA_KEY: "0" * 64},
+    })
+
+    assert sync(tmp_path, monkeypatch, container) == ResourceStatus.CREATED
+
+    assert container.blobs["user_upload.pdf"] == {}
+    assert container.blobs["removed.md"] == {SOFT_DELETE_METADATA_KEY: "true"}
+    assert CONTENT_HASH_METADATA_KEY in container.blobs["a.md"]
+
+
+def test_sync_deletes_only_removed_files_of_the_manifest(tmp_path, monkeypatch):
+    write_files(tmp_path, {"a.md": "alpha", "b.md": "beta"})
+    container = FakeContainer({"user_upload.pdf": {}})
+    assert sync(tmp_path, monkeypatch, container) == ResourceStatus.CREATED
+    assert sync(tmp_path, monkeypatch, container) == ResourceStatus.EXISTING
+
+    os.remove(tmp_path / "files" / "b.md")
+    assert sync(tmp_path, monkeypatch, container, verify_remote=True) == ResourceStatus.CREATED
+
+    assert container.blobs["b.md"] == {SOFT_DELETE_METADATA_KEY: "true"}
+    assert container.blobs["user_upload.pdf"] == {}
+    assert SOFT_DELETE_METADATA_KEY not in container.blobs["a.md"]
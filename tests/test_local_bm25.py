@@ -0,0 +1,51 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import pytest
+
+from api.local_bm25 import BM25Index, reciprocal_rank_fusion
+from api.local_search import MAX_TOP_K, clamp_top_k
+
+TEXTS = [
+    "waterproof hiking boots with a rubber sole",
+    "a lightweight tent for hiking and camping",
+    "the camping stove boils water fast",
+    "rain jacket, waterproof and breathable",
+]
+
+
+def test_search_ranks_the_matching_chunks_by_score():
+    ids, scores = BM25Index(TEXTS).search("waterproof hiking", top_k=10)
+    # The boots contain both terms; only the chunks containing a term are returned.
+    assert ids[0] == 0
+    assert set(ids.tolist()) == {0, 1, 3}
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_search_returns_at_most_top_k_chunks():
+    ids, _ = BM25Index(TEXTS).search("waterproof hiking camping", top_k=2)
+    assert len(ids) == 2
+
+
+@pytest.mark.parametrize("top_k", [0, -1])
+def test_search_without_positive_top_k_returns_nothing(top_k):
+    ids, scores = BM25Index(TEXTS).search("waterproof hiking", top_k=top_k)
+    assert len(ids) == 0 and len(scores) == 0
+
+
+def test_reciprocal_rank_fusion_favours_ids_ranked_by_both():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], top_k=3, k=60)
+    assert [item for item, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_reciprocal_rank_fusion_applies_weights():
+    fused = reciprocal_rank_fusion([[1], [2]], top_k=2, k=60, weights=[1.0, 2.0])
+    assert [item for item, _ in fused] == [2, 1]
+
+
+@pytest.mark.parametrize("top_k, expected", [(0, 1), (-5, 1), ("3", 3), (10 ** 6, MAX_TOP_K)])
+def test_clamp_top_k(top_k, expected):
+    assert clamp_top_k(top_k) == expected
@@ -0,0 +1,22 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import json
+
+from logging_config import configure_logging, stop_logging
+
+
+def test_json_logs_keep_the_traceback_apart_from_the_message(monkeypatch, capsys):
+    monkeypatch.setenv("APP_LOG_FORMAT", "json")
+    logger = configure_logging(logger_name="azureaiapp.test")
+    try:
+        raise ZeroDivisionError("division by zero")
+    except ZeroDivisionError:
+        logger.exception("Failed %s", "twice")
+    stop_logging()
+
+    entry = json.loads(capsys.readouterr().out.strip())
+    assert entry["message"] == "Failed twice"
+    assert "ZeroDivisionError: division by zero" in entry["exception"]
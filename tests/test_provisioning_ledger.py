@@ -0,0 +1,50 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+from api import provisioning_ledger
+from api.provisioning_ledger import LedgerState, ProvisioningLedger
+
+CONFIG = {"index": "index_sample", "dimensions": 100}
+
+
+def test_hash_config_does_not_depend_on_the_key_order():
+    assert ProvisioningLedger.hash_config({"a": 1, "b": 2}) == ProvisioningLedger.hash_config({"b": 2, "a": 1})
+    assert ProvisioningLedger.hash_config({"a": 1}) != ProvisioningLedger.hash_config({"a": 2})
+
+
+def test_recorded_entry_is_current_after_reloading(tmp_path):
+    path = str(tmp_path / "ledger.json")
+    config_hash = ProvisioningLedger.hash_config(CONFIG)
+    ProvisioningLedger(path).record("ai_search", config_hash, outputs={"index_name": "index_sample"})
+
+    ledger = ProvisioningLedger(path)
+    assert ledger.check("ai_search", config_hash) == LedgerState.CURRENT
+    assert ledger.get_outputs("ai_search") == {"index_name": "index_sample"}
+    assert ledger.check("ai_search", ProvisioningLedger.hash_config({**CONFIG, "dimensions": 200})) == LedgerState.MISSING
+    assert ledger.check("agent", config_hash) == LedgerState.MISSING
+    assert ProvisioningLedger(path, force=True).check("ai_search", config_hash) == LedgerState.MISSING
+
+
+def test_entry_needs_verification_after_the_interval(tmp_path, monkeypatch):
+    path = str(tmp_path / "ledger.json")
+    config_hash = ProvisioningLedger.hash_config(CONFIG)
+    monkeypatch.setattr(provisioning_ledger.time, "time", lambda: 1000.0)
+    ProvisioningLedger(path).record("ai_search", config_hash)
+
+    monkeypatch.setattr(provisioning_ledger.time, "time", lambda: 1000.0 + 61)
+    assert ProvisioningLedger(path, verify_interval_seconds=60).check("ai_search", config_hash) == LedgerState.NEEDS_VERIFICATION
+    assert ProvisioningLedger(path, verify_interval_seconds=120).check("ai_search", config_hash) == LedgerState.CURRENT
+
+
+def test_invalidated_or_unreadable_entries_are_missing(tmp_path):
+    path = tmp_path / "ledger.json"
+    config_hash = ProvisioningLedger.hash_config(CONFIG)
+    ledger = ProvisioningLedger(str(path))
+    ledger.record("ai_search", config_hash)
+    ledger.invalidate("ai_search")
+    assert ProvisioningLedger(str(path)).check("ai_search", config_hash) == LedgerState.MISSING
+
+    path.write_text("{not json")
+    assert ProvisioningLedger(str(path)).check("ai_search", config_hash) == LedgerState.MISSING
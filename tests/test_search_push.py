@@ -0,0 +1,69 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+from types import SimpleNamespace
+
+from azure.core.exceptions import ClientAuthenticationError
+
+from api import search_index_manager
+from api.embedding_store import EmbeddedChunk, write_embeddings_csv
+from api.search_index_manager import ResourceStatus, SearchIndexManager
+
+CHUNKS = 50
+BATCH_SIZE = 5
+
+
+class FakeSearchClient:
+    def __init__(self, fail_first: bool = False, failed_keys: int = 0) -> None:
+        self.fail_first = fail_first
+        self.failed_keys = failed_keys
+        self.batches = 0
+
+    def __call__(self, **kwargs) -> "FakeSearchClient":
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    async def merge_or_upload_documents(self, documents):
+        self.batches += 1
+        if self.fail_first:
+            error = ClientAuthenticationError("Unauthorized")
+            error.status_code = 401
+            raise error
+        await asyncio.sleep(0.01)
+        results = []
+        for document in documents:
+            failed = self.failed_keys > 0
+            self.failed_keys -= 1
+            results.append(SimpleNamespace(key=document["chunk_id"], succeeded=not failed,
+                                           status_code=400 if failed else 200, error_message="Invalid document"))
+        return results
+
+
+def push(tmp_path, monkeypatch, client: FakeSearchClient) -> ResourceStatus:
+    embeddings_file = str(tmp_path / "embeddings.csv")
+    write_embeddings_csv((EmbeddedChunk(f"chunk {i}", [0.1, 0.2], f"title {i % 3}") for i in range(CHUNKS)), embeddings_file)
+    monkeypatch.setattr(search_index_manager, "SearchClient", client)
+    manager = SearchIndexManager("https://search.windows.net", None, "index", 2, "model", "deployment", "", None)
+    return asyncio.run(manager.upload_embeddings_file(
+        embeddings_file, max_batch_documents=BATCH_SIZE, max_concurrency=2, max_retries=0))
+
+
+def test_push_stops_on_the_first_request_failing_without_retry(tmp_path, monkeypatch):
+    client = FakeSearchClient(fail_first=True)
+    assert push(tmp_path, monkeypatch, client) == ResourceStatus.FAILED
+    # Only the batches already started with the first one are sent.
+    assert client.batches <= 2
+
+
+def test_push_continues_after_failed_documents(tmp_path, monkeypatch):
+    client = FakeSearchClient(failed_keys=3)
+    assert push(tmp_path, monkeypatch, client) == ResourceStatus.FAILED
+    assert client.batches == CHUNKS // BATCH_SIZE
@@ -0,0 +1,54 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Loading gunicorn.conf.py and creating the app, before the SDKs are imported by the provisioning or the preloading.
+# The default is generous, so only a regression like an SDK imported again fails it; set a tighter budget per machine.
+STARTUP_BUDGET_SECONDS = float(os.getenv("APP_STARTUP_BUDGET_SECONDS", "5"))
+LAZY_MODULES = (
+    "azure.ai.projects",
+    "azure.identity",
+    "azure.monitor.opentelemetry",
+    "azure.search.documents",
+    "azure.storage.blob",
+    "openai",
+    "numpy",
+)
+
+BOOT_SCRIPT = """
+import importlib.util, json, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+from api.main import create_app
+create_app()
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+"""
+
+
+def boot() -> dict:
+    env = dict(os.environ)
+    for name in ("ENABLE_AZURE_MONITOR_TRACING", "ENABLE_LOCAL_RETRIEVER", "ENABLE_METRICS", "ENABLE_ADMIN_ENDPOINTS"):
+        env[name] = "false"
+    result = subprocess.run([sys.executable, "-c", BOOT_SCRIPT], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_startup_does_not_import_rarely_used_modules():
+    modules = set(boot()["modules"])
+    imported = [module for module in LAZY_MODULES if module in modules]
+    assert not imported, f"Imported at startup: {imported}"
+
+
+def test_startup_time_budget():
+    # The best of three runs, so a busy machine does not fail the test.
+    seconds = min(boot()["seconds"] for _ in range(3))
+    assert seconds <= STARTUP_BUDGET_SECONDS, f"Startup took {seconds:.3f} seconds, the budget is {STARTUP_BUDGET_SECONDS} seconds."
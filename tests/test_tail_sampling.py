@@ -0,0 +1,73 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import Status, StatusCode
+
+from api.tracing_config import TailSamplingSpanProcessor
+
+LATENCY_MS = 100.0
+
+
+def create_tracer(ratio: float = 0.0, max_traces: int = 16):
+    exporter = InMemorySpanExporter()
+    processor = TailSamplingSpanProcessor(SimpleSpanProcessor(exporter), LATENCY_MS, ratio, max_traces)
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    return provider.get_tracer("test"), processor, exporter
+
+
+def run_trace(tracer, duration_ms: float = 1.0, fail_child: bool = False) -> None:
+    root = tracer.start_span("root", start_time=0)
+    with trace.use_span(root):
+        child = tracer.start_span("child", start_time=0)
+        if fail_child:
+            child.set_status(Status(StatusCode.ERROR))
+        child.end(end_time=int(duration_ms * 1e6) // 2)
+    root.end(end_time=int(duration_ms * 1e6))
+
+
+def test_fast_successful_traces_are_dropped():
+    tracer, processor, exporter = create_tracer()
+    run_trace(tracer)
+    assert exporter.get_finished_spans() == ()
+    assert processor.dropped_traces == 1
+
+
+def test_slow_or_failed_traces_are_kept_with_all_their_spans():
+    tracer, processor, exporter = create_tracer()
+    run_trace(tracer, duration_ms=LATENCY_MS)
+    run_trace(tracer, fail_child=True)
+    assert [span.name for span in exporter.get_finished_spans()] == ["child", "root", "child", "root"]
+    assert processor.kept_traces == 2
+
+
+def test_ratio_keeps_the_other_traces():
+    tracer, processor, exporter = create_tracer(ratio=1.0)
+    run_trace(tracer)
+    assert len(exporter.get_finished_spans()) == 2
+
+
+def test_spans_ending_after_the_root_follow_its_decision():
+    tracer, _, exporter = create_tracer()
+    root = tracer.start_span("root", start_time=0)
+    with trace.use_span(root):
+        late = tracer.start_span("late", start_time=0)
+    root.set_status(Status(StatusCode.ERROR))
+    root.end(end_time=1)
+    late.end(end_time=2)
+    assert [span.name for span in exporter.get_finished_spans()] == ["root", "late"]
+
+
+def test_unfinished_traces_beyond_the_limit_are_evicted():
+    tracer, processor, _ = create_tracer(max_traces=2)
+    for _ in range(3):
+        root = tracer.start_span("root")
+        with trace.use_span(root):
+            tracer.start_span("child").end()
+    assert processor.evicted_traces == 1
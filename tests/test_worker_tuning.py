@@ -0,0 +1,34 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import pytest
+
+from worker_tuning import get_workers, read_tuning, write_tuning
+
+
+@pytest.mark.parametrize("tuning, num_cpus, expected", [
+    ({}, 4, 9),
+    ({"workers": 0}, 2, 5),
+    ({"workers": 6, "cpu_count": 4}, 4, 6),
+    ({"workers": 6}, 8, 6),
+    ({"workers": 6, "cpu_count": 4}, 8, 12),
+    ({"workers": 6, "cpu_count": 4}, 2, 3),
+    ({"workers": 1, "cpu_count": 8}, 1, 1),
+])
+def test_get_workers(tuning, num_cpus, expected):
+    assert get_workers(tuning, num_cpus) == expected
+
+
+def test_read_tuning_written_by_the_capacity_planner(tmp_path):
+    path = str(tmp_path / "gunicorn_tuning.json")
+    tuning = {"workers": 3, "max_concurrent_requests": 20, "cpu_count": 2}
+    assert write_tuning(tuning, path) == path
+    assert read_tuning(path) == tuning
+
+
+def test_read_tuning_ignores_missing_or_unreadable_files(tmp_path):
+    assert read_tuning(str(tmp_path / "missing.json")) == {}
+    (tmp_path / "broken.json").write_text("{")
+    assert read_tuning(str(tmp_path / "broken.json")) == {}